@@ -36,9 +36,22 @@ from app.routes import (
 from app.routes import sms_webhook
 from app.routes import driver_status, timetable,bus_locations_realtime_update
 from app.routes.otp import start_cleanup_task
+from app.routes.routes import warm_up_route_data
 from app.firebase import firestore_db, realtime_db
 from app.routes import bus_location_ws
 from app.routes import open_data
+from app.routes import metrics
+from app.routes import viewport_ws
+from app.routes import bus_location_sse
+from app.routes import stop_arrivals
+from app.services.location_buffer import location_buffer
+from app.services.gps_archive import gps_archive
+from app.services.speed_profiles import speed_profiles
+from app.services.reverse_geocoder import reverse_geocoder
+from app.services.forward_geocoder import forward_geocoder
+from app.services.nominatim import nominatim
+from app.services.location_ingest import warm_up as warm_up_live_fleet
+from app.utils.blocking_executor import blocking_executor
 
 # ---------------------------------------------------------------------
 # Suppress noisy logs and CancelledError tracebacks
@@ -157,8 +170,12 @@ app.include_router(user_dashboard_analytics.router, prefix="/api", tags=["user-d
 app.include_router(sos.router, prefix="/api", tags=["sos", "incident"])
 app.include_router(driver_status.router, prefix="/api/drivers", tags=["drivers"])
 app.include_router(bus_location_ws.router)
+app.include_router(viewport_ws.router)
+app.include_router(bus_location_sse.router, prefix="/api", tags=["sse"])
+app.include_router(stop_arrivals.router, prefix="/api", tags=["stop-arrivals"])
 app.include_router(open_data.router, prefix="/api")
 app.include_router(sms_webhook.router, prefix="/api", tags=["sms-webhook"])
+app.include_router(metrics.router, prefix="/api", tags=["metrics"])
 
 # ---------------------------------------------------------------------
 # Utility: Dashboard analytics
@@ -210,3 +227,31 @@ def health_check():
 @app.on_event("startup")
 def startup_event():
     start_cleanup_task()
+    warm_up_live_fleet()
+    warm_up_route_data()
+    location_buffer.start()
+    gps_archive.start()
+    speed_profiles.start()
+
+@app.on_event("startup")
+async def start_broadcast_backend():
+    await bus_location_ws.manager.backend.start()
+
+@app.on_event("startup")
+async def start_ws_sweeper():
+    bus_location_ws.manager.start_sweeper()
+
+@app.on_event("shutdown")
+async def stop_broadcast_backend():
+    bus_location_ws.manager.stop_sweeper()
+    await bus_location_ws.manager.backend.close()
+
+@app.on_event("shutdown")
+def shutdown_event():
+    location_buffer.stop()
+    gps_archive.stop()
+    speed_profiles.stop()
+    reverse_geocoder.close()
+    forward_geocoder.close()
+    nominatim.close()
+    blocking_executor.shutdown()
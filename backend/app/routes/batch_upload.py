@@ -4,10 +4,27 @@ from fastapi.responses import JSONResponse
 from app.firebase import firestore_db
 from pydantic import BaseModel
 from typing import List, Dict, Any
+from app.utils.blocking_executor import run_blocking
+from app.services.bus_assignments import invalidate_all_assignments
+from app.routes.routes import SHAPE_FIELDS, reload_routes
 
 router = APIRouter()
 
 
+def _write_items(ref, data: List[Dict[str, Any]]) -> List[str]:
+    ids = []
+    for item in data:
+        item_id = item.get('id')
+        if item_id:
+            doc_ref = ref.document(str(item_id))
+            doc_ref.set(item, merge=True)
+        else:
+            doc_ref = ref.document()
+            doc_ref.set(item)
+        ids.append(doc_ref.id)
+    return ids
+
+
 # Pydantic model for batch upload
 class BatchUploadRequest(BaseModel):
     data: List[Dict[str, Any]]
@@ -37,11 +54,12 @@ async def batch_upload(data_type: str, body: BatchUploadRequest):
     else:
         raise HTTPException(status_code=400, detail="Invalid data type")
 
-    for item in data:
-        item_id = item.get('id')
-        if item_id:
-            ref.document(str(item_id)).set(item, merge=True)
-        else:
-            ref.document().set(item)
+    ids = await run_blocking(_write_items, ref, data)
+    if data_type == "buses":
+        invalidate_all_assignments()
+    elif data_type == "routes":
+        # Merged writes: the caches need the full documents, so read them back
+        reshaped = [any(field in item for field in SHAPE_FIELDS) for item in data]
+        await run_blocking(reload_routes, ids, reshaped)
 
     return JSONResponse({"success": True, "count": len(data)})
@@ -0,0 +1,164 @@
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from typing import Dict, List, Optional, Tuple
+import asyncio
+import json
+import os
+from app.routes.bus_location_ws import manager
+from app.services.live_fleet import live_fleet
+from app.utils.metrics import register_metrics
+
+router = APIRouter()
+
+HEARTBEAT_INTERVAL = float(os.getenv("SSE_HEARTBEAT_INTERVAL", "15"))   # seconds of silence before a ping comment
+MAX_BUSES = int(os.getenv("SSE_MAX_BUSES", "50"))                       # buses per stream
+DEFAULT_MAX_RATE = float(os.getenv("SSE_DEFAULT_MAX_RATE", "1"))        # event batches per second
+RETRY_MS = int(os.getenv("SSE_RETRY_MS", "3000"))                       # client reconnect delay
+
+
+class _Tap:
+    """
+    What the ConnectionManager sees for one (stream, bus) pair.
+    """
+
+    __slots__ = ("stream", "bus_id")
+
+    def __init__(self, stream: "_SseStream", bus_id: str):
+        self.stream = stream
+        self.bus_id = bus_id
+
+    def offer(self, frame: str):
+        self.stream.push(self.bus_id, frame)
+
+
+class _SseStream:
+    """
+    One SSE client. Holds at most the latest frame per followed bus, so a
+    client on a slow link gets fresh positions instead of a growing backlog.
+    """
+
+    __slots__ = ("bus_ids", "pending", "ready", "taps")
+
+    def __init__(self, bus_ids: List[str]):
+        self.bus_ids = bus_ids
+        self.pending: Dict[str, Tuple[int, str]] = {}
+        self.ready = asyncio.Event()
+        self.taps = [_Tap(self, bus_id) for bus_id in bus_ids]
+
+    def push(self, bus_id: str, frame: str):
+        if bus_id in self.pending:
+            hub.coalesced += 1
+        # Local fleet version: every update ingested by this worker so far is at or below it
+        self.pending[bus_id] = (live_fleet.version, frame)
+        self.ready.set()
+
+    def take(self) -> List[Tuple[str, int, str]]:
+        pending, self.pending = self.pending, {}
+        self.ready.clear()
+        return sorted(((bus_id, version, frame) for bus_id, (version, frame) in pending.items()), key=lambda e: e[1])
+
+
+class SseHub:
+    def __init__(self):
+        self.streams = 0
+        self.events_sent = 0
+        self.coalesced = 0
+        self.resumes = 0
+
+    def stats(self) -> dict:
+        return {
+            "streams": self.streams,
+            "events_sent": self.events_sent,
+            "coalesced": self.coalesced,
+            "resumes": self.resumes,
+        }
+
+
+hub = SseHub()
+register_metrics("sse", hub.stats)
+
+
+def _event(bus_id: str, version: int, frame: str) -> str:
+    hub.events_sent += 1
+    # Tagged with the fleet epoch so an id from another worker or before a restart is not trusted
+    return f"id: {live_fleet.tag(version)}\nevent: location\ndata: {{\"bus_id\": {json.dumps(bus_id)}, \"location\": {frame}}}\n\n"
+
+
+async def _stream_events(request: Request, stream: _SseStream, last_event_id: Optional[int], max_rate: float):
+    for tap in stream.taps:
+        await manager.attach(tap.bus_id, tap, tap)
+    hub.streams += 1
+    try:
+        yield f"retry: {RETRY_MS}\n\n"
+        # Catch-up: current positions the client has not seen (all of them on a fresh connect,
+        # or if the id is from another worker or before a restart)
+        if last_event_id is not None:
+            hub.resumes += 1
+        version, changed = live_fleet.changed_since(last_event_id or 0, stream.bus_ids)
+        for bus_id, loc in changed:
+            stream.pending.pop(bus_id, None)
+            yield _event(bus_id, version, json.dumps(loc))
+
+        interval = 1.0 / max_rate
+        while True:
+            try:
+                await asyncio.wait_for(stream.ready.wait(), HEARTBEAT_INTERVAL)
+            except asyncio.TimeoutError:
+                if await request.is_disconnected():
+                    break
+                yield ": ping\n\n"
+                continue
+            for bus_id, version, frame in stream.take():
+                yield _event(bus_id, version, frame)
+            # Throttle: further updates in the meantime just replace the pending frame per bus
+            await asyncio.sleep(interval)
+    finally:
+        hub.streams -= 1
+        for tap in stream.taps:
+            manager.detach(tap.bus_id, tap)
+
+
+def _sse_response(request: Request, bus_ids: List[str], max_rate: float) -> StreamingResponse:
+    stream = _SseStream(bus_ids)
+    last_event_id = live_fleet.parse_tag(request.headers.get("last-event-id"))
+    return StreamingResponse(
+        _stream_events(request, stream, last_event_id, max_rate),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",      # nginx: do not buffer the stream
+            "Content-Encoding": "identity",  # keeps the compression middleware from buffering events
+        },
+    )
+
+
+@router.get("/sse/bus-location/{bus_id}")
+async def bus_location_sse(
+    request: Request,
+    bus_id: str,
+    max_rate: float = Query(DEFAULT_MAX_RATE, ge=0.1, le=10),
+):
+    """
+    Server-Sent Events stream of one bus's location, for clients where WebSockets are unreliable.
+    Events are "location" with data {"bus_id", "location"}; reconnecting with Last-Event-ID
+    only replays buses that moved since that id (every bus if the id came from another
+    worker or before a restart). At most max_rate batches per second.
+    """
+    return _sse_response(request, [bus_id], max_rate)
+
+
+@router.get("/sse/bus-locations")
+async def bus_locations_sse(
+    request: Request,
+    bus_ids: str = Query(..., description="Comma-separated bus IDs"),
+    max_rate: float = Query(DEFAULT_MAX_RATE, ge=0.1, le=10),
+):
+    """
+    Same as /sse/bus-location/{bus_id} for several buses on one connection.
+    """
+    ids = list(dict.fromkeys(b.strip() for b in bus_ids.split(",") if b.strip()))
+    if not ids:
+        raise HTTPException(status_code=400, detail="bus_ids is required")
+    if len(ids) > MAX_BUSES:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BUSES} buses per stream")
+    return _sse_response(request, ids, max_rate)
@@ -1,23 +1,20 @@
 
 from fastapi import Body
-import math
 from fastapi import APIRouter, HTTPException
-from app.firebase import realtime_db, firestore_db
+from app.services.bus_assignments import get_assignment
+from app.services.live_fleet import live_fleet
+from app.services.location_ingest import record_location
+from app.services.route_cache import get_route
+from app.services.route_geometry import route_geometry
+from app.services.speed_profiles import speed_profiles
+from app.services.stop_tracker import stop_tracker
+from app.utils.geo import haversine_distance
 from pydantic import BaseModel
+from typing import List, Optional
 from datetime import datetime
 
 router = APIRouter()
 
-def haversine_distance(lat1, lon1, lat2, lon2):
-    R = 6371  
-    phi1 = math.radians(lat1)
-    phi2 = math.radians(lat2)
-    dphi = math.radians(lat2 - lat1)
-    dlambda = math.radians(lon2 - lon1)
-    a = math.sin(dphi/2)**2 + math.cos(phi1)*math.cos(phi2)*math.sin(dlambda/2)**2
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
-    return R * c
-
 class BusLocationUpdate(BaseModel):
     bus_id: str
     latitude: float
@@ -44,8 +41,8 @@ def update_bus_location(data: BusLocationUpdate):
     }
     if data.speed is not None:
         location_data["speed"] = data.speed
-    realtime_db.child('bus_locations').child(data.bus_id).set(location_data)
-    return {"success": True, "location": location_data}
+    accepted = record_location(data.bus_id, location_data) is not None
+    return {"success": True, "accepted": accepted, "location": location_data}
 
 @router.post("/bus-eta")
 def calculate_eta(
@@ -54,37 +51,184 @@ def calculate_eta(
     speed: float = Body(None),  # Make speed optional
     route_id: str = Body(None),
     stop_lat: float = Body(None),
-    stop_lon: float = Body(None)
+    stop_lon: float = Body(None),
+    stop_index: int = Body(None),
+    bus_id: str = Body(None)
 ):
     """
-    Calculate ETA (in minutes) for a bus to reach a stop using Haversine distance and speed.
+    Calculate ETA (in minutes) for a bus to reach a stop.
+    With a route_id the distance is measured along the route polyline (start, stops, end)
+    from the bus's projected position; otherwise it is the straight-line Haversine distance.
     Args:
         bus_lat (float): Bus latitude.
         bus_lon (float): Bus longitude.
         speed (float, optional): Real-time speed.
-        route_id (str, optional): Route ID for speed limit fallback.
-        stop_lat (float, optional): Stop latitude.
+        route_id (str, optional): Route ID for along-route distance and speed limit fallback.
+        stop_lat (float, optional): Stop latitude (default with a route: the route end).
         stop_lon (float, optional): Stop longitude.
+        stop_index (int, optional): Index of the stop in the route's stops, instead of coordinates.
+        bus_id (str, optional): Lets the route projection start from the bus's last live position
+            (bus_lat/bus_lon are only projected, never stored as that position).
     Returns:
-        dict: ETA in minutes, distance in km, and speed used.
+        dict: ETA in minutes, distance in km, speed used, how the distance was measured
+        and, with a bus_id, the bus's stop progress (current/next stop) on the route.
     """
     route_speed_limit = None
+    distance_km = None
+    along_route = passed = False
+    profile_minutes = None
     if route_id:
-        doc = firestore_db.collection('routes').document(route_id).get()
-        if not doc.exists:
+        route = get_route(route_id)
+        if route is None:
             return {"error": "Route not found"}
-        route = doc.to_dict()
-        stop_lat = route.get('end_latitude')
-        stop_lon = route.get('end_longitude')
         route_speed_limit = route.get('speed_limit')
-    if stop_lat is None or stop_lon is None:
-        return {"error": "Destination coordinates required"}
-    distance_km = haversine_distance(bus_lat, bus_lon, stop_lat, stop_lon)
-    # Prefer realtime speed, else fallback to route speed_limit
-    use_speed = speed if speed is not None and speed > 0 else route_speed_limit
-    if use_speed is None or use_speed <= 0:
-        return {"eta_minutes": None, "error": "Invalid speed (neither realtime nor route speed_limit available)"}
-    eta_hours = distance_km / use_speed
-    eta_minutes = int(eta_hours * 60)
-    return {"eta_minutes": eta_minutes, "distance_km": round(distance_km, 2), "used_speed": use_speed}
+        # Read-only: the caller's position must not replace the hint live ingest keeps
+        located = route_geometry.locate(route_id, route, bus_lat, bus_lon, bus_id, remember=False)
+        if located:
+            polyline, projection = located
+            if stop_index is not None:
+                target_km = polyline.stop_along_km(stop_index)
+                if target_km is None:
+                    return {"error": "Stop not found on route"}
+            elif stop_lat is not None and stop_lon is not None:
+                target_km = polyline.project(stop_lat, stop_lon).along_km
+            else:
+                target_km = polyline.length_km
+            along_route = True
+            passed = target_km < projection.along_km
+            distance_km = max(target_km - projection.along_km, 0.0)
+            fallback = speed if speed is not None and speed > 0 else route_speed_limit
+            profile_minutes = speed_profiles.travel_minutes(route_id, polyline, projection.along_km, target_km, fallback)
+        elif stop_lat is None or stop_lon is None:
+            stop_lat = route.get('end_latitude')
+            stop_lon = route.get('end_longitude')
+    if distance_km is None:
+        if stop_lat is None or stop_lon is None:
+            return {"error": "Destination coordinates required"}
+        distance_km = haversine_distance(bus_lat, bus_lon, stop_lat, stop_lon)
+    if profile_minutes is not None:
+        # Observed time-of-day speeds per segment, realtime speed / speed_limit where there are none
+        eta_minutes = int(profile_minutes)
+        use_speed = round(distance_km / (profile_minutes / 60), 1) if profile_minutes > 0 else speed
+    else:
+        # Prefer realtime speed, else fallback to route speed_limit
+        use_speed = speed if speed is not None and speed > 0 else route_speed_limit
+        if use_speed is None or use_speed <= 0:
+            return {"eta_minutes": None, "error": "Invalid speed (neither realtime nor route speed_limit available)"}
+        eta_hours = distance_km / use_speed
+        eta_minutes = int(eta_hours * 60)
+    return {
+        "eta_minutes": eta_minutes,
+        "distance_km": round(distance_km, 2),
+        "used_speed": use_speed,
+        "along_route": along_route,
+        "passed": passed,
+        "speed_profile": profile_minutes is not None,
+        "progress": stop_tracker.progress(bus_id, route_id) if bus_id else None,
+    }
+
+
+
+class StopPoint(BaseModel):
+    latitude: float
+    longitude: float
+
+
+class BatchEtaRequest(BaseModel):
+    bus_id: Optional[str] = None
+    bus_lat: Optional[float] = None
+    bus_lon: Optional[float] = None
+    speed: Optional[float] = None
+    route_id: Optional[str] = None
+    stop_indices: Optional[List[int]] = None
+    stops: Optional[List[StopPoint]] = None
+
 
+@router.post("/bus-eta/batch")
+def calculate_eta_batch(data: BatchEtaRequest):
+    """
+    ETAs from one bus to many stops in one pass: the bus is projected onto the route once
+    and a single walk over the route segments yields every stop's ETA.
+    Args:
+        data (BatchEtaRequest): The bus as bus_id (live position and assigned route are
+            looked up) and/or bus_lat/bus_lon; route_id (required without a bus_id);
+            stop_indices or stops coordinates, default every stop on the route.
+    Returns:
+        dict: bus_id, route_id, along_route, progress (stop tracker) and etas [{stop_index | latitude/longitude,
+        name, eta_minutes, distance_km, passed}] in request (or route) order.
+    """
+    bus_lat, bus_lon, speed, route_id = data.bus_lat, data.bus_lon, data.speed, data.route_id
+    if data.bus_id:
+        live = live_fleet.get(data.bus_id) or {}
+        if bus_lat is None or bus_lon is None:
+            bus_lat, bus_lon = live.get('latitude'), live.get('longitude')
+        if speed is None:
+            speed = live.get('speed')
+        if route_id is None:
+            assignment = get_assignment(data.bus_id)
+            if assignment and assignment['route_ids']:
+                route_id = assignment['route_ids'][0]
+    if bus_lat is None or bus_lon is None:
+        raise HTTPException(status_code=404 if data.bus_id else 400, detail="Bus position unknown")
+    speed = speed if isinstance(speed, (int, float)) and speed > 0 else None
+
+    route = None
+    if route_id:
+        route = get_route(route_id)
+        if route is None:
+            raise HTTPException(status_code=404, detail="Route not found")
+    fallback = speed or (route or {}).get('speed_limit')
+    # Read-only: a client-supplied position must not replace the hint live ingest keeps
+    located = route_geometry.locate(route_id, route, bus_lat, bus_lon, data.bus_id, remember=False) if route else None
+
+    # Targets: (label, along-route km or None, (lat, lon) or None)
+    targets = []
+    if data.stops:
+        for stop in data.stops:
+            point = (stop.latitude, stop.longitude)
+            along = located[0].project(*point).along_km if located else None
+            targets.append(({"latitude": stop.latitude, "longitude": stop.longitude}, along, point))
+    elif located:
+        polyline = located[0]
+        indices = data.stop_indices if data.stop_indices is not None else sorted(polyline.stop_vertices)
+        for index in indices:
+            targets.append(({"stop_index": index, "name": polyline.stop_names.get(index)}, polyline.stop_along_km(index), None))
+    elif route and data.stop_indices is None:
+        # Route without a usable shape: straight line to each stop that has coordinates
+        for index, stop in enumerate(route.get('stops') or []):
+            if isinstance(stop, dict) and stop.get('latitude') is not None and stop.get('longitude') is not None:
+                targets.append(({"stop_index": index, "name": stop.get('name')}, None,
+                                (float(stop['latitude']), float(stop['longitude']))))
+    else:
+        raise HTTPException(status_code=400, detail="stops are required without a route shape")
+
+    if located:
+        polyline, projection = located
+        on_route = [along for _, along, _ in targets if along is not None]
+        minutes = iter(speed_profiles.travel_minutes_many(route_id, polyline, projection.along_km, on_route, fallback))
+    etas = []
+    for label, along, point in targets:
+        if located and along is not None:
+            eta = next(minutes)
+            distance_km = max(along - projection.along_km, 0.0)
+            passed = along < projection.along_km
+        elif point is not None:
+            distance_km = haversine_distance(bus_lat, bus_lon, *point)
+            eta = distance_km / fallback * 60 if fallback else None
+            passed = False
+        else:
+            etas.append({**label, "error": "Stop not found on route"})
+            continue
+        etas.append({
+            **label,
+            "eta_minutes": int(eta) if eta is not None else None,
+            "distance_km": round(distance_km, 2),
+            "passed": passed,
+        })
+    return {
+        "bus_id": data.bus_id,
+        "route_id": route_id,
+        "along_route": located is not None,
+        "progress": stop_tracker.progress(data.bus_id, route_id) if data.bus_id else None,
+        "etas": etas,
+    }
@@ -1,70 +1,451 @@
 
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
-from typing import Dict, List
+from typing import Callable, Dict, List, Optional
+from collections import deque
+import asyncio
 import json
-from app.firebase import realtime_db
+import os
+import sys
+import time
+from app.services.broadcast_backend import create_backend
+from app.services.bus_assignments import MISSING, get_cached_assignment, load_assignment
+from app.services.location_ingest import record_location
+from app.services.ws_protocol import MAX_TOKEN, SUBPROTOCOL_BINARY, decode_location
+from app.utils.blocking_executor import run_blocking
+from app.utils.metrics import register_metrics
 from datetime import datetime
 
 router = APIRouter()
 
+SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE_SIZE", "8"))          # frames buffered per socket
+SEND_TIMEOUT = float(os.getenv("WS_SEND_TIMEOUT", "10"))             # seconds for one send before eviction
+MAX_QUEUE_OVERFLOWS = int(os.getenv("WS_MAX_QUEUE_OVERFLOWS", "20"))  # overflows with no send in between before eviction
+PING_INTERVAL = float(os.getenv("WS_PING_INTERVAL", "20"))           # seconds without inbound messages before a ping
+IDLE_TIMEOUT = float(os.getenv("WS_IDLE_TIMEOUT", "60"))             # reap sockets that answered a ping, then went silent this long
+SWEEP_INTERVAL = float(os.getenv("WS_SWEEP_INTERVAL", "10"))         # seconds between sweeper passes
+MAX_CONNECTIONS = int(os.getenv("WS_MAX_CONNECTIONS", "10000"))      # per worker, all WebSocket endpoints
+MAX_CONNECTIONS_PER_IP = int(os.getenv("WS_MAX_CONNECTIONS_PER_IP", "0"))   # 0 = no per-IP cap
+TRUSTED_PROXY_HOPS = int(os.getenv("WS_TRUSTED_PROXY_HOPS", "0"))    # reverse proxies in front (Render: 1); 0 ignores X-Forwarded-For
+
+PING_FRAME = json.dumps({"type": "ping"})
+
+
+class _Subscriber:
+    """
+    One connected socket with its own bounded send queue and drain task,
+    so a slow or dead client never blocks broadcasts to the others.
+    """
+
+    def __init__(self, manager: "ConnectionManager", bus_id: str, websocket: WebSocket):
+        self.manager = manager
+        self.bus_id = bus_id
+        self.websocket = websocket
+        self.queue = deque()
+        self.ready = asyncio.Event()
+        self.overflows = 0
+        self.last_seen = time.monotonic()   # last inbound frame
+        self.sent_at = 0.0                  # last outbound frame
+        self.pinged_at = 0.0
+        # Set once the client answers a ping. The driver app and older rider apps never do
+        # (drivers only send after moving), so they are only reaped when a send fails
+        self.responsive = False
+        self.task = asyncio.create_task(self._drain())
+
+    def offer(self, frame: str):
+        # Queue full: older frames are stale positions, keep only the newest
+        if len(self.queue) >= SEND_QUEUE_SIZE:
+            self.manager.frames_dropped += len(self.queue)
+            self.queue.clear()
+            self.overflows += 1
+            if self.overflows >= MAX_QUEUE_OVERFLOWS:
+                self.manager.evict(self, "slow")
+                return
+        self.queue.append(frame)
+        self.ready.set()
+
+    async def _drain(self):
+        try:
+            while True:
+                await self.ready.wait()
+                while self.queue:
+                    frame = self.queue.popleft()
+                    await asyncio.wait_for(self.websocket.send_text(frame), SEND_TIMEOUT)
+                    self.sent_at = time.monotonic()
+                    self.manager.frames_sent += 1
+                    self.overflows = 0
+                self.ready.clear()
+        except asyncio.CancelledError:
+            raise
+        except asyncio.TimeoutError:
+            self.manager.evict(self, "timeout")
+        except Exception:
+            self.manager.evict(self, "dead")
+
+
 class ConnectionManager:
-    def __init__(self):
-        self.active_connections: Dict[str, List[WebSocket]] = {}
+    def __init__(self, backend=None):
+        self.active_connections: Dict[str, Dict[object, _Subscriber]] = {}   # WebSocket or SSE stream -> subscriber
+        # Pub/sub between workers; the in-process backend keeps single-worker behaviour
+        self.backend = backend or create_backend()
+        self.backend.bind(self._deliver)
+        self._fleet_watchers = 0
+        self.broadcasts = 0
+        self.frames_sent = 0
+        self.frames_dropped = 0
+        self.evictions: Dict[str, int] = {}
+        self.listeners: List[Callable[[str, dict], None]] = []
+        self.connections_by_ip: Dict[str, int] = {}
+        self.total_connections = 0
+        self.rejected: Dict[str, int] = {}
+        self.last_sweep: dict = {}
+        self._sweeper: Optional[asyncio.Task] = None
 
-    async def connect(self, bus_id: str, websocket: WebSocket):
-        await websocket.accept()
+    async def connect(self, bus_id: str, websocket: WebSocket, subprotocol: str = None):
+        await websocket.accept(subprotocol=subprotocol)
+        await self.attach(bus_id, websocket, _Subscriber(self, bus_id, websocket))
+
+    async def attach(self, bus_id: str, key, subscriber):
+        """
+        Register a consumer of a bus's frames. Anything with an offer(frame) method
+        works (e.g. SSE streams); key is what detach() is later called with.
+        """
+        if bus_id not in self.active_connections:
+            self.active_connections[bus_id] = {}
+            await self.backend.subscribe(bus_id)
+        self.active_connections[bus_id][key] = subscriber
+
+    def detach(self, bus_id: str, key):
+        self._remove(bus_id, key)
+
+    def admit(self, ip: str) -> bool:
+        """
+        Reserve a connection slot for a client IP; pair every True with release(ip).
+        Returns:
+            bool: False if the global or per-IP cap is reached.
+        """
+        reason = None
+        if self.total_connections >= MAX_CONNECTIONS:
+            reason = "global_cap"
+        elif MAX_CONNECTIONS_PER_IP and self.connections_by_ip.get(ip, 0) >= MAX_CONNECTIONS_PER_IP:
+            reason = "ip_cap"
+        if reason:
+            self.rejected[reason] = self.rejected.get(reason, 0) + 1
+            return False
+        self.total_connections += 1
+        self.connections_by_ip[ip] = self.connections_by_ip.get(ip, 0) + 1
+        return True
+
+    def release(self, ip: str):
+        self.total_connections -= 1
+        remaining = self.connections_by_ip.get(ip, 0) - 1
+        if remaining > 0:
+            self.connections_by_ip[ip] = remaining
+        else:
+            self.connections_by_ip.pop(ip, None)
+
+    def touch(self, bus_id: str, websocket: WebSocket, pong: bool = False):
+        """
+        Record an inbound message (location, pong, anything) as proof of life. Only a
+        pong opts the socket into idle reaping.
+        """
+        subscriber = self.active_connections.get(bus_id, {}).get(websocket)
+        if subscriber:
+            subscriber.last_seen = time.monotonic()
+            if pong:
+                subscriber.responsive = True
+
+    def sweep(self) -> dict:
+        """
+        One sweeper pass: reap sockets that answer pings but went silent, ping idle
+        ones (unless they were just sent a frame), and measure the registry.
+        Returns:
+            dict: Per-bus connection counts and approximate registry memory.
+        """
+        now = time.monotonic()
+        reaped = pinged = skipped = 0
+        per_bus: Dict[str, int] = {}
+        nbytes = sys.getsizeof(self.active_connections)
+        for bus_id, subscribers in list(self.active_connections.items()):
+            for subscriber in list(subscribers.values()):
+                if not isinstance(subscriber, _Subscriber):
+                    continue  # SSE taps have no inbound side
+                idle = now - subscriber.last_seen
+                if subscriber.responsive and idle > IDLE_TIMEOUT:
+                    self.evict(subscriber, "idle")
+                    reaped += 1
+                elif idle >= PING_INTERVAL and now - subscriber.pinged_at >= PING_INTERVAL:
+                    # Broadcasts already keep a busy socket open; only sockets that answer
+                    # pings still need one as proof of life
+                    if not subscriber.responsive and now - subscriber.sent_at < PING_INTERVAL:
+                        skipped += 1
+                        continue
+                    subscriber.pinged_at = now
+                    subscriber.offer(PING_FRAME)
+                    pinged += 1
+            subscribers = self.active_connections.get(bus_id)
+            if not subscribers:
+                continue
+            per_bus[bus_id] = len(subscribers)
+            nbytes += sys.getsizeof(bus_id) + sys.getsizeof(subscribers)
+            for subscriber in subscribers.values():
+                nbytes += sys.getsizeof(subscriber)
+                queue = getattr(subscriber, "queue", None)
+                if queue is not None:
+                    nbytes += sys.getsizeof(queue) + sum(sys.getsizeof(frame) for frame in queue)
+        self.last_sweep = {
+            "at": datetime.utcnow().isoformat(),
+            "reaped": reaped,
+            "pinged": pinged,
+            "ping_skipped": skipped,
+            "connections_per_bus": per_bus,
+            "registry_bytes": nbytes,
+        }
+        return self.last_sweep
+
+    async def _sweep_loop(self):
+        while True:
+            await asyncio.sleep(SWEEP_INTERVAL)
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"[WS] Sweep failed: {e}")
+
+    def start_sweeper(self):
+        if self._sweeper is None or self._sweeper.done():
+            self._sweeper = asyncio.create_task(self._sweep_loop())
+
+    def stop_sweeper(self):
+        if self._sweeper:
+            self._sweeper.cancel()
+            self._sweeper = None
+
+    def _remove(self, bus_id: str, key):
+        subscribers = self.active_connections.get(bus_id)
+        if not subscribers:
+            return None
+        subscriber = subscribers.pop(key, None)
+        if not subscribers:
+            del self.active_connections[bus_id]
+            asyncio.create_task(self._release(bus_id))
+        return subscriber
+
+    async def _release(self, bus_id: str):
+        # Last local socket for this bus left; stop receiving its channel unless someone rejoined
         if bus_id not in self.active_connections:
-            self.active_connections[bus_id] = []
-        self.active_connections[bus_id].append(websocket)
+            await self.backend.unsubscribe(bus_id)
 
     def disconnect(self, bus_id: str, websocket: WebSocket):
-        if bus_id in self.active_connections:
-            self.active_connections[bus_id].remove(websocket)
-            if not self.active_connections[bus_id]:
-                del self.active_connections[bus_id]
+        subscriber = self._remove(bus_id, websocket)
+        if subscriber:
+            subscriber.task.cancel()
+
+    def evict(self, subscriber: _Subscriber, reason: str):
+        """
+        Drop a slow or dead consumer and close its socket in the background.
+        """
+        if self._remove(subscriber.bus_id, subscriber.websocket) is None:
+            return
+        self.evictions[reason] = self.evictions.get(reason, 0) + 1
+        print(f"[WS] Evicted {reason} consumer: bus_id={subscriber.bus_id}")
+        if subscriber.task is not asyncio.current_task():
+            subscriber.task.cancel()
+        asyncio.create_task(self._close(subscriber.websocket))
+
+    @staticmethod
+    async def _close(websocket: WebSocket):
+        try:
+            await websocket.close(code=1008)
+        except Exception:
+            pass
+
+    def add_listener(self, listener: Callable[[str, dict], None]):
+        """
+        Register an in-process consumer (e.g. the viewport hub) called with every broadcast.
+        """
+        self.listeners.append(listener)
+
+    def watch_fleet(self, enabled: bool):
+        """
+        Reference-counted request for every bus's updates on this worker
+        (listeners otherwise only see buses that have local sockets).
+        """
+        self._fleet_watchers += 1 if enabled else -1
+        if enabled and self._fleet_watchers == 1:
+            asyncio.create_task(self.backend.subscribe_all())
+        elif not enabled and self._fleet_watchers == 0:
+            asyncio.create_task(self.backend.unsubscribe_all())
 
     async def broadcast(self, bus_id: str, data: dict):
-        if bus_id in self.active_connections:
-            for connection in self.active_connections[bus_id]:
-                await connection.send_json(data)
+        self.broadcasts += 1
+        frame = json.dumps(data)  # encoded once for every subscriber on every worker
+        await self.backend.publish(bus_id, frame, data)
+
+    def _deliver(self, bus_id: str, frame: str, data: Optional[dict] = None):
+        if self.listeners:
+            if data is None:
+                data = json.loads(frame)
+            for listener in self.listeners:
+                try:
+                    listener(bus_id, data)
+                except Exception as e:
+                    print(f"[WS] Listener error for {bus_id}: {e}")
+        subscribers = self.active_connections.get(bus_id)
+        if not subscribers:
+            return
+        for subscriber in list(subscribers.values()):
+            subscriber.offer(frame)
+
+    def send_personal(self, bus_id: str, websocket: WebSocket, data: dict):
+        """
+        Queue a frame for one socket only, in order with its broadcasts.
+        """
+        subscriber = self.active_connections.get(bus_id, {}).get(websocket)
+        if subscriber:
+            subscriber.offer(json.dumps(data))
+
+    def stats(self) -> dict:
+        return {
+            "buses": len(self.active_connections),
+            "connections": sum(len(s) for s in self.active_connections.values()),
+            "broadcasts": self.broadcasts,
+            "frames_sent": self.frames_sent,
+            "frames_dropped": self.frames_dropped,
+            "evictions": dict(self.evictions),
+            "admitted": self.total_connections,
+            "client_ips": len(self.connections_by_ip),
+            "rejected": dict(self.rejected),
+            "last_sweep": self.last_sweep,
+            "pubsub": self.backend.stats(),
+        }
 
 manager = ConnectionManager()
+register_metrics("websockets", manager.stats)
+
+
+def client_ip(websocket: WebSocket) -> str:
+    """
+    Address the per-IP cap is keyed on: the peer, or behind TRUSTED_PROXY_HOPS proxies
+    the X-Forwarded-For entry the outermost trusted proxy added.
+    """
+    if TRUSTED_PROXY_HOPS:
+        forwarded = [h.strip() for h in websocket.headers.get("x-forwarded-for", "").split(",") if h.strip()]
+        if len(forwarded) >= TRUSTED_PROXY_HOPS:
+            return forwarded[-TRUSTED_PROXY_HOPS]
+    return websocket.client.host if websocket.client else "unknown"
+
+
+async def reject(websocket: WebSocket):
+    """
+    Turn away a connection over the caps with 1013 (try again later).
+    """
+    try:
+        await websocket.accept()
+        await websocket.close(code=1013)
+    except Exception:
+        pass
+
+
+async def _handle_location(bus_id: str, lat, lon, speed, driver_id: str, timestamp: str):
+    # Ingest only reads cached assignments (to follow the bus along its route); fill the
+    # cache here the way the REST update does, off the event loop
+    assignment = get_cached_assignment(bus_id)
+    if assignment is MISSING:
+        try:
+            assignment = await run_blocking(load_assignment, bus_id)
+        except Exception as e:
+            print(f"[WS] Could not load assignment for {bus_id}: {e}")
+            assignment = None
+    loc_data = {
+        'latitude': lat,
+        'longitude': lon,
+        'driver_id': driver_id,
+        'speed': speed,
+        'timestamp': timestamp,
+    }
+    # Update Firebase Realtime DB (unless filtered as a duplicate or GPS jump)
+    if record_location(bus_id, loc_data) is None:
+        return
+    # Broadcast to all clients, with the route for route-filtered viewports (not stored)
+    broadcast_data = loc_data
+    if assignment and assignment['route_ids']:
+        broadcast_data = dict(loc_data, route_id=assignment['route_ids'][0])
+    await manager.broadcast(bus_id, broadcast_data)
+
+
+async def _handle_text(bus_id: str, msg: str, websocket: WebSocket, driver_tokens: List[str]):
+    data = json.loads(msg)
+    if data.get('type') == 'pong':
+        manager.touch(bus_id, websocket, pong=True)
+        return
+    if data.get('type') == 'ping':
+        manager.send_personal(bus_id, websocket, {"type": "pong"})
+        return
+    print(f"[WS] Received from {bus_id}: {msg}")
+    if data.get('type') == 'hello':
+        # Binary handshake: register the driver and hand back its frame token
+        driver_id = data.get('driver_id')
+        if not driver_id:
+            return
+        if driver_id not in driver_tokens:
+            if len(driver_tokens) > MAX_TOKEN:
+                return  # the next token would not fit in a frame
+            driver_tokens.append(driver_id)
+        manager.send_personal(bus_id, websocket, {"type": "hello_ack", "token": driver_tokens.index(driver_id)})
+        return
+    # Validate required fields
+    lat = data.get('latitude')
+    lon = data.get('longitude')
+    speed = data.get('speed')
+    driver_id = data.get('driver_id')
+    timestamp = data.get('timestamp') or datetime.utcnow().isoformat()
+    if lat is None or lon is None or speed is None or driver_id is None:
+        print(f"[WS] Invalid data from {bus_id}: {data}")
+        return  # skip invalid
+    await _handle_location(bus_id, lat, lon, speed, driver_id, timestamp)
+
+
+async def _handle_binary(bus_id: str, frame: bytes, driver_tokens: List[str]):
+    token, lat, lon, speed, timestamp_ms = decode_location(frame)
+    if token >= len(driver_tokens):
+        print(f"[WS] Unknown driver token {token} from {bus_id}")
+        return
+    if timestamp_ms:
+        timestamp = datetime.utcfromtimestamp(timestamp_ms / 1000).isoformat()
+    else:
+        timestamp = datetime.utcnow().isoformat()
+    await _handle_location(bus_id, lat, lon, speed, driver_tokens[token], timestamp)
 
 
 @router.websocket("/ws/bus-location/{bus_id}")
 async def bus_location_ws(websocket: WebSocket, bus_id: str):
-    await manager.connect(bus_id, websocket)
-    print(f"[WS] Connected: bus_id={bus_id}")
+    ip = client_ip(websocket)
+    if not manager.admit(ip):
+        await reject(websocket)
+        return
+    binary = SUBPROTOCOL_BINARY in websocket.scope.get("subprotocols", [])
+    driver_tokens: List[str] = []
     try:
+        await manager.connect(bus_id, websocket, subprotocol=SUBPROTOCOL_BINARY if binary else None)
+        print(f"[WS] Connected: bus_id={bus_id} binary={binary}")
         while True:
-            msg = await websocket.receive_text()
-            print(f"[WS] Received from {bus_id}: {msg}")
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(message.get("code", 1000))
+            manager.touch(bus_id, websocket)
             try:
-                data = json.loads(msg)
-                # Validate required fields
-                lat = data.get('latitude')
-                lon = data.get('longitude')
-                speed = data.get('speed')
-                driver_id = data.get('driver_id')
-                timestamp = data.get('timestamp') or datetime.utcnow().isoformat()
-                if lat is None or lon is None or speed is None or driver_id is None:
-                    print(f"[WS] Invalid data from {bus_id}: {data}")
-                    continue  # skip invalid
-                # Update Firebase Realtime DB
-                loc_data = {
-                    'latitude': lat,
-                    'longitude': lon,
-                    'driver_id': driver_id,
-                    'speed': speed,
-                    'timestamp': timestamp,
-                }
-                print(f"[WS] Updating Firebase for {bus_id}: {loc_data}")
-                realtime_db.child('bus_locations').child(bus_id).set(loc_data)
-                # Broadcast to all clients
-                await manager.broadcast(bus_id, loc_data)
+                if message.get("bytes") is not None:
+                    if not binary:
+                        continue  # binary frames only after negotiation
+                    await _handle_binary(bus_id, message["bytes"], driver_tokens)
+                elif message.get("text") is not None:
+                    await _handle_text(bus_id, message["text"], websocket, driver_tokens)
             except Exception as e:
                 print(f"[WS] Error processing message for {bus_id}: {e}")
                 continue
     except WebSocketDisconnect:
         print(f"[WS] Disconnected: bus_id={bus_id}")
-        manager.disconnect(bus_id, websocket)
\ No newline at end of file
+    except Exception as e:
+        print(f"[WS] Connection error for {bus_id}: {e}")
+    finally:
+        manager.disconnect(bus_id, websocket)
+        manager.release(ip)
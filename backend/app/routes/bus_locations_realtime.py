@@ -1,18 +1,99 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query, Request
+from typing import Optional
+from datetime import datetime
+import math
+import time
 
-from app.firebase import realtime_db
+from app.services.live_fleet import live_fleet
+from app.services.location_history import location_history
+from app.services.spatial_index import bus_index
+from app.services.stop_tracker import stop_tracker
+from app.utils.http_cache import VersionedSnapshotResponder
+from app.utils.metrics import register_metrics
 
 router = APIRouter()
 
+def _fleet_item(bus_id: str, loc: dict) -> dict:
+    item = {**loc, 'id': bus_id}
+    # Tracker state only moves with accepted locations, so it is current for this fleet version
+    progress = stop_tracker.progress(bus_id)
+    if progress is not None:
+        item['current_stop'] = progress['current_stop']
+        item['next_stop'] = progress['next_stop']
+        item['route_progress'] = progress['progress']
+    return item
+
+
+_fleet_reads = VersionedSnapshotResponder(live_fleet, _fleet_item)
+register_metrics("fleet_reads", _fleet_reads.stats)
+
 @router.get("/bus-locations-realtime")
-def get_bus_locations_realtime():
-    locations_ref = realtime_db.child('bus_locations')
-    locations_data = locations_ref.get()
-    if not locations_data:
-        return []
-    # locations_data is a dict of bus_id: {...locationData...}
+def get_bus_locations_realtime(request: Request, since: Optional[str] = Query(None)):
+    """
+    Latest location of every bus, served from the in-memory live fleet.
+    The ETag changes with every accepted location update; send it back in
+    If-None-Match to get a 304, or as ?since= to get only the buses that moved
+    ({"version", "full", "items"}).
+    """
+    return _fleet_reads.respond(request, since)
+
+
+@router.get("/bus-locations-realtime/nearby")
+def get_nearby_buses(
+    lat: float = Query(..., ge=-90, le=90),
+    lon: float = Query(..., ge=-180, le=180),
+    radius_km: Optional[float] = Query(None, gt=0, le=50),
+    k: int = Query(10, ge=1, le=100),
+):
+    """
+    Buses near a point, closest first.
+    Args:
+        lat (float): Latitude of the point.
+        lon (float): Longitude of the point.
+        radius_km (float, optional): Only buses within this distance (at most k of them).
+        k (int): Maximum number of buses (k nearest when no radius is given).
+    Returns:
+        list: Bus locations with 'id' and 'distance_km'.
+    """
+    if radius_km is not None:
+        hits = bus_index.within(lat, lon, radius_km)[:k]
+    else:
+        hits = bus_index.nearest(lat, lon, k)
     buses = []
-    for bus_id, loc in locations_data.items():
-        loc['id'] = bus_id
-        buses.append(loc)
+    for distance_km, bus_id in hits:
+        loc = live_fleet.get(bus_id)
+        if loc is not None:
+            buses.append({**loc, 'id': bus_id, 'distance_km': round(distance_km, 3)})
     return buses
+
+
+@router.get("/bus-locations-realtime/{bus_id}/trajectory")
+def get_bus_trajectory(
+    bus_id: str,
+    minutes: float = Query(30, gt=0, le=24 * 60),
+    max_points: Optional[int] = Query(None, ge=2, le=5000),
+):
+    """
+    Recent path of a bus from the in-memory history (accepted points only).
+    Args:
+        bus_id (str): Bus ID.
+        minutes (float): How far back to look.
+        max_points (int, optional): Evenly downsample to at most this many points.
+    Returns:
+        dict: bus_id and points [{timestamp, latitude, longitude, speed}] oldest first.
+    """
+    points = location_history.trajectory(bus_id, time.time() - minutes * 60, max_points)
+    if points is None:
+        raise HTTPException(status_code=404, detail="No location history for this bus")
+    return {
+        "bus_id": bus_id,
+        "points": [
+            {
+                "timestamp": datetime.utcfromtimestamp(ts).isoformat() + 'Z',
+                "latitude": lat,
+                "longitude": lon,
+                "speed": None if math.isnan(speed) else round(speed, 2),
+            }
+            for ts, lat, lon, speed in points
+        ],
+    }
@@ -1,8 +1,10 @@
 from fastapi import APIRouter, HTTPException, Body, Depends
-from app.firebase import realtime_db, firestore_db
 from pydantic import BaseModel
 from typing import Optional
 from app.routes.bus_location_ws import manager
+from app.services.location_ingest import record_location
+from app.services.bus_assignments import MISSING, get_cached_assignment, load_assignment
+from app.utils.blocking_executor import run_blocking
 from datetime import datetime
 
 router = APIRouter()
@@ -14,6 +16,7 @@ class LocationUpdateRequest(BaseModel):
     speed: float  # Now required
     timestamp: Optional[str] = None
     driver_id: str
+    route_id: Optional[str] = None
 
 @router.post("/bus-locations-realtime/update")
 async def update_bus_location(data: LocationUpdateRequest):
@@ -21,12 +24,13 @@ async def update_bus_location(data: LocationUpdateRequest):
     Update the real-time location and speed of a bus. Only the assigned driver can update.
     Speed is now required and must be sent by the driver app (from Android GPS).
     """
-    bus_ref = firestore_db.collection('buses').document(data.bus_id)
-    bus_doc = bus_ref.get()
-    if not bus_doc.exists:
+    # Per-ping driver check is a dict lookup; Firestore is only read on a cache miss
+    assignment = get_cached_assignment(data.bus_id)
+    if assignment is MISSING:
+        assignment = await run_blocking(load_assignment, data.bus_id)
+    if assignment is None:
         raise HTTPException(status_code=404, detail="Bus not found")
-    bus = bus_doc.to_dict()
-    assigned_driver = bus.get('driverId') or bus.get('driver_id')
+    assigned_driver = assignment['driver_id']
     if not assigned_driver or assigned_driver != data.driver_id:
         raise HTTPException(status_code=403, detail="You are not assigned to this bus")
     if data.speed is None:
@@ -39,16 +43,19 @@ async def update_bus_location(data: LocationUpdateRequest):
     }
     if data.timestamp is not None:
         loc_data['timestamp'] = data.timestamp
-    realtime_db.child('bus_locations').child(data.bus_id).set(loc_data)
+    if record_location(data.bus_id, loc_data) is None:
+        # Parked bus or GPS jump: nothing stored or broadcast
+        return {"success": True, "accepted": False, "bus_id": data.bus_id, "location": loc_data}
 
     # Broadcast to all websocket clients for this bus
-    await manager.broadcast(
-        data.bus_id,
-        {
-            "latitude": data.latitude,
-            "longitude": data.longitude,
-            "speed": data.speed,
-            "timestamp": datetime.utcnow().isoformat()
-        }
-    )
-    return {"success": True, "bus_id": data.bus_id, "location": loc_data}
+    broadcast_data = {
+        "latitude": data.latitude,
+        "longitude": data.longitude,
+        "speed": data.speed,
+        "timestamp": datetime.utcnow().isoformat()
+    }
+    route_id = data.route_id or next(iter(assignment['route_ids']), None)
+    if route_id:
+        broadcast_data["route_id"] = route_id
+    await manager.broadcast(data.bus_id, broadcast_data)
+    return {"success": True, "accepted": True, "bus_id": data.bus_id, "location": loc_data}
@@ -3,6 +3,7 @@ from fastapi import APIRouter, HTTPException
 from app.firebase import firestore_db
 from typing import List, Optional
 from app.utils.notifications import push_notification
+from app.services.bus_assignments import invalidate_assignment
 
 router = APIRouter()
 
@@ -50,6 +51,7 @@ def add_bus(bus: dict):
     """
     doc_ref = firestore_db.collection('buses').document()
     doc_ref.set(bus)
+    invalidate_assignment(doc_ref.id)
     # Notify admin
     push_notification(
         title="New Bus Added",
@@ -72,6 +74,7 @@ def delete_bus(bus_id: str):
     if not doc_ref.get().exists:
         raise HTTPException(status_code=404, detail="Bus not found")
     doc_ref.delete()
+    invalidate_assignment(bus_id)
     # Notify admin
     push_notification(
         title="Bus Deleted",
@@ -95,6 +98,7 @@ def update_bus(bus_id: str, bus: dict):
     if not doc_ref.get().exists:
         raise HTTPException(status_code=404, detail="Bus not found")
     doc_ref.update(bus)
+    invalidate_assignment(bus_id)
     # Notify admin if bus status is changed
     if 'status' in bus:
         push_notification(
@@ -127,6 +131,7 @@ def assign_driver(bus_id: str, driver_id: str):
     if not doc_ref.get().exists:
         raise HTTPException(status_code=404, detail="Bus not found")
     doc_ref.update({"driverId": driver_id})
+    invalidate_assignment(bus_id)
     # Notify driver
     push_notification(
         title="Bus Assignment",
@@ -155,6 +160,7 @@ def assign_routes(bus_id: str, route_ids: List[str] = Body(..., embed=True)):
     new_route_ids = set(route_ids)
     updated_route_ids = list(current_route_ids.union(new_route_ids))
     doc_ref.update({"routeIds": updated_route_ids})
+    invalidate_assignment(bus_id)
     # Notify admin
     push_notification(
         title="Bus Routes Assigned",
@@ -0,0 +1,14 @@
+from fastapi import APIRouter
+
+from app.utils.metrics import collect_metrics
+
+router = APIRouter()
+
+@router.get("/metrics")
+def get_metrics():
+    """
+    Report in-process counters (write buffers, caches, executors, sockets).
+    Returns:
+        dict: Metrics grouped by component.
+    """
+    return collect_metrics()
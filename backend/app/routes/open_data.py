@@ -1,23 +1,32 @@
-from fastapi import APIRouter
-from app.firebase import realtime_db
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, Query, Request
+from typing import Optional
+from app.services.live_fleet import live_fleet
+from app.utils.http_cache import VersionedSnapshotResponder
+from app.utils.metrics import register_metrics
 
 router = APIRouter()
 
+
+def _open_location(bus_id: str, loc: dict) -> dict:
+    return {
+        "bus_id": bus_id,
+        "latitude": loc.get("latitude"),
+        "longitude": loc.get("longitude"),
+        "speed": loc.get("speed"),
+        "timestamp": loc.get("timestamp"),
+    }
+
+
+_open_reads = VersionedSnapshotResponder(live_fleet, _open_location)
+register_metrics("open_data_reads", _open_reads.stats)
+
+
 @router.get("/open/bus-locations", tags=["open-data"])
-async def get_open_bus_locations():
+async def get_open_bus_locations(request: Request, since: Optional[str] = Query(None)):
     """
     Public API: Get live locations of all buses (Open Data API).
-    Returns: List of {bus_id, latitude, longitude, speed, timestamp}
+    Returns: List of {bus_id, latitude, longitude, speed, timestamp}.
+    Supports If-None-Match (304 when unchanged) and ?since=<ETag value> for
+    {"version", "full", "items"} with only the buses that changed.
     """
-    bus_locations = realtime_db.child('bus_locations').get().val() or {}
-    result = []
-    for bus_id, loc in bus_locations.items():
-        result.append({
-            "bus_id": bus_id,
-            "latitude": loc.get("latitude"),
-            "longitude": loc.get("longitude"),
-            "speed": loc.get("speed"),
-            "timestamp": loc.get("timestamp"),
-        })
-    return JSONResponse(result)
+    return _open_reads.respond(request, since)
@@ -1,15 +1,15 @@
-import requests
 from fastapi import APIRouter, Query, HTTPException
+from app.services.reverse_geocoder import reverse_geocoder
 
 router = APIRouter()
 
 @router.get("/reverse-geocode")
 def reverse_geocode(lat: float = Query(...), lon: float = Query(...)):
+    """
+    Nominatim reverse geocode of a position, cached per REVERSE_GEOCODE_GRID_M cell
+    (positions in the same cell get the same result, looked up at the cell centre).
+    """
     try:
-        url = f"https://nominatim.openstreetmap.org/reverse?format=json&lat={lat}&lon={lon}&accept-language=en"
-        headers = {"User-Agent": "YatraOne/1.0 (contact@yatraone.com)"}
-        resp = requests.get(url, headers=headers, timeout=5)
-        resp.raise_for_status()
-        return resp.json()
+        return reverse_geocoder.lookup(lat, lon)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -2,36 +2,28 @@ from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel, Field
 from typing import List, Optional
 
-import math
-import requests
+import time
+from app.services.forward_geocoder import forward_geocoder
 # --------------------------
-# Geocoding Helper (OpenStreetMap Nominatim)
+# Geocoding Helper (OpenStreetMap Nominatim, cached and rate-limited)
 # --------------------------
 def geocode_address(address):
-    url = "https://nominatim.openstreetmap.org/search"
-    params = {
-        "q": address,
-        "format": "json",
-        "limit": 1
-    }
-    try:
-        response = requests.get(url, params=params, headers={"User-Agent": "YatraOne/1.0"}, timeout=5)
-        data = response.json()
-        if data:
-            return float(data[0]["lat"]), float(data[0]["lon"])
-    except Exception:
-        pass
-    return None, None
-
-# For stops: list of names -> list of dicts with lat/lon
+    return forward_geocoder.geocode(address)
+
+# For stops: list of names -> list of dicts with lat/lon, plus per-stop timing
 def geocode_stops(stop_names):
-    stops = []
-    for name in stop_names:
-        lat, lon = geocode_address(name)
+    stops, timings = [], []
+    for name, ((lat, lon), ms, source) in zip(stop_names, forward_geocoder.geocode_many(stop_names)):
         stops.append({"name": name, "latitude": lat, "longitude": lon})
-    return stops
+        timings.append({"name": name, "ms": ms, "source": source})
+    return stops, timings
 
 from app.firebase import firestore_db  # Firestore client
+from app.services.arrival_boards import arrival_boards
+from app.services.route_cache import invalidate_route, put_route, warm_routes
+from app.services.route_geometry import route_geometry
+from app.services.speed_profiles import speed_profiles
+from app.utils.geo import haversine_distance
 
 router = APIRouter()
 
@@ -47,17 +39,50 @@ class Route(BaseModel):
     stops: Optional[List[str]] = None
     speed_limit: Optional[float] = Field(None, description="Speed limit for this route in km/h")
 
-# --------------------------
-# Haversine Distance Function
-# --------------------------
-def haversine(lat1, lon1, lat2, lon2):
-    R = 6371  # km
-    phi1, phi2 = math.radians(lat1), math.radians(lat2)
-    delta_phi = math.radians(lat2 - lat1)
-    delta_lambda = math.radians(lon2 - lon1)
-    a = math.sin(delta_phi/2)**2 + math.cos(phi1) * math.cos(phi2) * math.sin(delta_lambda/2)**2
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
-    return R * c
+# Fields that define a route's shape: changing them renumbers its segments and stops
+SHAPE_FIELDS = ('stops', 'start_latitude', 'start_longitude', 'end_latitude', 'end_longitude')
+
+
+def refresh_route(route_id: str, route: Optional[dict], reshaped: bool = True):
+    """
+    Bring the in-memory route state in line with a write to routes/{route_id}.
+    Args:
+        route_id (str): Route ID.
+        route (dict | None): Full document after the write, or None if it was deleted.
+        reshaped (bool): Whether any of SHAPE_FIELDS changed.
+    """
+    if route is None:
+        invalidate_route(route_id)
+        route_geometry.remove_route(route_id)
+    else:
+        # Ingest only projects onto polylines that are already built, so rebuild now
+        put_route(route_id, route)
+        route_geometry.set_route(route_id, route)
+    if reshaped:
+        speed_profiles.forget_route(route_id)
+        arrival_boards.forget_route(route_id)
+
+
+def reload_routes(route_ids: List[str], reshaped: List[bool]):
+    """
+    Re-read routes written elsewhere (e.g. merged by a batch upload) and refresh them (blocking).
+    """
+    for route_id, changed in zip(route_ids, reshaped):
+        doc = firestore_db.collection('routes').document(route_id).get()
+        refresh_route(route_id, doc.to_dict() if doc.exists else None, changed)
+
+
+def warm_up_route_data():
+    """
+    Cache every route document and build its polyline once at startup.
+    """
+    try:
+        routes = {doc.id: doc.to_dict() for doc in firestore_db.collection('routes').stream()}
+        warm_routes(routes)
+        route_geometry.load_routes(routes)
+        print(f"[Routes] Loaded {len(routes)} routes")
+    except Exception as e:
+        print(f"[Routes] Route warm-up failed: {e}")
 
 # --------------------------
 # GET all routes
@@ -96,11 +121,16 @@ def add_route(route: Route):
 
     # Geocode stops if provided as names (list of str)
     stops = route_data.get('stops')
+    geocoding = None
     if stops and isinstance(stops, list) and (isinstance(stops[0], str) or stops == []):
-        route_data['stops'] = geocode_stops(stops)
+        started = time.perf_counter()
+        route_data['stops'], timings = geocode_stops(stops)
+        geocoding = {"total_ms": round((time.perf_counter() - started) * 1000, 1), "stops": timings}
+        print(f"[Routes] Geocoded {len(stops)} stops for '{route.route_name}' in {geocoding['total_ms']} ms "
+              f"(slowest {max(t['ms'] for t in timings)} ms)")
 
     # Calculate distance
-    total_distance = haversine(
+    total_distance = haversine_distance(
         route_data['start_latitude'], route_data['start_longitude'],
         route_data['end_latitude'], route_data['end_longitude']
     )
@@ -112,7 +142,11 @@ def add_route(route: Route):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Firestore error: {str(e)}")
 
-    return {"id": doc_ref.id, **route_data}
+    refresh_route(doc_ref.id, route_data, reshaped=False)
+    response = {"id": doc_ref.id, **route_data}
+    if geocoding:
+        response["geocoding"] = geocoding   # per-stop latency and cache source; not stored
+    return response
 
 # --------------------------
 # PATCH update existing route
@@ -120,7 +154,8 @@ def add_route(route: Route):
 @router.patch("/routes/{route_id}")
 def update_route(route_id: str, route: dict):
     doc_ref = firestore_db.collection('routes').document(route_id)
-    if not doc_ref.get().exists:
+    current = doc_ref.get()
+    if not current.exists:
         raise HTTPException(status_code=404, detail="Route not found")
 
     # Unique route_name check if route_name is being updated
@@ -135,13 +170,14 @@ def update_route(route_id: str, route: dict):
     # Distance update if all coordinates provided
     mandatory_fields = ['start_latitude', 'start_longitude', 'end_latitude', 'end_longitude']
     if all(field in route for field in mandatory_fields):
-        distance = haversine(
+        distance = haversine_distance(
             route['start_latitude'], route['start_longitude'],
             route['end_latitude'], route['end_longitude']
         )
         route['total_distance_km'] = distance
 
     doc_ref.update(route)
+    refresh_route(route_id, {**current.to_dict(), **route}, reshaped=any(field in route for field in SHAPE_FIELDS))
     return {"id": route_id, **route}
 
 # --------------------------
@@ -153,4 +189,5 @@ def delete_route(route_id: str):
     if not doc_ref.get().exists:
         raise HTTPException(status_code=404, detail="Route not found")
     doc_ref.delete()
+    refresh_route(route_id, None)
     return {"success": True}
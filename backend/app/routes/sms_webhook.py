@@ -3,6 +3,7 @@ from fastapi.responses import PlainTextResponse
 import os
 from twilio.twiml.messaging_response import MessagingResponse
 from ..services.bus_info import get_eta_and_next_stop_for_bus
+from ..utils.blocking_executor import run_blocking
 
 router = APIRouter()
 
@@ -13,7 +14,7 @@ async def sms_webhook(request: Request):
     incoming_msg = form.get("Body", "").strip()
     bus_number = incoming_msg.upper()
     # Call your service to get bus info
-    info = get_eta_and_next_stop_for_bus(bus_number)
+    info = await run_blocking(get_eta_and_next_stop_for_bus, bus_number)
     if info:
         reply = (
             f"Bus {info['bus_number']}\n"
@@ -21,6 +22,10 @@ async def sms_webhook(request: Request):
             f"Next Stop: {info['next_stop']}\n"
             f"ETA: {info['eta']} min"
         )
+        progress = info.get('progress')
+        if progress and progress['current_stop']:
+            label = "At Stop" if progress['at_stop'] else "Last Stop"
+            reply += f"\n{label}: {progress['current_stop']['name']} ({progress['stops_passed']}/{progress['stops_total']})"
     else:
         reply = f"Bus {bus_number} not found or not online. Please check the number."
     twiml = MessagingResponse()
@@ -7,6 +7,7 @@ from datetime import datetime
 from app.firebase import firestore_db
 from app.utils.notifications import push_notification
 from app.email_utils import send_template_email
+from app.utils.blocking_executor import run_blocking
 
 router = APIRouter()
 
@@ -25,9 +26,10 @@ async def send_sos(sos: SOSRequest):
     data = sos.dict()
     if not data.get('timestamp'):
         data['timestamp'] = datetime.utcnow()
-    doc_ref.set(data)
+    await run_blocking(doc_ref.set, data)
     # Notify admin (push notification)
-    push_notification(
+    await run_blocking(
+        push_notification,
         title="🚨 SOS Alert",
         message=f"SOS from user {sos.user_id}: {sos.message or 'No message'}",
         user_type="admin",
@@ -35,7 +37,8 @@ async def send_sos(sos: SOSRequest):
     )
     # Email to admin
     try:
-        send_template_email(
+        await run_blocking(
+            send_template_email,
             to_email="arya119000@gmail.com",  # Replace with real admin email or list
             subject="SOS Alert Received!",
             template_name="sos_admin.html",
@@ -56,6 +59,15 @@ from fastapi import UploadFile, File, Form
 import base64
 
 
+def _increment_points(user_id: str):
+    user_ref = firestore_db.collection('users').document(user_id)
+    doc = user_ref.get()
+    if doc.exists:
+        user_data = doc.to_dict()
+        current_points = user_data.get('points', 0)
+        user_ref.update({'points': current_points + 1})
+
+
 @router.post("/incident", status_code=201)
 async def report_incident(
     user_id: str = Form(...),
@@ -79,19 +91,15 @@ async def report_incident(
         data["photo_base64"] = base64.b64encode(content).decode()
         data["photo_filename"] = photo.filename
     doc_ref = firestore_db.collection('incident_reports').document()
-    doc_ref.set(data)
+    await run_blocking(doc_ref.set, data)
     # Increment user's points in Firestore
     try:
-        user_ref = firestore_db.collection('users').document(user_id)
-        doc = user_ref.get()
-        if doc.exists:
-            user_data = doc.to_dict()
-            current_points = user_data.get('points', 0)
-            user_ref.update({'points': current_points + 1})
+        await run_blocking(_increment_points, user_id)
     except Exception as e:
         print(f"[WARN] Could not increment points for user {user_id}: {e}")
     # Notify admin (push notification)
-    push_notification(
+    await run_blocking(
+        push_notification,
         title="⚠️ Incident Reported",
         message=f"Incident ({type}) from user {user_id}: {description[:60]}...",
         user_type="admin",
@@ -99,7 +107,8 @@ async def report_incident(
     )
     # Email to admin
     try:
-        send_template_email(
+        await run_blocking(
+            send_template_email,
             to_email="arya119000@gmail.com",  # Replace with real admin email or list
             subject="Incident Report Submitted",
             template_name="incident_report_admin.html",
@@ -0,0 +1,157 @@
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from typing import List, Optional, Set
+import asyncio
+import json
+import os
+from app.routes.bus_location_sse import DEFAULT_MAX_RATE, HEARTBEAT_INTERVAL, RETRY_MS
+from app.services.arrival_boards import arrival_boards
+from app.services.route_cache import get_route
+from app.services.route_geometry import route_geometry
+from app.utils.http_cache import etag_matches
+from app.utils.metrics import register_metrics
+
+router = APIRouter()
+
+MAX_STOPS = int(os.getenv("SSE_MAX_STOPS", "20"))   # boards per stream
+
+
+class _BoardStream:
+    """
+    One SSE client following some stops. Board changes only mark the stop;
+    the stream reads the current (shared, pre-encoded) board when it wakes,
+    so bursts of updates collapse into one event per stop.
+    """
+
+    __slots__ = ("stop_ids", "changed", "ready", "loop")
+
+    def __init__(self, stop_ids: List[str], changed: Optional[List[str]] = None):
+        self.stop_ids = stop_ids
+        # Everything is sent once on connect, or only what changed since a resumed event id
+        self.changed: Set[str] = set(stop_ids if changed is None else changed)
+        self.ready = asyncio.Event()
+        self.ready.set()
+        self.loop = asyncio.get_running_loop()
+
+    def notify(self, sid: str):
+        # Called from whichever thread ingested the location
+        self.loop.call_soon_threadsafe(self._mark, sid)
+
+    def _mark(self, sid: str):
+        self.changed.add(sid)
+        self.ready.set()
+
+    def take(self) -> List[str]:
+        changed, self.changed = self.changed, set()
+        self.ready.clear()
+        return [sid for sid in self.stop_ids if sid in changed]
+
+
+class StopArrivalsHub:
+    def __init__(self):
+        self.streams = 0
+        self.events_sent = 0
+        self.not_modified = 0
+        self.resumes = 0
+
+    def stats(self) -> dict:
+        return {"streams": self.streams, "events_sent": self.events_sent, "not_modified": self.not_modified,
+                "resumes": self.resumes}
+
+
+hub = StopArrivalsHub()
+register_metrics("stop_arrivals", hub.stats)
+
+
+def _parse_stop_id(sid: str):
+    route_id, _, index = sid.rpartition(":")
+    if not route_id or not index.isdigit():
+        raise HTTPException(status_code=400, detail="stop_id must be <route_id>:<stop_index>")
+    return route_id, int(index)
+
+
+@router.get("/stops/{stop_id}/arrivals")
+def get_stop_arrivals(request: Request, stop_id: str):
+    """
+    Next buses at a stop, soonest first, from the in-memory arrival board.
+    Args:
+        stop_id (str): "<route_id>:<stop_index>".
+    Returns:
+        dict: stop_id, route_id, stop_index, name, version and arrivals
+        [{bus_id, route_id, eta_minutes, distance_km, updated}]. The ETag follows the
+        board version; send it back in If-None-Match to get a 304.
+    """
+    route_id, index = _parse_stop_id(stop_id)
+    polyline = route_geometry.polyline(route_id) or route_geometry.polyline(route_id, get_route(route_id))
+    if polyline is None or index not in polyline.stop_vertices:
+        raise HTTPException(status_code=404, detail="Stop not found")
+    version, body = arrival_boards.board_json(stop_id)
+    headers = {"ETag": f'"{arrival_boards.tag(version)}"', "Cache-Control": "no-cache"}
+    if etag_matches(request, headers["ETag"]):
+        hub.not_modified += 1
+        return Response(status_code=304, headers=headers)
+    # The shared body carries the board only; stop details are spliced in front of it
+    head = json.dumps({"route_id": route_id, "stop_index": index, "name": polyline.stop_names[index]})
+    return Response(content=head[:-1] + ", " + body[1:], media_type="application/json", headers=headers)
+
+
+async def _board_events(request: Request, stream: _BoardStream, max_rate: float):
+    for sid in stream.stop_ids:
+        arrival_boards.watch(sid, stream.notify)
+    hub.streams += 1
+    try:
+        yield f"retry: {RETRY_MS}\n\n"
+        interval = 1.0 / max_rate
+        while True:
+            try:
+                await asyncio.wait_for(stream.ready.wait(), HEARTBEAT_INTERVAL)
+            except asyncio.TimeoutError:
+                if await request.is_disconnected():
+                    break
+                yield ": ping\n\n"
+                continue
+            # Oldest board first, so the last id a client saw covers every board it was sent
+            events = sorted((arrival_boards.board_json(sid) for sid in stream.take()), key=lambda e: e[0])
+            for version, body in events:
+                hub.events_sent += 1
+                yield f"id: {arrival_boards.tag(version)}\nevent: arrivals\ndata: {body}\n\n"
+            await asyncio.sleep(interval)
+    finally:
+        hub.streams -= 1
+        for sid in stream.stop_ids:
+            arrival_boards.unwatch(sid, stream.notify)
+
+
+@router.get("/sse/stop-arrivals")
+async def stop_arrivals_sse(
+    request: Request,
+    stop_ids: str = Query(..., description="Comma-separated stop IDs (<route_id>:<stop_index>)"),
+    max_rate: float = Query(DEFAULT_MAX_RATE, ge=0.1, le=10),
+):
+    """
+    Server-Sent Events push of arrival boards: an "arrivals" event with a stop's whole
+    board ({"stop_id", "version", "arrivals"}) on connect and whenever it changes,
+    at most max_rate batches per second. Event ids are the board versions; reconnecting
+    with Last-Event-ID only resends the boards that changed since that id (every board
+    if the id came from another worker or before a restart).
+    """
+    ids = list(dict.fromkeys(s.strip() for s in stop_ids.split(",") if s.strip()))
+    if not ids:
+        raise HTTPException(status_code=400, detail="stop_ids is required")
+    if len(ids) > MAX_STOPS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_STOPS} stops per stream")
+    for sid in ids:
+        _parse_stop_id(sid)
+    since = arrival_boards.parse_tag(request.headers.get("last-event-id"))
+    if since is not None:
+        hub.resumes += 1
+    changed = arrival_boards.changed_since(since, ids) if since is not None else None
+    return StreamingResponse(
+        _board_events(request, _BoardStream(ids, changed), max_rate),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+            "Content-Encoding": "identity",
+        },
+    )
@@ -2,6 +2,7 @@
 from fastapi import APIRouter, UploadFile, File, HTTPException
 from fastapi.responses import RedirectResponse
 from app.firebase import bucket
+from app.utils.blocking_executor import run_blocking
 
 router = APIRouter()
 
@@ -11,8 +12,8 @@ async def upload_timetable(file: UploadFile = File(...)):
         raise HTTPException(status_code=400, detail='Only PDF files are allowed.')
     blob = bucket.blob(f"timetables/{file.filename}")
     content = await file.read()
-    blob.upload_from_string(content, content_type='application/pdf')
-    blob.make_public()
+    await run_blocking(blob.upload_from_string, content, content_type='application/pdf')
+    await run_blocking(blob.make_public)
     return {"message": "Timetable uploaded to Firebase Storage.", "filename": file.filename, "url": blob.public_url}
 
 @router.get('/timetable/{filename}')
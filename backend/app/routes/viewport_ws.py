@@ -0,0 +1,348 @@
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import asyncio
+import json
+import math
+import os
+from app.routes.bus_location_ws import client_ip, manager, reject
+from app.services.bus_assignments import get_cached_assignment
+from app.services.live_fleet import live_fleet
+from app.utils.metrics import register_metrics
+
+router = APIRouter()
+
+CELL_DEG = float(os.getenv("VIEWPORT_CELL_DEG", "0.02"))            # grid cell edge (~2 km)
+MAX_CELLS = int(os.getenv("VIEWPORT_MAX_CELLS", "2500"))            # largest bbox a client may subscribe to
+BATCH_INTERVAL = float(os.getenv("VIEWPORT_BATCH_INTERVAL", "0.5"))  # seconds between batches per client
+SEND_TIMEOUT = float(os.getenv("WS_SEND_TIMEOUT", "10"))
+
+Cell = Tuple[int, int]
+
+
+def _cell(lat: float, lon: float) -> Cell:
+    return math.floor(lat / CELL_DEG), math.floor(lon / CELL_DEG)
+
+
+class _Viewport:
+    """
+    One rider socket: its bbox and/or route filter plus the positions waiting
+    for the next batch (latest per bus, so a slow client never queues more
+    than one frame per visible bus).
+    """
+
+    def __init__(self, hub: "ViewportHub", websocket: WebSocket):
+        self.hub = hub
+        self.websocket = websocket
+        self.bbox: Optional[Tuple[float, float, float, float]] = None
+        self.cells: Set[Cell] = set()
+        self.route_ids: Set[str] = set()
+        self.buses: Set[str] = set()
+        self.pending: Dict[str, dict] = {}
+        self.left: Set[str] = set()
+        self.control: List[dict] = []
+        self.ready = asyncio.Event()
+        self.task = asyncio.create_task(self._flush_loop())
+
+    def contains(self, lat: float, lon: float, routes: Iterable[str]) -> bool:
+        if self.bbox:
+            south, west, north, east = self.bbox
+            if south <= lat <= north and west <= lon <= east:
+                return True
+        return any(r in self.route_ids for r in routes)
+
+    def push(self, bus_id: str, payload: dict):
+        self.pending[bus_id] = payload
+        self.left.discard(bus_id)
+        self.ready.set()
+
+    def drop(self, bus_id: str):
+        self.pending.pop(bus_id, None)
+        self.left.add(bus_id)
+        self.ready.set()
+
+    def send_control(self, frame: dict):
+        self.control.append(frame)
+        self.ready.set()
+
+    async def _flush_loop(self):
+        try:
+            while True:
+                await self.ready.wait()
+                self.ready.clear()
+                control, self.control = self.control, []
+                for frame in control:
+                    await asyncio.wait_for(self.websocket.send_text(json.dumps(frame)), SEND_TIMEOUT)
+                if self.pending or self.left:
+                    batch = {"type": "batch", "buses": list(self.pending.values())}
+                    if self.left:
+                        batch["left"] = list(self.left)
+                    self.pending, self.left = {}, set()
+                    await asyncio.wait_for(self.websocket.send_text(json.dumps(batch)), SEND_TIMEOUT)
+                    self.hub.batches_sent += 1
+                await asyncio.sleep(BATCH_INTERVAL)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self.hub.evictions += 1
+            self.hub.unsubscribe(self)
+            try:
+                await self.websocket.close(code=1008)
+            except Exception:
+                pass
+
+
+class ViewportHub:
+    """
+    Routes location updates to viewport subscribers through a grid-cell index
+    (bbox subscriptions) and a route index, so each update only looks at the
+    viewports registered on the bus's cell and routes.
+    """
+
+    def __init__(self):
+        self.cell_index: Dict[Cell, Set[_Viewport]] = {}
+        self.route_index: Dict[str, Set[_Viewport]] = {}
+        self.cell_buses: Dict[Cell, Set[str]] = {}
+        self.route_buses: Dict[str, Set[str]] = {}
+        self.bus_cells: Dict[str, Cell] = {}
+        self.bus_routes: Dict[str, Set[str]] = {}
+        self.positions: Dict[str, dict] = {}
+        self.members: Dict[str, Set[_Viewport]] = {}   # bus_id -> viewports currently showing it
+        self.viewports: Set[_Viewport] = set()
+        self.updates = 0
+        self.deliveries = 0
+        self.batches_sent = 0
+        self.evictions = 0
+
+    def set_bus_routes(self, bus_id: str, route_ids: Iterable[str]):
+        new_routes = {r for r in route_ids if r}
+        old_routes = self.bus_routes.get(bus_id, set())
+        if new_routes == old_routes:
+            return
+        for route_id in old_routes - new_routes:
+            buses = self.route_buses.get(route_id)
+            if buses:
+                buses.discard(bus_id)
+                if not buses:
+                    del self.route_buses[route_id]
+        for route_id in new_routes - old_routes:
+            self.route_buses.setdefault(route_id, set()).add(bus_id)
+        if new_routes:
+            self.bus_routes[bus_id] = new_routes
+        else:
+            self.bus_routes.pop(bus_id, None)
+
+    def _place(self, bus_id: str, data: dict) -> Optional[Tuple[float, float, Cell, dict]]:
+        # Index a bus's latest position by cell and route; None if it has no coordinates
+        try:
+            lat = float(data['latitude'])
+            lon = float(data['longitude'])
+        except (KeyError, TypeError, ValueError):
+            return None
+        if data.get('route_id'):
+            self.set_bus_routes(bus_id, [data['route_id']])
+        payload = dict(data, bus_id=bus_id)
+        self.positions[bus_id] = payload
+
+        cell = _cell(lat, lon)
+        old_cell = self.bus_cells.get(bus_id)
+        if old_cell != cell:
+            if old_cell is not None:
+                buses = self.cell_buses.get(old_cell)
+                if buses:
+                    buses.discard(bus_id)
+                    if not buses:
+                        del self.cell_buses[old_cell]
+            self.cell_buses.setdefault(cell, set()).add(bus_id)
+            self.bus_cells[bus_id] = cell
+        return lat, lon, cell, payload
+
+    def seed(self, locations: Iterable[Tuple[str, dict]]):
+        """
+        Index positions without delivering them, for buses that moved while no viewport
+        was watching the fleet. Route IDs come from the cached bus assignments.
+        """
+        for bus_id, data in locations:
+            assignment = get_cached_assignment(bus_id)
+            if not data.get('route_id') and isinstance(assignment, dict) and assignment.get('route_ids'):
+                data = dict(data, route_id=assignment['route_ids'][0])
+            self._place(bus_id, data)
+
+    def publish(self, bus_id: str, data: dict):
+        """
+        ConnectionManager listener: route one location update to interested viewports.
+        """
+        placed = self._place(bus_id, data)
+        if placed is None:
+            return
+        self.updates += 1
+        lat, lon, cell, payload = placed
+
+        routes = self.bus_routes.get(bus_id, ())
+        candidates = set(self.cell_index.get(cell, ()))
+        for route_id in routes:
+            candidates.update(self.route_index.get(route_id, ()))
+        matched = {v for v in candidates if v.contains(lat, lon, routes)}
+        for viewport in matched:
+            viewport.push(bus_id, payload)
+            viewport.buses.add(bus_id)
+        self.deliveries += len(matched)
+        for viewport in self.members.get(bus_id, set()) - matched:
+            viewport.drop(bus_id)
+            viewport.buses.discard(bus_id)
+        if matched:
+            self.members[bus_id] = matched
+        else:
+            self.members.pop(bus_id, None)
+
+    def _unindex(self, viewport: _Viewport):
+        for cell in viewport.cells:
+            subs = self.cell_index.get(cell)
+            if subs:
+                subs.discard(viewport)
+                if not subs:
+                    del self.cell_index[cell]
+        for route_id in viewport.route_ids:
+            subs = self.route_index.get(route_id)
+            if subs:
+                subs.discard(viewport)
+                if not subs:
+                    del self.route_index[route_id]
+        viewport.cells = set()
+        viewport.route_ids = set()
+        viewport.bbox = None
+
+    def subscribe(self, viewport: _Viewport, bbox: Optional[List[float]], route_ids: Optional[List[str]]) -> int:
+        """
+        Replace a viewport's filter and queue the buses already inside it.
+        Args:
+            viewport (_Viewport): Subscriber.
+            bbox (list, optional): [south, west, north, east] in degrees.
+            route_ids (list, optional): Route IDs to follow regardless of position.
+        Returns:
+            int: Number of buses currently visible.
+        Raises:
+            ValueError: Malformed or oversized bbox.
+        """
+        cells: Set[Cell] = set()
+        box = None
+        if bbox:
+            if len(bbox) != 4:
+                raise ValueError("bbox must be [south, west, north, east]")
+            south, west, north, east = (float(v) for v in bbox)
+            if south > north or west > east:
+                raise ValueError("bbox must be [south, west, north, east]")
+            (c_south, c_west), (c_north, c_east) = _cell(south, west), _cell(north, east)
+            if (c_north - c_south + 1) * (c_east - c_west + 1) > MAX_CELLS:
+                raise ValueError("Viewport too large, zoom in")
+            cells = {(i, j) for i in range(c_south, c_north + 1) for j in range(c_west, c_east + 1)}
+            box = (south, west, north, east)
+
+        self._unindex(viewport)
+        if viewport not in self.viewports:
+            if not self.viewports:
+                # Broadcasts only reach the hub for every bus while some viewport is open
+                self.seed(live_fleet.snapshot()[1])
+            self.viewports.add(viewport)
+            manager.watch_fleet(True)
+        viewport.bbox = box
+        viewport.cells = cells
+        viewport.route_ids = {r for r in (route_ids or []) if r}
+        for cell in cells:
+            self.cell_index.setdefault(cell, set()).add(viewport)
+        for route_id in viewport.route_ids:
+            self.route_index.setdefault(route_id, set()).add(viewport)
+
+        # Initial snapshot from the same indexes
+        visible: Set[str] = set()
+        for cell in cells:
+            visible.update(self.cell_buses.get(cell, ()))
+        for route_id in viewport.route_ids:
+            visible.update(self.route_buses.get(route_id, ()))
+        now_visible = set()
+        for bus_id in visible:
+            payload = self.positions[bus_id]
+            if viewport.contains(payload['latitude'], payload['longitude'], self.bus_routes.get(bus_id, ())):
+                now_visible.add(bus_id)
+                viewport.push(bus_id, payload)
+                self.members.setdefault(bus_id, set()).add(viewport)
+        for bus_id in viewport.buses - now_visible:
+            viewport.drop(bus_id)
+            self._forget_member(bus_id, viewport)
+        viewport.buses = now_visible
+        return len(now_visible)
+
+    def _forget_member(self, bus_id: str, viewport: _Viewport):
+        members = self.members.get(bus_id)
+        if members:
+            members.discard(viewport)
+            if not members:
+                del self.members[bus_id]
+
+    def unsubscribe(self, viewport: _Viewport):
+        self._unindex(viewport)
+        for bus_id in viewport.buses:
+            self._forget_member(bus_id, viewport)
+        viewport.buses = set()
+        if viewport in self.viewports:
+            self.viewports.discard(viewport)
+            manager.watch_fleet(False)
+
+    def stats(self) -> dict:
+        return {
+            "viewports": len(self.viewports),
+            "indexed_cells": len(self.cell_index),
+            "indexed_routes": len(self.route_index),
+            "tracked_buses": len(self.positions),
+            "updates": self.updates,
+            "deliveries": self.deliveries,
+            "batches_sent": self.batches_sent,
+            "evictions": self.evictions,
+        }
+
+
+hub = ViewportHub()
+manager.add_listener(hub.publish)
+register_metrics("viewports", hub.stats)
+
+
+@router.websocket("/ws/viewport")
+async def viewport_ws(websocket: WebSocket):
+    """
+    One socket for every bus in a map viewport.
+    Client sends {"type": "subscribe", "bbox": [south, west, north, east], "route_ids": [...]}
+    (either or both) and may resend it at any time to move the viewport; the server answers
+    {"type": "subscribed", "buses": n} and then {"type": "batch", "buses": [...], "left": [...]}
+    at most every VIEWPORT_BATCH_INTERVAL seconds.
+    """
+    ip = client_ip(websocket)
+    if not manager.admit(ip):
+        await reject(websocket)
+        return
+    try:
+        await websocket.accept()
+    except Exception:
+        manager.release(ip)
+        return
+    viewport = _Viewport(hub, websocket)
+    try:
+        while True:
+            msg = await websocket.receive_text()
+            try:
+                data = json.loads(msg)
+                if data.get('type') == 'subscribe':
+                    count = hub.subscribe(viewport, data.get('bbox'), data.get('route_ids'))
+                    viewport.send_control({"type": "subscribed", "buses": count})
+                elif data.get('type') == 'unsubscribe':
+                    hub.unsubscribe(viewport)
+            except ValueError as e:
+                viewport.send_control({"type": "error", "detail": str(e)})
+            except Exception as e:
+                print(f"[WS] Error processing viewport message: {e}")
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        print(f"[WS] Viewport connection error: {e}")
+    finally:
+        hub.unsubscribe(viewport)
+        viewport.task.cancel()
+        manager.release(ip)
@@ -0,0 +1,223 @@
+# Per-stop arrival boards, kept up to date from each bus's position on its route
+import json
+import os
+import threading
+import time
+import uuid
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from app.services.speed_profiles import speed_profiles
+from app.utils.metrics import register_metrics
+
+MAX_ARRIVALS = int(os.getenv("ARRIVAL_BOARD_MAX_ARRIVALS", "10"))        # buses listed per board
+STALE_SECONDS = float(os.getenv("ARRIVAL_BOARD_STALE_SECONDS", "300"))   # hide buses that stopped reporting
+DEFAULT_SPEED_KMH = float(os.getenv("ETA_DEFAULT_SPEED_KMH", "20"))     # when a bus reports no usable speed
+
+# bus_id -> (route_id, eta_minutes, distance_km, updated)
+Entry = Tuple[str, Optional[float], float, float]
+
+
+def stop_id(route_id: str, index) -> str:
+    """
+    Route stops have no IDs of their own; they are addressed by position.
+    """
+    return f"{route_id}:{index}"
+
+
+class ArrivalBoards:
+    """
+    Materialized "next buses" list per stop. A position update rewrites only
+    the bus's entries on the stops still ahead of it on its route and drops it
+    from the ones it has passed, so the cost per ping is bounded by the
+    downstream stop count. Boards are sorted and encoded lazily, once per
+    version, when read.
+    """
+
+    def __init__(self):
+        self._boards: Dict[str, Dict[str, Entry]] = {}
+        self._bus_stops: Dict[str, List[str]] = {}           # bus_id -> stops it is listed on
+        self._versions: Dict[str, int] = {}
+        self._encoded: Dict[str, Tuple[int, float, str]] = {}   # stop_id -> (version, expires, JSON board)
+        self._watchers: Dict[str, Set[Callable[[str], None]]] = {}
+        self._lock = threading.Lock()
+        # Versions are per process; the epoch keeps tags from another worker or a restart from matching
+        self.epoch = uuid.uuid4().hex[:8]
+        self.version = 0
+        self.updates = 0
+        self.entries_written = 0
+        self.encodes = 0
+
+    def tag(self, version: int) -> str:
+        """
+        Opaque token for a board version, used as the ETag value and as the SSE event id.
+        """
+        return f"{self.epoch}-{version}"
+
+    def parse_tag(self, tag: str) -> Optional[int]:
+        """
+        Returns:
+            int | None: The version in a tag issued by this process, else None.
+        """
+        epoch, _, version = (tag or "").strip().strip('"').rpartition("-")
+        if epoch != self.epoch or not version.isdigit() or int(version) > self.version:
+            return None
+        return int(version)
+
+    def changed_since(self, version: int, stop_ids: List[str]) -> List[str]:
+        """
+        The stops among stop_ids whose boards changed after version.
+        """
+        with self._lock:
+            return [sid for sid in stop_ids if self._versions.get(sid, 0) > version]
+
+    def update_bus(self, bus_id: str, route_id: str, polyline, along_km: float,
+                   speed_kmh: Optional[float] = None, ts: Optional[float] = None):
+        """
+        Re-list a bus on the stops ahead of it.
+        Args:
+            bus_id (str): Bus ID.
+            route_id (str): Route the bus is on.
+            polyline (RoutePolyline): The route's shape.
+            along_km (float): The bus's projected distance along the route.
+            speed_kmh (float, optional): Reported speed, used where there is no speed profile.
+            ts (float, optional): Time of the position (default now).
+        """
+        ts = time.time() if ts is None else ts
+        downstream = polyline.downstream_stops(along_km)
+        fallback = speed_kmh if speed_kmh and speed_kmh > 0 else DEFAULT_SPEED_KMH
+        minutes = speed_profiles.travel_minutes_many(
+            route_id, polyline, along_km, [along_km + remaining for _, _, remaining in downstream], fallback, ts)
+        stop_ids = [stop_id(route_id, index) for index, _, _ in downstream]
+        changed = []
+        with self._lock:
+            self.updates += 1
+            self.version += 1
+            ahead = set(stop_ids)
+            for sid in self._bus_stops.get(bus_id, ()):
+                if sid not in ahead and self._boards.get(sid, {}).pop(bus_id, None) is not None:
+                    self._versions[sid] = self.version
+                    changed.append(sid)
+            for sid, (_, _, remaining), eta in zip(stop_ids, downstream, minutes):
+                self._boards.setdefault(sid, {})[bus_id] = (route_id, eta, remaining, ts)
+                self._versions[sid] = self.version
+            self.entries_written += len(stop_ids)
+            if stop_ids:
+                self._bus_stops[bus_id] = stop_ids
+            else:
+                self._bus_stops.pop(bus_id, None)
+        self._notify(changed + stop_ids)
+
+    def remove_bus(self, bus_id: str):
+        """
+        Take a bus off every board (left its route, or no longer tracked).
+        """
+        with self._lock:
+            stop_ids = self._bus_stops.pop(bus_id, [])
+            if stop_ids:
+                self.version += 1
+            for sid in stop_ids:
+                self._boards.get(sid, {}).pop(bus_id, None)
+                self._versions[sid] = self.version
+        self._notify(stop_ids)
+
+    def forget_route(self, route_id: str):
+        """
+        Drop a route's boards (its stop indices no longer mean the same thing).
+        """
+        prefix = stop_id(route_id, "")
+        with self._lock:
+            stop_ids = [sid for sid in self._boards if sid.startswith(prefix)]
+            if stop_ids:
+                self.version += 1
+            for sid in stop_ids:
+                for bus_id in self._boards.pop(sid):
+                    listed = self._bus_stops.get(bus_id)
+                    if listed and listed[0].startswith(prefix):
+                        del self._bus_stops[bus_id]
+                self._versions[sid] = self.version
+                self._encoded.pop(sid, None)
+        self._notify(stop_ids)
+
+    def board(self, sid: str, limit: int = MAX_ARRIVALS) -> Tuple[int, List[dict]]:
+        """
+        Returns:
+            tuple: (version, arrivals) for a stop, soonest first. Buses that have
+            not reported for STALE_SECONDS are dropped from the board, which
+            counts as a change (new version).
+        """
+        cutoff = time.time() - STALE_SECONDS
+        with self._lock:
+            entries = self._boards.get(sid, {})
+            stale = [bus_id for bus_id, entry in entries.items() if entry[3] < cutoff]
+            if stale:
+                for bus_id in stale:
+                    del entries[bus_id]
+                self.version += 1
+                self._versions[sid] = self.version
+            version = self._versions.get(sid, 0)
+            entries = list(entries.items())
+        arrivals = [
+            {"bus_id": bus_id, "route_id": route_id,
+             "eta_minutes": round(eta, 1) if eta is not None else None,
+             "distance_km": round(distance_km, 2), "updated": updated}
+            for bus_id, (route_id, eta, distance_km, updated) in entries
+        ]
+        arrivals.sort(key=lambda a: (a["eta_minutes"] is None, a["eta_minutes"] or 0.0, a["distance_km"]))
+        return version, arrivals[:limit]
+
+    def board_json(self, sid: str) -> Tuple[int, str]:
+        """
+        The default-size board as JSON, encoded once per version and shared by all readers.
+        """
+        cached = self._encoded.get(sid)
+        # Also re-encode once the oldest listed bus would have gone stale (dropping it bumps the version)
+        if cached is not None and cached[0] == self._versions.get(sid, 0) and cached[1] > time.time():
+            return cached[0], cached[2]
+        version, arrivals = self.board(sid)
+        body = json.dumps({"stop_id": sid, "version": self.tag(version), "arrivals": arrivals})
+        expires = min((a["updated"] for a in arrivals), default=float("inf")) + STALE_SECONDS
+        self._encoded[sid] = (version, expires, body)
+        self.encodes += 1
+        return version, body
+
+    def watch(self, sid: str, callback: Callable[[str], None]):
+        """
+        Call callback(stop_id) whenever the stop's board changes. It may be called from
+        any thread that ingests locations, so it must be thread-safe and quick.
+        """
+        with self._lock:
+            self._watchers.setdefault(sid, set()).add(callback)
+
+    def unwatch(self, sid: str, callback: Callable[[str], None]):
+        with self._lock:
+            watchers = self._watchers.get(sid)
+            if watchers:
+                watchers.discard(callback)
+                if not watchers:
+                    del self._watchers[sid]
+
+    def _notify(self, stop_ids: List[str]):
+        if not self._watchers:
+            return
+        for sid in stop_ids:
+            for callback in list(self._watchers.get(sid, ())):
+                try:
+                    callback(sid)
+                except Exception as e:
+                    print(f"[ArrivalBoards] Watcher error for {sid}: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "boards": len(self._boards),
+            "listed_buses": len(self._bus_stops),
+            "entries": sum(len(b) for b in self._boards.values()),
+            "watched_stops": len(self._watchers),
+            "updates": self.updates,
+            "entries_written": self.entries_written,
+            "encodes": self.encodes,
+            "epoch": self.epoch,
+        }
+
+
+arrival_boards = ArrivalBoards()
+register_metrics("arrival_boards", arrival_boards.stats)
@@ -0,0 +1,236 @@
+# Pub/sub backends carrying ConnectionManager broadcasts between workers
+import asyncio
+import os
+from typing import Callable, Optional, Set
+
+BROADCAST_BACKEND = os.getenv("BROADCAST_BACKEND", "memory")   # memory | redis
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+CHANNEL_PREFIX = os.getenv("BROADCAST_CHANNEL_PREFIX", "yatra:bus:")
+RETRY_INTERVAL = float(os.getenv("BROADCAST_RETRY_INTERVAL", "5"))   # seconds between Redis reconnect attempts
+_CONTROL_CHANNEL = "__control__"
+
+# deliver(channel, frame, data) -- data is the already-decoded dict when available
+Deliver = Callable[[str, str, Optional[dict]], None]
+
+
+class InProcessBackend:
+    """
+    Single-worker behaviour: a publish is delivered straight to the local manager.
+    """
+
+    name = "memory"
+
+    def __init__(self):
+        self.deliver: Optional[Deliver] = None
+        self.published = 0
+
+    def bind(self, deliver: Deliver):
+        self.deliver = deliver
+
+    async def start(self):
+        pass
+
+    async def close(self):
+        pass
+
+    async def publish(self, channel: str, frame: str, data: Optional[dict] = None):
+        self.published += 1
+        self.deliver(channel, frame, data)
+
+    async def subscribe(self, channel: str):
+        pass
+
+    async def unsubscribe(self, channel: str):
+        pass
+
+    async def subscribe_all(self):
+        pass
+
+    async def unsubscribe_all(self):
+        pass
+
+    def stats(self) -> dict:
+        return {"backend": self.name, "published": self.published}
+
+
+class RedisBackend:
+    """
+    Redis pub/sub: every worker publishes to <prefix><bus_id> and subscribes only
+    to the bus channels that have local sockets (or to <prefix>* while it has
+    local consumers of the whole fleet, such as viewports). A worker also receives
+    its own publishes back from Redis, so nothing is delivered locally twice.
+    If Redis is unreachable at startup the worker runs local-only (publishes go
+    straight to its own sockets) and keeps retrying in the background.
+    """
+
+    name = "redis"
+
+    def __init__(self, url: str = REDIS_URL, prefix: str = CHANNEL_PREFIX):
+        import redis.asyncio as aioredis
+
+        self.prefix = prefix
+        self._client = aioredis.Redis.from_url(url)
+        self._pubsub = None
+        self._reader: Optional[asyncio.Task] = None
+        self._retry: Optional[asyncio.Task] = None
+        self._start_lock = asyncio.Lock()
+        self.deliver: Optional[Deliver] = None
+        self.channels: Set[str] = set()
+        self.all_channels = False
+        self.published = 0
+        self.received = 0
+        self.errors = 0
+        self.local_only = 0
+
+    def bind(self, deliver: Deliver):
+        self.deliver = deliver
+
+    async def start(self):
+        async with self._start_lock:
+            if self._reader or self._retry:
+                return
+            if not await self._connect():
+                self._retry = asyncio.create_task(self._retry_loop())
+
+    async def _connect(self) -> bool:
+        pubsub = self._client.pubsub()
+        try:
+            # Always subscribed to something so get_message() has a connection to read
+            await pubsub.subscribe(self.prefix + _CONTROL_CHANNEL)
+            # Replay what was requested while Redis was down, including requests made during these awaits
+            subscribed, wildcard = set(), False
+            while True:
+                if self.all_channels and not wildcard:
+                    await pubsub.psubscribe(self.prefix + "*")
+                    wildcard = True
+                    continue
+                pending = self.channels - subscribed
+                if not pending:
+                    break
+                for channel in pending:
+                    await pubsub.subscribe(self.prefix + channel)
+                    subscribed.add(channel)
+        except Exception as e:
+            self.errors += 1
+            print(f"[Broadcast] Redis unavailable, delivering locally only: {e}")
+            try:
+                await pubsub.close()
+            except Exception:
+                pass
+            return False
+        self._pubsub = pubsub
+        self._reader = asyncio.create_task(self._read_loop())
+        print("[Broadcast] Redis connected")
+        return True
+
+    async def _retry_loop(self):
+        while True:
+            await asyncio.sleep(RETRY_INTERVAL)
+            async with self._start_lock:
+                if await self._connect():
+                    self._retry = None
+                    return
+
+    async def close(self):
+        if self._retry:
+            self._retry.cancel()
+            self._retry = None
+        if self._reader:
+            self._reader.cancel()
+            self._reader = None
+        if self._pubsub:
+            await self._pubsub.close()
+            self._pubsub = None
+        await self._client.close()
+
+    async def _read_loop(self):
+        prefix_len = len(self.prefix)
+        while True:
+            try:
+                message = await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                if message is None:
+                    continue
+                # With the wildcard active, the same publish also arrives on the bus channel
+                if message["type"] == "message" and self.all_channels:
+                    continue
+                if message["type"] not in ("message", "pmessage"):
+                    continue
+                channel = message["channel"].decode()[prefix_len:]
+                if channel == _CONTROL_CHANNEL:
+                    continue
+                self.received += 1
+                self.deliver(channel, message["data"].decode(), None)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.errors += 1
+                print(f"[Broadcast] Redis read error: {e}")
+                await asyncio.sleep(1)
+
+    async def publish(self, channel: str, frame: str, data: Optional[dict] = None):
+        if self._reader is None:
+            # Not connected (yet): nothing would come back from Redis, deliver here
+            self.local_only += 1
+            self.deliver(channel, frame, data)
+            return
+        try:
+            await self._client.publish(self.prefix + channel, frame)
+            self.published += 1
+        except Exception as e:
+            # Redis down: still reach the sockets on this worker
+            self.errors += 1
+            print(f"[Broadcast] Redis publish failed for {channel}: {e}")
+            self.deliver(channel, frame, data)
+
+    async def _pubsub_call(self, method: str, pattern: str):
+        # Without a connection the request is only recorded; _connect() replays it
+        if self._pubsub is None:
+            return
+        try:
+            await getattr(self._pubsub, method)(pattern)
+        except Exception as e:
+            self.errors += 1
+            print(f"[Broadcast] Redis {method} failed for {pattern}: {e}")
+
+    async def subscribe(self, channel: str):
+        await self.start()
+        if channel not in self.channels:
+            self.channels.add(channel)
+            await self._pubsub_call("subscribe", self.prefix + channel)
+
+    async def unsubscribe(self, channel: str):
+        if channel in self.channels:
+            self.channels.discard(channel)
+            await self._pubsub_call("unsubscribe", self.prefix + channel)
+
+    async def subscribe_all(self):
+        await self.start()
+        if not self.all_channels:
+            await self._pubsub_call("psubscribe", self.prefix + "*")
+            self.all_channels = True
+
+    async def unsubscribe_all(self):
+        if self.all_channels:
+            self.all_channels = False
+            await self._pubsub_call("punsubscribe", self.prefix + "*")
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.name,
+            "connected": self._reader is not None,
+            "channels": len(self.channels),
+            "all_channels": self.all_channels,
+            "published": self.published,
+            "received": self.received,
+            "local_only": self.local_only,
+            "errors": self.errors,
+        }
+
+
+def create_backend():
+    """
+    Build the backend selected by BROADCAST_BACKEND.
+    """
+    if BROADCAST_BACKEND == "redis":
+        return RedisBackend()
+    return InProcessBackend()
@@ -0,0 +1,74 @@
+# In-memory cache of bus -> assigned driver/routes for the location ingest path
+import os
+from typing import Optional
+
+from app.firebase import firestore_db
+from app.utils.metrics import register_metrics
+from app.utils.ttl_cache import MISSING, TTLCache
+
+ASSIGNMENT_TTL = float(os.getenv("BUS_ASSIGNMENT_TTL", "300"))       # seconds
+ASSIGNMENT_CACHE_SIZE = int(os.getenv("BUS_ASSIGNMENT_CACHE_SIZE", "10000"))
+
+_cache = TTLCache(ttl=ASSIGNMENT_TTL, maxsize=ASSIGNMENT_CACHE_SIZE)
+
+
+def _route_ids(bus: dict) -> list:
+    route_ids = list(bus.get('routeIds') or [])
+    for key in ('route', 'routeId'):
+        if bus.get(key) and bus[key] not in route_ids:
+            route_ids.append(bus[key])
+    return route_ids
+
+
+def get_cached_assignment(bus_id: str):
+    """
+    Memory-only lookup for async callers.
+    Returns:
+        dict | None | MISSING: Assignment, None for an unknown bus, MISSING if not cached.
+    """
+    return _cache.get(bus_id)
+
+
+def load_assignment(bus_id: str) -> Optional[dict]:
+    """
+    Fetch a bus's assignment from Firestore (blocking) and cache it.
+    Args:
+        bus_id (str): Bus ID.
+    Returns:
+        dict | None: {'driver_id': ..., 'route_ids': [...]} or None if the bus does not exist.
+    """
+    doc = firestore_db.collection('buses').document(bus_id).get()
+    if doc.exists:
+        bus = doc.to_dict()
+        assignment = {
+            'driver_id': bus.get('driverId') or bus.get('driver_id'),
+            'route_ids': _route_ids(bus),
+        }
+    else:
+        assignment = None
+    _cache.set(bus_id, assignment)
+    return assignment
+
+
+def get_assignment(bus_id: str) -> Optional[dict]:
+    """
+    Cached assignment, loading it from Firestore on a miss (blocking).
+    """
+    assignment = _cache.get(bus_id)
+    if assignment is MISSING:
+        assignment = load_assignment(bus_id)
+    return assignment
+
+
+def invalidate_assignment(bus_id: str):
+    """
+    Drop a bus from the cache; call after any write to buses/{bus_id}.
+    """
+    _cache.invalidate(bus_id)
+
+
+def invalidate_all_assignments():
+    _cache.clear()
+
+
+register_metrics("bus_assignments", _cache.stats)
@@ -1,15 +1,12 @@
 # Service to get ETA and next stop for a bus number
 from app.firebase import firestore_db
-import math
-
-def haversine(lat1, lon1, lat2, lon2):
-    R = 6371  # km
-    phi1, phi2 = math.radians(lat1), math.radians(lat2)
-    delta_phi = math.radians(lat2 - lat1)
-    delta_lambda = math.radians(lon2 - lon1)
-    a = math.sin(delta_phi/2)**2 + math.cos(phi1) * math.cos(phi2) * math.sin(delta_lambda/2)**2
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
-    return R * c
+from app.services.live_fleet import live_fleet
+from app.services.reverse_geocoder import reverse_geocoder
+from app.services.route_cache import get_route
+from app.services.route_geometry import route_geometry
+from app.services.speed_profiles import speed_profiles
+from app.services.stop_tracker import stop_tracker
+from app.utils.geo import haversine_distance
 
 def get_eta_and_next_stop_for_bus(bus_number: str):
     # Find bus by number
@@ -20,48 +17,71 @@ def get_eta_and_next_stop_for_bus(bus_number: str):
         bus = doc.to_dict()
         bus['id'] = doc.id
         break
-    if not bus or 'currentLocation' not in bus or not bus['currentLocation']:
+    if not bus:
+        return None
+    # Live position, the one the stop tracker follows; live ingest never writes currentLocation
+    live = live_fleet.get(bus['id']) or {}
+    if live.get('latitude') is not None and live.get('longitude') is not None:
+        location = live
+    else:
+        location = bus.get('currentLocation') or {}
+    bus_lat = location.get('latitude')
+    bus_lon = location.get('longitude')
+    if None in (bus_lat, bus_lon):
         return None
+    bus_lat, bus_lon = float(bus_lat), float(bus_lon)
     # Get route
     route_id = bus.get('route')
     if not route_id:
         return None
-    route_doc = firestore_db.collection('routes').document(route_id).get()
-    if not route_doc.exists:
+    route = get_route(route_id)
+    if route is None:
         return None
-    route = route_doc.to_dict()
     stops = route.get('stops', [])
     if not stops:
         return None
-    # For demo: next stop is first in list
-    next_stop_name = stops[0] if isinstance(stops[0], str) else stops[0].get('name', '-')
-    # Dummy: use route end as next stop location
-    end_lat = route.get('end_latitude')
-    end_lon = route.get('end_longitude')
-    bus_lat = bus['currentLocation'].get('latitude')
-    bus_lon = bus['currentLocation'].get('longitude')
-    if None in (bus_lat, bus_lon, end_lat, end_lon):
-        return None
-    distance_km = haversine(bus_lat, bus_lon, end_lat, end_lon)
-    speed = bus.get('speed', 20)  # fallback speed
-    eta = int(distance_km / speed * 60) if speed > 0 else None
+    # Time along the route to the next stop from observed segment speeds (else the bus speed);
+    # straight line to the route end if the route has no usable shape
+    located = route_geometry.locate(route_id, route, bus_lat, bus_lon, bus['id'], remember=False)
+    speed = location.get('speed') if location is live else None
+    if not isinstance(speed, (int, float)):
+        speed = bus.get('speed', 20)  # fallback speed
+    progress = None
+    if located:
+        polyline, projection = located
+        # Stop progress tracked from live positions, else the first stop ahead of this one
+        progress = stop_tracker.progress(bus['id'], route_id)
+        if progress is not None:
+            next_index = progress['next_stop']['stop_index'] if progress['next_stop'] else None
+        else:
+            ahead = polyline.downstream_stops(projection.along_km)
+            next_index = ahead[0][0] if ahead else None
+        if next_index is not None:
+            next_stop_name = polyline.stop_names[next_index]
+            target_km = polyline.stop_along_km(next_index)
+        else:
+            next_stop_name = '-'  # past the last stop
+            target_km = polyline.length_km
+        minutes = speed_profiles.travel_minutes(route_id, polyline, projection.along_km, target_km,
+                                                speed if speed > 0 else None)
+        eta = int(minutes) if minutes is not None else None
+    else:
+        next_stop_name = stops[0] if isinstance(stops[0], str) else stops[0].get('name', '-')
+        end_lat = route.get('end_latitude')
+        end_lon = route.get('end_longitude')
+        if None in (end_lat, end_lon):
+            return None
+        distance_km = haversine_distance(bus_lat, bus_lon, end_lat, end_lon)
+        eta = int(distance_km / speed * 60) if speed > 0 else None
 
-    # Reverse geocode current location
-    import requests
-    try:
-        url = f"https://nominatim.openstreetmap.org/reverse?format=json&lat={bus_lat}&lon={bus_lon}&accept-language=en"
-        headers = {"User-Agent": "YatraOne/1.0 (arya119000@gmail.com)"}
-        resp = requests.get(url, headers=headers, timeout=5)
-        resp.raise_for_status()
-        data = resp.json()
-        address = data.get('display_name', f"{bus_lat},{bus_lon}")
-    except Exception:
-        address = f"{bus_lat},{bus_lon}"
+    # Reverse geocode current location (cached per grid cell)
+    address = reverse_geocoder.address(bus_lat, bus_lon)
 
     return {
         "bus_number": bus_number,
         "current_location": address,
         "eta": eta,
-        "next_stop": next_stop_name
+        "next_stop": next_stop_name,
+        "progress": progress,
     }
 
@@ -0,0 +1,161 @@
+# Place name -> coordinates through Nominatim, cached by normalized name in memory and on disk
+import os
+import re
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+
+from app.services.nominatim import nominatim
+from app.utils.metrics import register_metrics
+from app.utils.singleflight import SingleFlight
+from app.utils.sqlite_cache import SqliteCache
+from app.utils.ttl_cache import MISSING, TTLCache
+
+TTL = float(os.getenv("FORWARD_GEOCODE_TTL", str(90 * 86400)))             # seconds; stops do not move
+NOT_FOUND_TTL = float(os.getenv("FORWARD_GEOCODE_NOT_FOUND_TTL", "86400"))  # retry unknown names daily
+MEMORY_SIZE = int(os.getenv("FORWARD_GEOCODE_CACHE_SIZE", "20000"))
+DB_PATH = os.getenv("FORWARD_GEOCODE_DB", "data/forward_geocode.sqlite3")
+CONCURRENCY = int(os.getenv("FORWARD_GEOCODE_CONCURRENCY", "4"))            # names resolved at once per batch
+
+Coords = Tuple[Optional[float], Optional[float]]
+
+
+def normalize_name(name: str) -> str:
+    """
+    Cache key for a place name: case, punctuation and spacing differences collapse.
+    """
+    return " ".join(re.sub(r"[^\w]+", " ", name.casefold()).split())
+
+
+class ForwardGeocoder:
+    """
+    Lookups go memory LRU -> SQLite -> Nominatim (rate-limited), keyed by the
+    normalized name, so a stop shared by many routes is looked up once.
+    Concurrent lookups of the same name wait for one upstream request.
+    "Not found" is cached too, for a shorter time; failures are not.
+    """
+
+    def __init__(self, path: str = DB_PATH):
+        self._memory = TTLCache(ttl=TTL, maxsize=MEMORY_SIZE)
+        self._disk = SqliteCache(path, "geocode")
+        self._flight = SingleFlight()
+        self._executor = ThreadPoolExecutor(max_workers=CONCURRENCY, thread_name_prefix="geocode")
+        self.lookups = 0
+        self.disk_hits = 0
+        self.upstream_calls = 0
+        self.upstream_errors = 0
+        self.not_found = 0
+        self.disk_errors = 0
+        self.last_batch: dict = {}
+
+    def geocode(self, name: str) -> Coords:
+        """
+        Returns:
+            tuple: (lat, lon), or (None, None) if the name is empty, unknown or Nominatim failed.
+        """
+        return self._resolve(name)[0]
+
+    def geocode_many(self, names: List[str]) -> List[Tuple[Coords, float, str]]:
+        """
+        Resolve several names concurrently (cached ones return at once; the rest
+        queue for the rate limit).
+        Returns:
+            list: (coords, milliseconds, source) per name, in order; source is
+            memory, disk, upstream, shared (waited for another lookup) or error.
+        """
+        started = time.perf_counter()
+        results = list(self._executor.map(self._resolve, names))
+        sources = [source for _, _, source in results]
+        self.last_batch = {
+            "names": len(names),
+            "total_ms": round((time.perf_counter() - started) * 1000, 1),
+            "max_ms": max((ms for _, ms, _ in results), default=0.0),
+            "sources": {source: sources.count(source) for source in set(sources)},
+        }
+        return results
+
+    def _resolve(self, name: str) -> Tuple[Coords, float, str]:
+        started = time.perf_counter()
+        coords, source = self._lookup(name)
+        return coords, round((time.perf_counter() - started) * 1000, 1), source
+
+    def _lookup(self, name: str) -> Tuple[Coords, str]:
+        key = normalize_name(name or "")
+        if not key:
+            return (None, None), "empty"
+        self.lookups += 1
+        value = self._memory.get(key)
+        if value is not MISSING:
+            return tuple(value), "memory"
+        try:
+            stored = self._disk.get(key)
+        except sqlite3.Error as e:
+            self.disk_errors += 1
+            print(f"[Geocode] Disk cache read failed: {e}")
+            stored = None
+        if stored is not None:
+            value, expires_at = stored
+            self.disk_hits += 1
+            self._memory.set(key, value, ttl=max(expires_at - time.time(), 0.0))
+            return tuple(value), "disk"
+        fetched = []
+
+        def fetch():
+            fetched.append(True)
+            return self._fetch(key, name)
+
+        try:
+            coords = self._flight.do(key, fetch)
+        except Exception as e:
+            print(f"[Geocode] Lookup failed for {name!r}: {e}")
+            return (None, None), "error"
+        return coords, "upstream" if fetched else "shared"
+
+    def _fetch(self, key: str, name: str) -> Coords:
+        # Another thread may have filled the cache while this one queued for the flight
+        value = self._memory.get(key)
+        if value is not MISSING:
+            return tuple(value)
+        self.upstream_calls += 1
+        try:
+            data = nominatim.get("/search", {"q": name, "limit": 1})
+        except Exception:
+            self.upstream_errors += 1
+            raise
+        if data:
+            coords, ttl = (float(data[0]["lat"]), float(data[0]["lon"])), TTL
+        else:
+            coords, ttl = (None, None), NOT_FOUND_TTL
+            self.not_found += 1
+        self._memory.set(key, list(coords), ttl=ttl)
+        try:
+            self._disk.set(key, list(coords), time.time() + ttl)
+        except sqlite3.Error as e:
+            self.disk_errors += 1
+            print(f"[Geocode] Disk cache write failed: {e}")
+        return coords
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+        self._disk.close()
+
+    def stats(self) -> dict:
+        served = self.lookups - self.upstream_calls
+        return {
+            "lookups": self.lookups,
+            "hit_ratio": round(served / self.lookups, 4) if self.lookups else None,
+            "memory": self._memory.stats(),
+            "disk_hits": self.disk_hits,
+            "disk_entries": self._disk.size(),
+            "disk_errors": self.disk_errors,
+            "upstream_calls": self.upstream_calls,
+            "upstream_errors": self.upstream_errors,
+            "not_found": self.not_found,
+            "single_flight": self._flight.stats(),
+            "last_batch": self.last_batch,
+        }
+
+
+forward_geocoder = ForwardGeocoder()
+register_metrics("forward_geocode", forward_geocoder.stats)
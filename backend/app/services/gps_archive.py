@@ -0,0 +1,424 @@
+# Append-only columnar archive of accepted GPS points, in rotating segment directories
+#
+# <GPS_ARCHIVE_DIR>/seg-<YYYYmmddTHHMMSS>/
+#     ts.f8  lat.f8  lon.f8    float64 columns (epoch seconds, degrees)
+#     speed.f4                 float32 km/h, NaN when unknown
+#     bus.u4                   uint32 index into buses.json
+#     buses.json               bus ids in order of first appearance
+#     unsorted                 marker, present once a point arrived older than the one before it
+#     meta.json                written when the segment is sealed
+#
+# Columns are raw little-endian arrays of equal length, so a reader can np.memmap
+# them and only touch the pages covering the rows it asks for.
+import json
+import os
+import sys
+import threading
+import time
+from array import array
+from collections import deque
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+
+from app.utils.metrics import register_metrics
+
+ARCHIVE_ENABLED = os.getenv("GPS_ARCHIVE_ENABLED", "true").lower() == "true"
+ARCHIVE_DIR = os.getenv("GPS_ARCHIVE_DIR", "data/gps_archive")
+FLUSH_INTERVAL = float(os.getenv("GPS_ARCHIVE_FLUSH_INTERVAL", "5"))              # seconds
+SEGMENT_MAX_POINTS = int(os.getenv("GPS_ARCHIVE_SEGMENT_MAX_POINTS", "2000000"))
+SEGMENT_MAX_SECONDS = float(os.getenv("GPS_ARCHIVE_SEGMENT_MAX_SECONDS", "3600"))
+MAX_PENDING = int(os.getenv("GPS_ARCHIVE_MAX_PENDING", "200000"))                # points held between flushes
+
+# (file name, array typecode, numpy dtype)
+COLUMNS = (
+    ("ts", "d", "<f8"),
+    ("lat", "d", "<f8"),
+    ("lon", "d", "<f8"),
+    ("speed", "f", "<f4"),
+    ("bus", "I", "<u4"),
+)
+_COLUMN_FILES = {name: f"{name}.{dtype[1:]}" for name, _, dtype in COLUMNS}
+
+
+def _write_json(path: str, data):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+
+def _read_json(path: str, default=None):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+
+class _Segment:
+    """
+    The segment currently being appended to (writer thread only).
+    """
+
+    def __init__(self, root: str, start_ts: float):
+        name = "seg-" + datetime.utcfromtimestamp(start_ts).strftime("%Y%m%dT%H%M%S")
+        path = os.path.join(root, name)
+        suffix = 1
+        while os.path.exists(path):
+            path = os.path.join(root, f"{name}-{suffix}")
+            suffix += 1
+        os.makedirs(path)
+        self.path = path
+        self.start_ts = start_ts
+        self.end_ts = start_ts
+        self.min_ts = start_ts
+        self.last_ts = start_ts
+        self.sorted = True
+        self.count = 0
+        self.bus_ids: List[str] = []
+        self.bus_codes: Dict[str, int] = {}
+        self.files = {}
+        try:
+            for name, _, _ in COLUMNS:
+                self.files[name] = open(os.path.join(path, _COLUMN_FILES[name]), "ab")
+        except OSError:
+            self._close()
+            raise
+
+    def append(self, points: list):
+        """
+        Args:
+            points (list): (bus_id, ts, lat, lon, speed) tuples, sorted by ts.
+        """
+        if self.sorted and points[0][1] < self.last_ts:
+            # The clock stepped back: mark the segment before readers can binary search it
+            self.sorted = False
+            open(os.path.join(self.path, "unsorted"), "w").close()
+        new_bus = False
+        columns = {name: array(code) for name, code, _ in COLUMNS}
+        for bus_id, ts, lat, lon, speed in points:
+            code = self.bus_codes.get(bus_id)
+            if code is None:
+                code = self.bus_codes[bus_id] = len(self.bus_ids)
+                self.bus_ids.append(bus_id)
+                new_bus = True
+            columns["ts"].append(ts)
+            columns["lat"].append(lat)
+            columns["lon"].append(lon)
+            columns["speed"].append(speed)
+            columns["bus"].append(code)
+        # Names first, so a reader never sees a bus code it cannot resolve
+        if new_bus:
+            _write_json(os.path.join(self.path, "buses.json"), self.bus_ids)
+        for name, column in columns.items():
+            if sys.byteorder != "little":
+                column.byteswap()
+            f = self.files[name]
+            column.tofile(f)
+            f.flush()
+        self.count += len(points)
+        self.end_ts = max(self.end_ts, points[-1][1])
+        self.min_ts = min(self.min_ts, points[0][1])
+        self.last_ts = points[-1][1]
+
+    def seal(self):
+        self._close()
+        self._write_meta()
+
+    def abandon(self):
+        """
+        Give up on the segment after a failed append: close it and cut every column
+        back to the rows written before the failure, so they stay the same length.
+        """
+        try:
+            self._close()
+        except OSError:
+            pass   # whatever a failed close left behind is truncated below
+        try:
+            # The count in meta.json is what readers trust, even if a truncate fails
+            self._write_meta()
+        finally:
+            for name, _, dtype in COLUMNS:
+                os.truncate(os.path.join(self.path, _COLUMN_FILES[name]), self.count * np.dtype(dtype).itemsize)
+
+    def _close(self):
+        error = None
+        for f in self.files.values():
+            try:
+                f.close()
+            except OSError as e:
+                error = error or e
+        if error:
+            raise error
+
+    def _write_meta(self):
+        _write_json(os.path.join(self.path, "meta.json"), {
+            "start_ts": self.min_ts,
+            "end_ts": self.end_ts,
+            "count": self.count,
+            "buses": len(self.bus_ids),
+            "sorted": self.sorted,
+        })
+
+
+class GpsArchive:
+    """
+    Ingest side of the archive. append() only queues the point; a background
+    thread writes the queue to the open segment every flush_interval seconds
+    and rotates to a new segment by size or age.
+    """
+
+    def __init__(self, root: str = ARCHIVE_DIR, flush_interval: float = FLUSH_INTERVAL,
+                 segment_max_points: int = SEGMENT_MAX_POINTS, segment_max_seconds: float = SEGMENT_MAX_SECONDS,
+                 max_pending: int = MAX_PENDING, enabled: bool = ARCHIVE_ENABLED):
+        self.root = root
+        self.flush_interval = flush_interval
+        self.segment_max_points = segment_max_points
+        self.segment_max_seconds = segment_max_seconds
+        self.max_pending = max_pending
+        self.enabled = enabled
+        self._pending: deque = deque(maxlen=max_pending)
+        self._segment: Optional[_Segment] = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.appended = 0
+        self.written = 0
+        self.dropped = 0
+        self.segments_sealed = 0
+        self.errors = 0
+        self.last_flush_ms = 0.0
+
+    def append(self, bus_id: str, ts: float, lat: float, lon: float, speed: Optional[float]):
+        """
+        Queue one accepted point. Never touches the disk.
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            if len(self._pending) == self.max_pending:
+                # Disk is stuck or too slow; the deque keeps the newest points
+                self.dropped += 1
+            self._pending.append((bus_id, ts, lat, lon, float("nan") if speed is None else speed))
+            self.appended += 1
+
+    def flush(self) -> int:
+        """
+        Write queued points to the open segment, rotating it first if it is full or old.
+        Returns:
+            int: Number of points written.
+        """
+        with self._flush_lock:
+            with self._lock:
+                points, self._pending = list(self._pending), deque(maxlen=self.max_pending)
+            if not points:
+                return 0
+            # Ingest threads can queue slightly out of order; only a clock step back should unsort a segment
+            points.sort(key=lambda p: p[1])
+            started = time.perf_counter()
+            try:
+                segment = self._segment
+                if segment is not None and (
+                    segment.count >= self.segment_max_points
+                    or points[0][1] - segment.start_ts >= self.segment_max_seconds
+                ):
+                    self._seal()
+                    segment = None
+                if segment is None:
+                    os.makedirs(self.root, exist_ok=True)
+                    segment = self._segment = _Segment(self.root, points[0][1])
+                segment.append(points)
+            except Exception as e:
+                print(f"[GpsArchive] Write of {len(points)} points failed: {e}")
+                with self._lock:
+                    self.errors += 1
+                    self.dropped += len(points)
+                # Start a fresh segment next time rather than appending after a partial write
+                segment, self._segment = self._segment, None
+                if segment is not None:
+                    try:
+                        segment.abandon()
+                    except Exception as e:
+                        print(f"[GpsArchive] Could not close failed segment {segment.path}: {e}")
+                return 0
+            with self._lock:
+                self.written += len(points)
+                self.last_flush_ms = round((time.perf_counter() - started) * 1000, 2)
+            return len(points)
+
+    def _seal(self):
+        if self._segment is not None:
+            self._segment.seal()
+            self._segment = None
+            self.segments_sealed += 1
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"[GpsArchive] Flush loop error: {e}")
+
+    def start(self):
+        if not self.enabled or (self._thread and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="gps-archive-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop the writer thread, write what is queued and seal the open segment.
+        """
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=self.flush_interval + 5)
+        self.flush()
+        with self._flush_lock:
+            try:
+                self._seal()
+            except Exception as e:
+                print(f"[GpsArchive] Could not seal segment: {e}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            segment = self._segment
+            return {
+                "enabled": self.enabled,
+                "pending": len(self._pending),
+                "appended": self.appended,
+                "written": self.written,
+                "dropped": self.dropped,
+                "errors": self.errors,
+                "segments_sealed": self.segments_sealed,
+                "open_segment_points": segment.count if segment else 0,
+                "last_flush_ms": self.last_flush_ms,
+            }
+
+
+class ArchiveReader:
+    """
+    Read side of the archive, safe to use from another process while the
+    writer is running (the open segment is read up to its shortest column).
+    """
+
+    def __init__(self, root: str = ARCHIVE_DIR):
+        self.root = root
+
+    def segments(self) -> List[dict]:
+        """
+        Returns:
+            list: {path, start_ts, end_ts, count, sealed, sorted} per segment, oldest first.
+        """
+        try:
+            names = sorted(n for n in os.listdir(self.root) if n.startswith("seg-"))
+        except FileNotFoundError:
+            return []
+        found = []
+        for name in names:
+            path = os.path.join(self.root, name)
+            meta = _read_json(os.path.join(path, "meta.json"))
+            if meta:
+                found.append({"path": path, "start_ts": meta["start_ts"], "end_ts": meta["end_ts"],
+                              "count": meta["count"], "sealed": True, "sorted": meta.get("sorted", True)})
+                continue
+            count = self._open_count(path)
+            if count:
+                ts = self._column(path, "ts", count)
+                if os.path.exists(os.path.join(path, "unsorted")):
+                    found.append({"path": path, "start_ts": float(ts.min()), "end_ts": float(ts.max()),
+                                  "count": count, "sealed": False, "sorted": False})
+                else:
+                    found.append({"path": path, "start_ts": float(ts[0]), "end_ts": float(ts[-1]),
+                                  "count": count, "sealed": False, "sorted": True})
+        return found
+
+    @staticmethod
+    def _open_count(path: str) -> int:
+        counts = []
+        for name, _, dtype in COLUMNS:
+            try:
+                size = os.path.getsize(os.path.join(path, _COLUMN_FILES[name]))
+            except OSError:
+                return 0
+            counts.append(size // np.dtype(dtype).itemsize)
+        return min(counts)
+
+    @staticmethod
+    def _column(path: str, name: str, count: int) -> np.ndarray:
+        dtype = dict((n, d) for n, _, d in COLUMNS)[name]
+        return np.memmap(os.path.join(path, _COLUMN_FILES[name]), dtype=dtype, mode="r", shape=(count,))
+
+    def iter_chunks(self, start_ts: Optional[float] = None, end_ts: Optional[float] = None,
+                    bus_id: Optional[str] = None) -> Iterator[Dict[str, np.ndarray]]:
+        """
+        Points in [start_ts, end_ts), one dict of column arrays per segment, so
+        large ranges can be processed without holding them in memory at once.
+        Args:
+            start_ts (float, optional): Inclusive lower bound, epoch seconds.
+            end_ts (float, optional): Exclusive upper bound, epoch seconds.
+            bus_id (str, optional): Only this bus.
+        Yields:
+            dict: ts, lat, lon, speed arrays and bus (array of bus id strings),
+            in time order.
+        """
+        for seg in self.segments():
+            if start_ts is not None and seg["end_ts"] < start_ts:
+                continue
+            if end_ts is not None and seg["start_ts"] >= end_ts:
+                continue
+            path, count = seg["path"], seg["count"]
+            bus_ids = _read_json(os.path.join(path, "buses.json"), [])
+            if bus_id is not None and bus_id not in bus_ids:
+                continue
+            ts = self._column(path, "ts", count)
+            keep = None
+            if seg["sorted"]:
+                # Binary search the rows in range
+                lo = 0 if start_ts is None else int(np.searchsorted(ts, start_ts, side="left"))
+                hi = count if end_ts is None else int(np.searchsorted(ts, end_ts, side="left"))
+                if lo >= hi:
+                    continue
+            else:
+                # Not in time order: test every row
+                lo, hi = 0, count
+                keep = np.ones(count, dtype=bool)
+                if start_ts is not None:
+                    keep &= ts >= start_ts
+                if end_ts is not None:
+                    keep &= ts < end_ts
+            codes = self._column(path, "bus", count)[lo:hi]
+            if bus_id is not None:
+                is_bus = codes == bus_ids.index(bus_id)
+                keep = is_bus if keep is None else keep & is_bus
+            rows = slice(None)
+            if keep is not None:
+                rows = np.flatnonzero(keep)
+                if not len(rows):
+                    continue
+                if not seg["sorted"]:
+                    rows = rows[np.argsort(ts[rows], kind="stable")]
+            chunk = {"ts": np.array(ts[lo:hi][rows])}
+            for name in ("lat", "lon", "speed"):
+                chunk[name] = np.array(self._column(path, name, count)[lo:hi][rows])
+            chunk["bus"] = np.asarray(bus_ids, dtype=object)[codes[rows]] if bus_ids else np.empty(0, dtype=object)
+            yield chunk
+
+    def scan(self, start_ts: Optional[float] = None, end_ts: Optional[float] = None,
+             bus_id: Optional[str] = None) -> Dict[str, np.ndarray]:
+        """
+        Same as iter_chunks, concatenated into one dict of arrays.
+        """
+        chunks = list(self.iter_chunks(start_ts, end_ts, bus_id))
+        if not chunks:
+            empty = {name: np.empty(0, dtype=dtype) for name, _, dtype in COLUMNS if name != "bus"}
+            empty["bus"] = np.empty(0, dtype=object)
+            return empty
+        return {name: np.concatenate([c[name] for c in chunks]) for name in chunks[0]}
+
+
+gps_archive = GpsArchive()
+register_metrics("gps_archive", gps_archive.stats)
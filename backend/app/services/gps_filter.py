@@ -0,0 +1,100 @@
+# Per-bus ingest filter: drops stationary duplicates and impossible GPS jumps
+import os
+import threading
+import time
+from typing import Dict
+
+from app.utils.geo import haversine_distance
+from app.utils.metrics import register_metrics
+
+MIN_DISTANCE_M = float(os.getenv("GPS_FILTER_MIN_DISTANCE_M", "15"))    # smaller moves count as "not moved"
+MIN_INTERVAL_S = float(os.getenv("GPS_FILTER_MIN_INTERVAL_S", "0"))     # throttle; 0 = off
+KEEPALIVE_S = float(os.getenv("GPS_FILTER_KEEPALIVE_S", "30"))          # accept a parked bus at least this often
+MAX_SPEED_KMH = float(os.getenv("GPS_FILTER_MAX_SPEED_KMH", "150"))     # faster implied speed is a GPS jump
+MAX_JUMP_REJECTS = int(os.getenv("GPS_FILTER_MAX_JUMP_REJECTS", "3"))   # then trust the new position
+
+ACCEPTED = "accepted"
+STATIONARY = "stationary"
+THROTTLED = "throttled"
+JUMP = "jump"
+
+
+class _BusState:
+    __slots__ = ("lat", "lon", "accepted_at", "jump_rejects", "counts")
+
+    def __init__(self):
+        self.lat = None
+        self.lon = None
+        self.accepted_at = 0.0
+        self.jump_rejects = 0
+        self.counts = {ACCEPTED: 0, STATIONARY: 0, THROTTLED: 0, JUMP: 0}
+
+
+class GpsFilter:
+    """
+    Decides per ping whether a location is worth persisting and broadcasting,
+    comparing it against the last accepted point of the same bus.
+    """
+
+    def __init__(self):
+        self._buses: Dict[str, _BusState] = {}
+        self._lock = threading.Lock()
+
+    def check(self, bus_id: str, lat: float, lon: float, now: float = None) -> str:
+        """
+        Classify a ping and, if accepted, make it the bus's new reference point.
+        Args:
+            bus_id (str): Bus ID.
+            lat (float): Latitude.
+            lon (float): Longitude.
+            now (float, optional): Monotonic receive time in seconds.
+        Returns:
+            str: ACCEPTED, STATIONARY, THROTTLED or JUMP.
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            state = self._buses.get(bus_id)
+            if state is None:
+                state = self._buses[bus_id] = _BusState()
+            verdict = self._classify(state, lat, lon, now)
+            state.counts[verdict] += 1
+            if verdict == ACCEPTED:
+                state.lat, state.lon, state.accepted_at = lat, lon, now
+                state.jump_rejects = 0
+            elif verdict == JUMP:
+                state.jump_rejects += 1
+            return verdict
+
+    @staticmethod
+    def _classify(state: _BusState, lat: float, lon: float, now: float) -> str:
+        if state.lat is None:
+            return ACCEPTED
+        elapsed = now - state.accepted_at
+        if elapsed < MIN_INTERVAL_S:
+            return THROTTLED
+        distance_km = haversine_distance(state.lat, state.lon, lat, lon)
+        if distance_km * 1000 < MIN_DISTANCE_M:
+            return ACCEPTED if elapsed >= KEEPALIVE_S else STATIONARY
+        # Pings a fraction of a second apart would imply absurd speeds from GPS noise alone
+        implied_kmh = distance_km / (max(elapsed, 1.0) / 3600)
+        if implied_kmh > MAX_SPEED_KMH and state.jump_rejects < MAX_JUMP_REJECTS:
+            return JUMP
+        return ACCEPTED
+
+    def forget(self, bus_id: str):
+        with self._lock:
+            self._buses.pop(bus_id, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            totals = {ACCEPTED: 0, STATIONARY: 0, THROTTLED: 0, JUMP: 0}
+            buses = {}
+            for bus_id, state in self._buses.items():
+                for key, value in state.counts.items():
+                    totals[key] += value
+                buses[bus_id] = dict(state.counts)
+            return {"totals": totals, "buses": buses}
+
+
+gps_filter = GpsFilter()
+register_metrics("gps_filter", gps_filter.stats)
@@ -0,0 +1,98 @@
+# Process-local snapshot of the latest location of every bus
+import threading
+import uuid
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from app.utils.metrics import register_metrics
+
+
+class LiveFleet:
+    """
+    Latest location per bus, updated by the ingest paths, with a fleet-wide
+    version that increases by one on every accepted update.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._locations: Dict[str, dict] = {}
+        self._versions: Dict[str, int] = {}
+        self.version = 0
+        self.warmed = False
+        # Versions are per process; the epoch keeps tags from another worker or a restart from matching
+        self.epoch = uuid.uuid4().hex[:8]
+
+    def update(self, bus_id: str, loc_data: dict) -> int:
+        """
+        Store a bus's latest location.
+        Returns:
+            int: New fleet version.
+        """
+        with self._lock:
+            self.version += 1
+            self._locations[bus_id] = loc_data
+            self._versions[bus_id] = self.version
+            return self.version
+
+    def warm(self, locations: dict):
+        """
+        Seed the store from a Realtime DB bus_locations snapshot, keeping any
+        location that was already ingested by this process.
+        """
+        with self._lock:
+            for bus_id, loc_data in (locations or {}).items():
+                if bus_id in self._locations or not isinstance(loc_data, dict):
+                    continue
+                self.version += 1
+                self._locations[bus_id] = loc_data
+                self._versions[bus_id] = self.version
+            self.warmed = True
+
+    def get(self, bus_id: str):
+        return self._locations.get(bus_id)
+
+    def snapshot(self) -> Tuple[int, List[Tuple[str, dict]]]:
+        """
+        Returns:
+            tuple: (version, [(bus_id, location), ...]) taken atomically.
+        """
+        with self._lock:
+            return self.version, list(self._locations.items())
+
+    def changed_since(self, version: int, bus_ids: Optional[Iterable[str]] = None) -> Tuple[int, List[Tuple[str, dict]]]:
+        """
+        Buses whose latest location was stored after the given fleet version.
+        Args:
+            version (int): Fleet version the caller already has.
+            bus_ids (iterable, optional): Only consider these buses.
+        Returns:
+            tuple: (current version, [(bus_id, location), ...]) taken atomically.
+        """
+        with self._lock:
+            if bus_ids is None:
+                changed = [(b, self._locations[b]) for b, v in self._versions.items() if v > version]
+            else:
+                changed = [(b, self._locations[b]) for b in bus_ids if self._versions.get(b, 0) > version]
+            return self.version, changed
+
+    def tag(self, version: int) -> str:
+        """
+        Opaque token for a fleet version, used as the ETag value and as ?since=.
+        """
+        return f"{self.epoch}-{version}"
+
+    def parse_tag(self, tag: str) -> Optional[int]:
+        """
+        Returns:
+            int | None: The version in a tag issued by this process, else None.
+        """
+        epoch, _, version = (tag or "").strip().strip('"').rpartition("-")
+        if epoch != self.epoch or not version.isdigit() or int(version) > self.version:
+            return None
+        return int(version)
+
+    def stats(self) -> dict:
+        return {"buses": len(self._locations), "version": self.version, "epoch": self.epoch, "warmed": self.warmed}
+
+
+live_fleet = LiveFleet()
+register_metrics("live_fleet", live_fleet.stats)
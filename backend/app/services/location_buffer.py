@@ -0,0 +1,122 @@
+# Write-behind buffer for bus locations in the Realtime DB
+import os
+import threading
+import time
+
+from app.firebase import realtime_db
+from app.utils.metrics import register_metrics
+
+FLUSH_INTERVAL = float(os.getenv("LOCATION_FLUSH_INTERVAL", "1.0"))    # seconds
+MAX_BATCH_SIZE = int(os.getenv("LOCATION_FLUSH_MAX_BATCH", "500"))     # buses per update()
+
+
+class LocationWriteBuffer:
+    """
+    Keeps only the latest location per bus and writes the whole pending fleet
+    as one multi-path update() per tick instead of one set() per ping.
+    """
+
+    def __init__(self, ref, flush_interval: float = FLUSH_INTERVAL, max_batch_size: int = MAX_BATCH_SIZE):
+        self.ref = ref
+        self.flush_interval = flush_interval
+        self.max_batch_size = max(1, max_batch_size)
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.submitted = 0
+        self.coalesced = 0
+        self.written = 0
+        self.flushes = 0
+        self.errors = 0
+        self.last_flush_ms = 0.0
+
+    def submit(self, bus_id: str, loc_data: dict):
+        """
+        Queue a location for the next flush, replacing any unflushed one for the same bus.
+        Args:
+            bus_id (str): Bus ID (child key under bus_locations).
+            loc_data (dict): Location payload to store.
+        """
+        with self._lock:
+            if bus_id in self._pending:
+                self.coalesced += 1
+            self._pending[bus_id] = loc_data
+            self.submitted += 1
+
+    def flush(self) -> int:
+        """
+        Write all pending locations, max_batch_size buses per update() call.
+        Failed batches are re-queued unless a newer location arrived meanwhile.
+        Returns:
+            int: Number of bus locations written.
+        """
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            if not pending:
+                return 0
+            started = time.perf_counter()
+            items = list(pending.items())
+            written = 0
+            for i in range(0, len(items), self.max_batch_size):
+                batch = dict(items[i:i + self.max_batch_size])
+                try:
+                    self.ref.update(batch)
+                    written += len(batch)
+                    with self._lock:
+                        self.flushes += 1
+                except Exception as e:
+                    print(f"[LocationBuffer] Flush of {len(batch)} buses failed: {e}")
+                    with self._lock:
+                        self.errors += 1
+                        for bus_id, loc_data in batch.items():
+                            self._pending.setdefault(bus_id, loc_data)
+            with self._lock:
+                self.written += written
+                self.last_flush_ms = round((time.perf_counter() - started) * 1000, 2)
+            return written
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"[LocationBuffer] Flush loop error: {e}")
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="location-write-buffer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop the flush thread and write whatever is still pending.
+        """
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=self.flush_interval + 5)
+        self.flush()
+        if self._pending:
+            print(f"[LocationBuffer] {len(self._pending)} locations not written on shutdown")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "pending": len(self._pending),
+                "submitted": self.submitted,
+                "coalesced": self.coalesced,
+                "written": self.written,
+                "flushes": self.flushes,
+                "errors": self.errors,
+                "last_flush_ms": self.last_flush_ms,
+                "flush_interval_s": self.flush_interval,
+                "max_batch_size": self.max_batch_size,
+            }
+
+
+location_buffer = LocationWriteBuffer(realtime_db.child('bus_locations'))
+register_metrics("location_buffer", location_buffer.stats)
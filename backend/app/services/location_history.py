@@ -0,0 +1,144 @@
+# Fixed-capacity per-bus ring buffers of recent accepted locations
+import math
+import os
+import threading
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+from app.utils.metrics import register_metrics
+
+HISTORY_CAPACITY = int(os.getenv("LOCATION_HISTORY_CAPACITY", "900"))   # points per bus (~30 min at 2 s)
+IDLE_SECONDS = float(os.getenv("LOCATION_HISTORY_IDLE_SECONDS", "1800"))  # drop a bus's history after this long without a fix
+SWEEP_INTERVAL = 60.0                                                     # seconds between idle sweeps
+
+
+class TrackBuffer:
+    """
+    Ring buffer of (timestamp, lat, lon, speed) in packed arrays, so a bus costs
+    a fixed 28 bytes per slot no matter how long it has been running.
+    """
+
+    __slots__ = ("capacity", "ts", "lat", "lon", "speed", "start", "size")
+
+    def __init__(self, capacity: int = HISTORY_CAPACITY):
+        self.capacity = capacity
+        self.ts = array('d', bytes(8 * capacity))      # epoch seconds
+        self.lat = array('d', bytes(8 * capacity))
+        self.lon = array('d', bytes(8 * capacity))
+        self.speed = array('f', bytes(4 * capacity))   # km/h, NaN when unknown
+        self.start = 0
+        self.size = 0
+
+    def append(self, ts: float, lat: float, lon: float, speed: float):
+        if self.size < self.capacity:
+            slot = (self.start + self.size) % self.capacity
+            self.size += 1
+        else:
+            slot = self.start
+            self.start = (self.start + 1) % self.capacity
+        self.ts[slot] = ts
+        self.lat[slot] = lat
+        self.lon[slot] = lon
+        self.speed[slot] = speed
+
+    def _slot(self, i: int) -> int:
+        return (self.start + i) % self.capacity
+
+    @property
+    def last_ts(self) -> float:
+        return self.ts[self._slot(self.size - 1)] if self.size else 0.0
+
+    def first_index_since(self, ts: float) -> int:
+        # Timestamps are appended in receive order, so the ring is sorted: binary search
+        lo, hi = 0, self.size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.ts[self._slot(mid)] < ts:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def points(self, since_ts: float = 0.0, max_points: Optional[int] = None) -> List[Tuple[float, float, float, float]]:
+        """
+        Points newer than since_ts, oldest first, evenly thinned to max_points
+        (the latest point is always kept).
+        """
+        first = self.first_index_since(since_ts)
+        count = self.size - first
+        if count <= 0:
+            return []
+        indices = range(first, self.size)
+        if max_points and count > max_points:
+            step = count / max_points
+            indices = [self.size - 1 - int(k * step) for k in range(max_points)][::-1]
+        result = []
+        for i in indices:
+            slot = self._slot(i)
+            result.append((self.ts[slot], self.lat[slot], self.lon[slot], self.speed[slot]))
+        return result
+
+    @property
+    def nbytes(self) -> int:
+        return sum(a.itemsize * len(a) for a in (self.ts, self.lat, self.lon, self.speed))
+
+
+class LocationHistory:
+    """
+    Ring buffers for the buses that are reporting. A bus that has sent no fix for
+    idle_seconds (retired, or a one-off ID) has its buffer dropped, so memory
+    follows the active fleet rather than every bus ever seen.
+    """
+
+    def __init__(self, capacity: int = HISTORY_CAPACITY, idle_seconds: float = IDLE_SECONDS):
+        self.capacity = capacity
+        self.idle_seconds = idle_seconds
+        self._tracks: Dict[str, TrackBuffer] = {}
+        self._lock = threading.Lock()
+        self._swept_at = 0.0
+        self.evicted = 0
+
+    def append(self, bus_id: str, ts: float, lat: float, lon: float, speed: Optional[float]):
+        with self._lock:
+            if ts - self._swept_at >= SWEEP_INTERVAL:
+                self._evict_idle(ts)
+            track = self._tracks.get(bus_id)
+            if track is None:
+                track = self._tracks[bus_id] = TrackBuffer(self.capacity)
+            track.append(ts, lat, lon, math.nan if speed is None else speed)
+
+    def _evict_idle(self, now: float):
+        self._swept_at = now
+        cutoff = now - self.idle_seconds
+        idle = [bus_id for bus_id, track in self._tracks.items() if track.last_ts < cutoff]
+        for bus_id in idle:
+            del self._tracks[bus_id]
+        self.evicted += len(idle)
+
+    def trajectory(self, bus_id: str, since_ts: float = 0.0, max_points: Optional[int] = None):
+        """
+        Returns:
+            list | None: (ts, lat, lon, speed) tuples oldest first, or None for an unknown bus.
+        """
+        with self._lock:
+            track = self._tracks.get(bus_id)
+            if track is None:
+                return None
+            return track.points(since_ts, max_points)
+
+    def stats(self) -> dict:
+        with self._lock:
+            tracks = list(self._tracks.values())
+        per_bus = tracks[0].nbytes if tracks else self.capacity * 28
+        return {
+            "buses": len(tracks),
+            "capacity_per_bus": self.capacity,
+            "points": sum(t.size for t in tracks),
+            "bytes_per_bus": per_bus,
+            "total_bytes": per_bus * len(tracks),
+            "evicted": self.evicted,
+        }
+
+
+location_history = LocationHistory()
+register_metrics("location_history", location_history.stats)
@@ -0,0 +1,87 @@
+# Single entry point for accepted driver location updates
+import time
+from typing import Optional, Tuple
+
+from app.firebase import realtime_db
+from app.services.arrival_boards import arrival_boards
+from app.services.bus_assignments import get_cached_assignment
+from app.services.gps_archive import gps_archive
+from app.services.gps_filter import ACCEPTED, gps_filter
+from app.services.live_fleet import live_fleet
+from app.services.location_buffer import location_buffer
+from app.services.location_history import location_history
+from app.services.route_geometry import MAX_OFFSET_KM, route_geometry
+from app.services.spatial_index import bus_index
+from app.services.speed_profiles import speed_profiles
+from app.services.stop_tracker import stop_tracker
+
+
+def record_location(bus_id: str, loc_data: dict) -> Optional[int]:
+    """
+    Filter a bus location, then persist it (write-behind to Realtime DB) and update the in-memory fleet.
+    Args:
+        bus_id (str): Bus ID.
+        loc_data (dict): Location payload as stored under bus_locations/{bus_id}.
+    Returns:
+        int | None: Fleet version after this update, or None if the GPS filter suppressed it
+        (callers should then skip the broadcast too).
+    """
+    coords = _coords(loc_data)
+    if coords and gps_filter.check(bus_id, *coords) != ACCEPTED:
+        return None
+    location_buffer.submit(bus_id, loc_data)
+    if coords:
+        bus_index.update(bus_id, *coords)
+        now, speed = time.time(), _speed(loc_data)
+        location_history.append(bus_id, now, coords[0], coords[1], speed)
+        gps_archive.append(bus_id, now, coords[0], coords[1], speed)
+        _observe_route_progress(bus_id, coords[0], coords[1], speed, now)
+    return live_fleet.update(bus_id, loc_data)
+
+
+def _observe_route_progress(bus_id: str, lat: float, lon: float, speed: Optional[float], ts: float):
+    # Memory-only: buses whose assignment or route shape is not cached yet are skipped
+    assignment = get_cached_assignment(bus_id)
+    if not isinstance(assignment, dict) or not assignment.get('route_ids'):
+        return
+    route_id = assignment['route_ids'][0]
+    located = route_geometry.locate(route_id, None, lat, lon, bus_id, remember=True)
+    if located is None:
+        return
+    polyline, projection = located
+    if projection.offset_km <= MAX_OFFSET_KM:
+        speed_profiles.observe_position(bus_id, route_id, projection.along_km, projection.segment, ts)
+        arrival_boards.update_bus(bus_id, route_id, polyline, projection.along_km, speed, ts)
+        stop_tracker.update(bus_id, route_id, polyline, projection.along_km, lat, lon, ts)
+    else:
+        arrival_boards.remove_bus(bus_id)   # off its route: no longer heading for those stops
+
+
+def _speed(loc_data: dict) -> Optional[float]:
+    try:
+        return float(loc_data['speed'])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def _coords(loc_data: dict) -> Optional[Tuple[float, float]]:
+    try:
+        return float(loc_data['latitude']), float(loc_data['longitude'])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def warm_up():
+    """
+    Load the last known locations from Realtime DB once at startup.
+    """
+    try:
+        live_fleet.warm(realtime_db.child('bus_locations').get() or {})
+        for bus_id, loc_data in live_fleet.snapshot()[1]:
+            coords = _coords(loc_data)
+            if coords:
+                bus_index.update(bus_id, *coords)
+        print(f"[Ingest] Live fleet warmed with {live_fleet.stats()['buses']} buses")
+    except Exception as e:
+        print(f"[Ingest] Live fleet warm-up failed: {e}")
+
@@ -0,0 +1,87 @@
+# Shared Nominatim (OpenStreetMap) HTTP client: pooled connections, usage-policy rate limit
+import os
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from app.utils.metrics import register_metrics
+from app.utils.token_bucket import TokenBucket
+
+NOMINATIM_URL = os.getenv("NOMINATIM_URL", "https://nominatim.openstreetmap.org")
+USER_AGENT = os.getenv("NOMINATIM_USER_AGENT", "YatraOne/1.0 (contact@yatraone.com)")
+RATE_PER_S = float(os.getenv("NOMINATIM_RATE_PER_S", "1"))     # usage policy: at most 1 request/s (per process here)
+POOL_SIZE = int(os.getenv("NOMINATIM_POOL_SIZE", "4"))          # keep-alive connections
+TIMEOUT = float(os.getenv("NOMINATIM_TIMEOUT", "5"))            # seconds per request
+MAX_WAIT = float(os.getenv("NOMINATIM_MAX_WAIT", "120"))        # longest a caller queues for its turn
+
+
+class NominatimBusy(Exception):
+    """
+    The request would have waited longer than the caller allows for a rate-limit slot.
+    """
+
+
+class NominatimClient:
+    """
+    One requests.Session (TLS connections reused across requests) behind a
+    token bucket, so every Nominatim call in this process respects the rate
+    limit no matter how many threads make them.
+    """
+
+    def __init__(self, base_url: str = NOMINATIM_URL, rate: float = RATE_PER_S):
+        self.base_url = base_url.rstrip("/")
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers["User-Agent"] = USER_AGENT
+        self.bucket = TokenBucket(rate, burst=1.0)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.total_ms = 0.0
+
+    def get(self, path: str, params: dict, max_wait: float = MAX_WAIT, timeout: float = TIMEOUT):
+        """
+        GET {base_url}{path} and return the decoded JSON.
+        Args:
+            path (str): e.g. "/search" or "/reverse".
+            params (dict): Query parameters ("format" defaults to json).
+            max_wait (float): Longest to wait for a rate-limit slot.
+            timeout (float): HTTP timeout in seconds.
+        Raises:
+            NominatimBusy: No slot within max_wait.
+            requests.RequestException: HTTP or network failure.
+        """
+        if not self.bucket.acquire(max_wait):
+            raise NominatimBusy(f"Nominatim rate limit: no slot within {max_wait:g}s")
+        started = time.perf_counter()
+        try:
+            resp = self.session.get(self.base_url + path, params={"format": "json", **params}, timeout=timeout)
+            resp.raise_for_status()
+            return resp.json()
+        except Exception:
+            with self._lock:
+                self.errors += 1
+            raise
+        finally:
+            with self._lock:
+                self.requests += 1
+                self.total_ms += (time.perf_counter() - started) * 1000
+
+    def close(self):
+        self.session.close()
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "avg_ms": round(self.total_ms / self.requests, 1) if self.requests else 0.0,
+            "rate_limit": self.bucket.stats(),
+        }
+
+
+nominatim = NominatimClient()
+register_metrics("nominatim", nominatim.stats)
@@ -0,0 +1,148 @@
+# Reverse geocoding through Nominatim, cached per grid cell in memory and on disk
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from typing import Tuple
+
+from app.services.nominatim import nominatim
+from app.utils.geo import KM_PER_DEG
+from app.utils.metrics import register_metrics
+from app.utils.singleflight import SingleFlight
+from app.utils.sqlite_cache import SqliteCache
+from app.utils.ttl_cache import MISSING, TTLCache
+
+GRID_M = float(os.getenv("REVERSE_GEOCODE_GRID_M", "50"))                     # positions in one cell share an address
+TTL = float(os.getenv("REVERSE_GEOCODE_TTL", str(30 * 86400)))                # seconds; addresses rarely change
+MEMORY_SIZE = int(os.getenv("REVERSE_GEOCODE_CACHE_SIZE", "20000"))
+DB_PATH = os.getenv("REVERSE_GEOCODE_DB", "data/reverse_geocode.sqlite3")
+UPSTREAM_TIMEOUT = float(os.getenv("REVERSE_GEOCODE_TIMEOUT", "5"))           # includes waiting for a rate-limit slot
+RATE_WINDOW_S = 60
+
+
+class ReverseGeocoder:
+    """
+    Coordinates are snapped to a GRID_M grid and the cell centre is looked up,
+    so every position within a cell is one cache entry. Lookups go memory LRU
+    -> SQLite -> Nominatim, and concurrent misses for the same cell wait for a
+    single upstream request.
+    """
+
+    def __init__(self, grid_m: float = GRID_M, ttl: float = TTL, path: str = DB_PATH):
+        self.grid_m = grid_m
+        self.ttl = ttl
+        self._memory = TTLCache(ttl=ttl, maxsize=MEMORY_SIZE)
+        self._disk = SqliteCache(path, "geocode")
+        self._flight = SingleFlight()
+        self._upstream_times = deque()
+        self._rate_lock = threading.Lock()
+        self.lookups = 0
+        self.disk_hits = 0
+        self.upstream_calls = 0
+        self.upstream_errors = 0
+        self.disk_errors = 0
+
+    def cell(self, lat: float, lon: float) -> Tuple[str, float, float]:
+        """
+        Returns:
+            tuple: (cache key, cell centre latitude, cell centre longitude).
+        """
+        dlat = self.grid_m / 1000 / KM_PER_DEG
+        row = math.floor(lat / dlat)
+        center_lat = (row + 0.5) * dlat
+        # Longitude cells are widened with latitude so cells stay about grid_m square
+        dlon = dlat / max(math.cos(math.radians(center_lat)), 1e-6)
+        col = math.floor(lon / dlon)
+        return f"{self.grid_m:g}:{row}:{col}", round(center_lat, 6), round((col + 0.5) * dlon, 6)
+
+    def lookup(self, lat: float, lon: float) -> dict:
+        """
+        Nominatim reverse result (display_name, address, ...) for the position's grid cell.
+        Raises:
+            NominatimBusy | requests.RequestException: Nominatim unavailable and nothing was cached.
+        """
+        self.lookups += 1
+        key, center_lat, center_lon = self.cell(lat, lon)
+        value = self._memory.get(key)
+        if value is not MISSING:
+            return value
+        try:
+            stored = self._disk.get(key)
+        except sqlite3.Error as e:
+            self.disk_errors += 1
+            print(f"[ReverseGeocode] Disk cache read failed: {e}")
+            stored = None
+        if stored is not None:
+            value, expires_at = stored
+            self.disk_hits += 1
+            self._memory.set(key, value, ttl=max(expires_at - time.time(), 0.0))
+            return value
+        return self._flight.do(key, lambda: self._fetch(key, center_lat, center_lon))
+
+    def address(self, lat: float, lon: float) -> str:
+        """
+        Display name of a position, or "lat,lon" if it cannot be resolved.
+        """
+        try:
+            return self.lookup(lat, lon).get('display_name') or f"{lat},{lon}"
+        except Exception:
+            return f"{lat},{lon}"
+
+    def _fetch(self, key: str, lat: float, lon: float) -> dict:
+        # Another thread may have filled the cache while this one queued for the flight
+        value = self._memory.get(key)
+        if value is not MISSING:
+            return value
+        self.upstream_calls += 1
+        self._record_upstream()
+        try:
+            # Interactive callers (SMS, map) would rather fall back than queue behind route imports
+            value = nominatim.get("/reverse", {"lat": lat, "lon": lon, "accept-language": "en"},
+                                  max_wait=UPSTREAM_TIMEOUT, timeout=UPSTREAM_TIMEOUT)
+        except Exception:
+            self.upstream_errors += 1
+            raise
+        self._memory.set(key, value)
+        try:
+            self._disk.set(key, value, time.time() + self.ttl)
+        except sqlite3.Error as e:
+            self.disk_errors += 1
+            print(f"[ReverseGeocode] Disk cache write failed: {e}")
+        return value
+
+    def _record_upstream(self):
+        now = time.monotonic()
+        self._upstream_times.append(now)
+        self._trim_rate_window(now)
+
+    def _trim_rate_window(self, now: float):
+        with self._rate_lock:
+            times = self._upstream_times
+            while times and times[0] < now - RATE_WINDOW_S:
+                times.popleft()
+
+    def close(self):
+        self._disk.close()
+
+    def stats(self) -> dict:
+        self._trim_rate_window(time.monotonic())
+        served = self.lookups - self.upstream_calls
+        return {
+            "grid_m": self.grid_m,
+            "lookups": self.lookups,
+            "hit_ratio": round(served / self.lookups, 4) if self.lookups else None,
+            "memory": self._memory.stats(),
+            "disk_hits": self.disk_hits,
+            "disk_entries": self._disk.size(),
+            "disk_errors": self.disk_errors,
+            "upstream_calls": self.upstream_calls,
+            "upstream_calls_per_min": len(self._upstream_times),
+            "upstream_errors": self.upstream_errors,
+            "single_flight": self._flight.stats(),
+        }
+
+
+reverse_geocoder = ReverseGeocoder()
+register_metrics("reverse_geocode", reverse_geocoder.stats)
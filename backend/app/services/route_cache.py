@@ -0,0 +1,54 @@
+# In-memory cache of route documents for the ETA and SMS paths
+import os
+from typing import Dict, Optional
+
+from app.firebase import firestore_db
+from app.utils.metrics import register_metrics
+from app.utils.ttl_cache import MISSING, TTLCache
+
+ROUTE_TTL = float(os.getenv("ROUTE_CACHE_TTL", "600"))              # seconds; routes change a few times a day
+ROUTE_CACHE_SIZE = int(os.getenv("ROUTE_CACHE_SIZE", "2000"))
+
+_cache = TTLCache(ttl=ROUTE_TTL, maxsize=ROUTE_CACHE_SIZE)
+
+
+def get_route(route_id: str) -> Optional[dict]:
+    """
+    Route document, from memory or Firestore on a miss (blocking).
+    The returned dict is shared between callers and must not be modified.
+    Args:
+        route_id (str): Route ID.
+    Returns:
+        dict | None: Route document, or None if the route does not exist.
+    """
+    route = _cache.get(route_id)
+    if route is MISSING:
+        doc = firestore_db.collection('routes').document(route_id).get()
+        route = doc.to_dict() if doc.exists else None
+        _cache.set(route_id, route)
+    return route
+
+
+def put_route(route_id: str, route: dict):
+    """
+    Store a route document just written, so the next read does not go to Firestore.
+    """
+    _cache.set(route_id, route)
+
+
+def warm_routes(routes: Dict[str, dict]):
+    """
+    Seed the cache from a full routes collection read (startup).
+    """
+    for route_id, route in routes.items():
+        _cache.set(route_id, route)
+
+
+def invalidate_route(route_id: str):
+    """
+    Drop a route from the cache; call after any write to routes/{route_id}.
+    """
+    _cache.invalidate(route_id)
+
+
+register_metrics("route_cache", _cache.stats)
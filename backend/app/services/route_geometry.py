@@ -0,0 +1,220 @@
+# Route polylines with cumulative distance, for along-route ETAs
+import math
+import os
+import threading
+from bisect import bisect_left, bisect_right
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from app.utils.geo import KM_PER_DEG, haversine_distance
+from app.utils.metrics import register_metrics
+
+WINDOW_BEHIND_KM = float(os.getenv("ROUTE_PROJECTION_WINDOW_BEHIND_KM", "0.5"))   # GPS noise backwards
+WINDOW_AHEAD_KM = float(os.getenv("ROUTE_PROJECTION_WINDOW_AHEAD_KM", "5"))       # travel since the last lookup
+MAX_OFFSET_KM = float(os.getenv("ROUTE_PROJECTION_MAX_OFFSET_KM", "0.5"))         # farther off = search the whole route
+
+
+class Projection(NamedTuple):
+    along_km: float     # distance from the route start to the projected point
+    offset_km: float    # distance from the bus to the route
+    segment: int        # index of the segment (vertex i -> i + 1)
+
+
+def _coord(lat, lon) -> Optional[Tuple[float, float]]:
+    try:
+        lat, lon = float(lat), float(lon)
+    except (TypeError, ValueError):
+        return None
+    # Routes created before geocoding worked carry 0/0 placeholders
+    if lat == 0 and lon == 0:
+        return None
+    return lat, lon
+
+
+class RoutePolyline:
+    """
+    start -> stops (in order) -> end, with the cumulative distance at each
+    vertex so any along-route distance is a subtraction.
+    """
+
+    def __init__(self, route: dict):
+        vertices: List[Tuple[float, float]] = []
+        self.stop_vertices: Dict[int, int] = {}   # stop index -> vertex index
+        self.stop_names: Dict[int, str] = {}
+        start = _coord(route.get('start_latitude'), route.get('start_longitude'))
+        if start:
+            vertices.append(start)
+        for index, stop in enumerate(route.get('stops') or []):
+            if not isinstance(stop, dict):
+                continue
+            point = _coord(stop.get('latitude'), stop.get('longitude'))
+            if point is None:
+                continue
+            self.stop_vertices[index] = len(vertices)
+            self.stop_names[index] = stop.get('name') or f"Stop {index + 1}"
+            vertices.append(point)
+        end = _coord(route.get('end_latitude'), route.get('end_longitude'))
+        if end:
+            vertices.append(end)
+        self.lats = [v[0] for v in vertices]
+        self.lons = [v[1] for v in vertices]
+        self.cum_km = [0.0]
+        for i in range(1, len(vertices)):
+            self.cum_km.append(self.cum_km[-1] + haversine_distance(self.lats[i - 1], self.lons[i - 1], self.lats[i], self.lons[i]))
+        # Stops in route order with their along-route distance (non-decreasing, so bisectable)
+        self.stop_order = list(self.stop_vertices)
+        self.stop_km = [self.cum_km[v] for v in self.stop_vertices.values()]
+
+    @property
+    def length_km(self) -> float:
+        return self.cum_km[-1]
+
+    @property
+    def usable(self) -> bool:
+        return len(self.lats) >= 2
+
+    def stop_along_km(self, stop_index: int) -> Optional[float]:
+        vertex = self.stop_vertices.get(stop_index)
+        return None if vertex is None else self.cum_km[vertex]
+
+    def _project_segment(self, i: int, lat: float, lon: float, kx: float) -> Tuple[float, float]:
+        # Local equirectangular frame around the bus; segments are a few km at most
+        ax, ay = (self.lons[i] - lon) * kx, (self.lats[i] - lat) * KM_PER_DEG
+        bx, by = (self.lons[i + 1] - lon) * kx, (self.lats[i + 1] - lat) * KM_PER_DEG
+        dx, dy = bx - ax, by - ay
+        seg2 = dx * dx + dy * dy
+        t = 0.0 if seg2 == 0 else min(1.0, max(0.0, -(ax * dx + ay * dy) / seg2))
+        px, py = ax + t * dx, ay + t * dy
+        return math.hypot(px, py), self.cum_km[i] + t * (self.cum_km[i + 1] - self.cum_km[i])
+
+    def _best(self, segments, lat: float, lon: float) -> Optional[Projection]:
+        kx = KM_PER_DEG * math.cos(math.radians(lat))
+        best = None
+        for i in segments:
+            offset, along = self._project_segment(i, lat, lon, kx)
+            if best is None or offset < best.offset_km:
+                best = Projection(along, offset, i)
+        return best
+
+    def project(self, lat: float, lon: float, near_km: Optional[float] = None) -> Optional[Projection]:
+        """
+        Snap a position onto the route.
+        Args:
+            lat (float): Latitude.
+            lon (float): Longitude.
+            near_km (float, optional): Last known along-route distance of this bus. Only
+                the segments within the window around it are tried (found by bisecting
+                the cumulative distances), falling back to the whole route if the bus is
+                not near any of them.
+        Returns:
+            Projection | None: None if the route has fewer than two usable points.
+        """
+        if not self.usable:
+            return None
+        n_segments = len(self.lats) - 1
+        if near_km is not None:
+            lo = max(bisect_right(self.cum_km, near_km - WINDOW_BEHIND_KM) - 1, 0)
+            hi = min(bisect_left(self.cum_km, near_km + WINDOW_AHEAD_KM), n_segments)
+            best = self._best(range(lo, max(hi, lo + 1)), lat, lon)
+            if best is not None and best.offset_km <= MAX_OFFSET_KM:
+                return best
+        return self._best(range(n_segments), lat, lon)
+
+    def downstream_stops(self, along_km: float) -> List[Tuple[int, str, float]]:
+        """
+        Returns:
+            list: (stop_index, name, remaining_km) for stops not yet passed, in route order.
+        """
+        first = bisect_left(self.stop_km, along_km)
+        return [
+            (index, self.stop_names[index], self.stop_km[i] - along_km)
+            for i, index in enumerate(self.stop_order[first:], first)
+        ]
+
+
+class RouteGeometry:
+    """
+    Polyline per route plus the last along-route position per (bus, route),
+    used as the search hint for the next projection.
+    """
+
+    def __init__(self):
+        self._polylines: Dict[str, RoutePolyline] = {}
+        self._last_along: Dict[Tuple[str, str], float] = {}
+        self._lock = threading.Lock()
+        self.builds = 0
+        self.projections = 0
+        self.hinted = 0
+
+    def polyline(self, route_id: str, route: Optional[dict] = None) -> Optional[RoutePolyline]:
+        """
+        Cached polyline of a route, built from the route document on first use.
+        """
+        polyline = self._polylines.get(route_id)
+        if polyline is None and route is not None:
+            polyline = self.set_route(route_id, route)
+        return polyline
+
+    def set_route(self, route_id: str, route: dict) -> RoutePolyline:
+        polyline = RoutePolyline(route)
+        with self._lock:
+            self._polylines[route_id] = polyline
+            self.builds += 1
+            # Along-route distances from the old shape are meaningless now
+            for key in [k for k in self._last_along if k[1] == route_id]:
+                del self._last_along[key]
+        return polyline
+
+    def remove_route(self, route_id: str):
+        with self._lock:
+            self._polylines.pop(route_id, None)
+            for key in [k for k in self._last_along if k[1] == route_id]:
+                del self._last_along[key]
+
+    def load_routes(self, routes: Dict[str, dict]):
+        polylines = {route_id: RoutePolyline(route or {}) for route_id, route in routes.items()}
+        with self._lock:
+            self._polylines = polylines
+            self._last_along = {}
+            self.builds += len(polylines)
+
+    def locate(self, route_id: str, route: Optional[dict], lat: float, lon: float,
+               bus_id: Optional[str] = None, remember: bool = False) -> Optional[Tuple[RoutePolyline, Projection]]:
+        """
+        Project a bus onto its route, starting near where it was last seen.
+        Args:
+            route_id (str): Route ID.
+            route (dict, optional): Route document, to build the polyline if it is not cached.
+            lat (float): Latitude.
+            lon (float): Longitude.
+            bus_id (str, optional): Bus whose last along-route position is the search hint.
+            remember (bool): Store this projection as the bus's hint. Only live ingest
+                should; positions from ETA queries may be stale or client-supplied.
+        Returns:
+            tuple | None: (polyline, projection), or None if the route has no usable shape.
+        """
+        polyline = self.polyline(route_id, route)
+        if polyline is None:
+            return None
+        near = self._last_along.get((bus_id, route_id)) if bus_id else None
+        projection = polyline.project(lat, lon, near)
+        if projection is None:
+            return None
+        self.projections += 1
+        if near is not None:
+            self.hinted += 1
+        if bus_id and remember:
+            self._last_along[(bus_id, route_id)] = projection.along_km
+        return polyline, projection
+
+    def stats(self) -> dict:
+        return {
+            "routes": len(self._polylines),
+            "tracked_buses": len(self._last_along),
+            "builds": self.builds,
+            "projections": self.projections,
+            "hinted": self.hinted,
+        }
+
+
+route_geometry = RouteGeometry()
+register_metrics("route_geometry", route_geometry.stats)
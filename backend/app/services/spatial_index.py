@@ -0,0 +1,139 @@
+# Uniform lat/lon grid index of live bus positions for radius and k-nearest queries
+import math
+import os
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from app.utils.geo import KM_PER_DEG, haversine_distance
+from app.utils.metrics import register_metrics
+
+CELL_DEG = float(os.getenv("SPATIAL_INDEX_CELL_DEG", "0.01"))   # ~1.1 km cells
+
+Cell = Tuple[int, int]
+
+
+class GridIndex:
+    """
+    Buses bucketed by grid cell. Moving a bus is O(1); a query only visits the
+    cells overlapping the search area, so cost depends on local density rather
+    than fleet size.
+    """
+
+    def __init__(self, cell_deg: float = CELL_DEG):
+        self.cell_deg = cell_deg
+        self._cells: Dict[Cell, Dict[str, Tuple[float, float]]] = {}
+        self._bus_cells: Dict[str, Cell] = {}
+        self._bounds: Optional[List[int]] = None   # [i_min, i_max, j_min, j_max] ever occupied
+        self._lock = threading.Lock()
+
+    def _cell(self, lat: float, lon: float) -> Cell:
+        return math.floor(lat / self.cell_deg), math.floor(lon / self.cell_deg)
+
+    def __len__(self):
+        return len(self._bus_cells)
+
+    def update(self, bus_id: str, lat: float, lon: float):
+        cell = self._cell(lat, lon)
+        with self._lock:
+            old = self._bus_cells.get(bus_id)
+            if old is not None and old != cell:
+                bucket = self._cells[old]
+                del bucket[bus_id]
+                if not bucket:
+                    del self._cells[old]
+            self._cells.setdefault(cell, {})[bus_id] = (lat, lon)
+            self._bus_cells[bus_id] = cell
+            b = self._bounds
+            if b is None:
+                self._bounds = [cell[0], cell[0], cell[1], cell[1]]
+            else:
+                b[0], b[1] = min(b[0], cell[0]), max(b[1], cell[0])
+                b[2], b[3] = min(b[2], cell[1]), max(b[3], cell[1])
+
+    def remove(self, bus_id: str):
+        with self._lock:
+            cell = self._bus_cells.pop(bus_id, None)
+            if cell is not None:
+                bucket = self._cells[cell]
+                bucket.pop(bus_id, None)
+                if not bucket:
+                    del self._cells[cell]
+
+    def _lon_cell_km(self, lat: float) -> float:
+        return self.cell_deg * KM_PER_DEG * max(math.cos(math.radians(lat)), 1e-6)
+
+    def within(self, lat: float, lon: float, radius_km: float) -> List[Tuple[float, str]]:
+        """
+        Buses within radius_km of a point.
+        Returns:
+            list: (distance_km, bus_id) sorted by distance.
+        """
+        dlat = radius_km / KM_PER_DEG
+        dlon = radius_km / (KM_PER_DEG * max(math.cos(math.radians(lat)), 1e-6))
+        i0, j0 = self._cell(lat - dlat, lon - dlon)
+        i1, j1 = self._cell(lat + dlat, lon + dlon)
+        found = []
+        with self._lock:
+            cells = self._cells
+            for i in range(i0, i1 + 1):
+                for j in range(j0, j1 + 1):
+                    bucket = cells.get((i, j))
+                    if not bucket:
+                        continue
+                    for bus_id, (blat, blon) in bucket.items():
+                        d = haversine_distance(lat, lon, blat, blon)
+                        if d <= radius_km:
+                            found.append((d, bus_id))
+        found.sort()
+        return found
+
+    def nearest(self, lat: float, lon: float, k: int, max_radius_km: Optional[float] = None) -> List[Tuple[float, str]]:
+        """
+        The k buses closest to a point, searching rings of cells outward until
+        the k-th candidate is provably closer than anything in unvisited cells.
+        Returns:
+            list: Up to k (distance_km, bus_id) sorted by distance.
+        """
+        if k <= 0:
+            return []
+        ci, cj = self._cell(lat, lon)
+        # Any point outside ring r is at least r * min_cell_km away
+        min_cell_km = min(self.cell_deg * KM_PER_DEG, self._lon_cell_km(lat))
+        found: List[Tuple[float, str]] = []
+        with self._lock:
+            if not self._bus_cells:
+                return []
+            cells = self._cells
+            if max_radius_km is not None:
+                max_ring = int(max_radius_km / min_cell_km) + 1
+            else:
+                # Far enough to cover every occupied cell
+                i_min, i_max, j_min, j_max = self._bounds
+                max_ring = max(abs(i_min - ci), abs(i_max - ci), abs(j_min - cj), abs(j_max - cj))
+            r = 0
+            while r <= max_ring:
+                for i in range(ci - r, ci + r + 1):
+                    step = 1 if abs(i - ci) == r else 2 * r
+                    for j in range(cj - r, cj + r + 1, step):
+                        bucket = cells.get((i, j))
+                        if not bucket:
+                            continue
+                        for bus_id, (blat, blon) in bucket.items():
+                            found.append((haversine_distance(lat, lon, blat, blon), bus_id))
+                if len(found) >= k:
+                    found.sort()
+                    del found[k:]
+                    if found[-1][0] <= r * min_cell_km:
+                        break
+                r += 1
+        found.sort()
+        if max_radius_km is not None:
+            found = [f for f in found if f[0] <= max_radius_km]
+        return found[:k]
+
+    def stats(self) -> dict:
+        return {"buses": len(self._bus_cells), "cells": len(self._cells), "cell_deg": self.cell_deg}
+
+
+bus_index = GridIndex()
+register_metrics("spatial_index", bus_index.stats)
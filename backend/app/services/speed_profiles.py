@@ -0,0 +1,265 @@
+# Observed speed per route segment and time of day, as small decaying histograms
+import json
+import os
+import threading
+import time
+from array import array
+from bisect import bisect_right
+from typing import Dict, List, Optional, Tuple
+
+from app.utils.metrics import register_metrics
+
+BUCKET_MINUTES = int(os.getenv("SPEED_PROFILE_BUCKET_MINUTES", "30"))
+HALF_LIFE_DAYS = float(os.getenv("SPEED_PROFILE_HALF_LIFE_DAYS", "14"))          # older observations fade out
+MIN_WEIGHT = float(os.getenv("SPEED_PROFILE_MIN_WEIGHT", "3"))                   # below this, no estimate
+TZ_OFFSET_MIN = int(os.getenv("SPEED_PROFILE_TZ_OFFSET_MIN", "330"))             # service-local time (IST)
+PERSIST_PATH = os.getenv("SPEED_PROFILE_PATH", "data/speed_profiles.json")
+PERSIST_INTERVAL = float(os.getenv("SPEED_PROFILE_PERSIST_INTERVAL", "300"))    # seconds
+MIN_OBSERVATION_S = 5.0          # closer pings give noisy speeds
+MAX_OBSERVATION_S = 300.0        # longer gaps span several segments / a break
+MIN_SPEED_KMH = 3.0              # floor so a segment dominated by dwell time cannot blow up an ETA
+
+BIN_KMH = 5.0
+N_BINS = 18                      # 0-5, 5-10, ... 85+ km/h
+SLOTS_PER_DAY = 24 * 60 // BUCKET_MINUTES
+
+Key = Tuple[str, int, int]       # (route_id, segment, slot)
+
+
+def time_slot(ts: float) -> int:
+    """
+    Time-of-day bucket of a timestamp, split into weekday and weekend days.
+    """
+    local = ts + TZ_OFFSET_MIN * 60
+    day = int(local // 86400)
+    weekend = (day + 3) % 7 >= 5            # 1970-01-01 was a Thursday
+    minute_of_day = int(local % 86400) // 60
+    return (SLOTS_PER_DAY if weekend else 0) + minute_of_day // BUCKET_MINUTES
+
+
+class _Histogram:
+    __slots__ = ("counts", "updated")
+
+    def __init__(self, counts=None, updated: float = 0.0):
+        self.counts = array('f', counts if counts is not None else bytes(4 * N_BINS))
+        self.updated = updated
+
+    def decay_to(self, now: float):
+        if self.updated and now > self.updated:
+            factor = 0.5 ** ((now - self.updated) / (HALF_LIFE_DAYS * 86400))
+            counts = self.counts
+            for i in range(N_BINS):
+                counts[i] *= factor
+        self.updated = now
+
+    def median(self) -> Optional[float]:
+        total = sum(self.counts)
+        if total < MIN_WEIGHT:
+            return None
+        half, seen = total / 2, 0.0
+        for i, c in enumerate(self.counts):
+            if seen + c >= half and c > 0:
+                return (i + (half - seen) / c) * BIN_KMH
+            seen += c
+        return (N_BINS - 0.5) * BIN_KMH
+
+
+class SpeedProfiles:
+    """
+    Streaming aggregator: consecutive positions of a bus on its route become
+    a traversal speed for the segment it is on, added in O(1) to the
+    histogram of (route, segment, time slot).
+    """
+
+    def __init__(self, path: str = PERSIST_PATH, persist_interval: float = PERSIST_INTERVAL):
+        self.path = path
+        self.persist_interval = persist_interval
+        self._histograms: Dict[Key, _Histogram] = {}
+        self._last: Dict[str, Tuple[str, float, float]] = {}   # bus_id -> (route_id, along_km, ts)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.observations = 0
+        self.dirty = False
+        self.last_persist_ms = 0.0
+
+    def observe(self, route_id: str, segment: int, speed_kmh: float, ts: float):
+        slot = time_slot(ts)
+        bin_index = min(int(max(speed_kmh, 0.0) // BIN_KMH), N_BINS - 1)
+        with self._lock:
+            key = (route_id, segment, slot)
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = _Histogram()
+            histogram.decay_to(ts)
+            histogram.counts[bin_index] += 1.0
+            self.observations += 1
+            self.dirty = True
+
+    def observe_position(self, bus_id: str, route_id: str, along_km: float, segment: int, ts: float):
+        """
+        Feed one projected position of a bus; the speed since its previous one is recorded.
+        """
+        previous = self._last.get(bus_id)
+        self._last[bus_id] = (route_id, along_km, ts)
+        if previous is None or previous[0] != route_id:
+            return
+        elapsed = ts - previous[2]
+        progress = along_km - previous[1]
+        # Going backwards means a new trip or a bad projection, not a speed
+        if not MIN_OBSERVATION_S <= elapsed <= MAX_OBSERVATION_S or progress < 0:
+            return
+        self.observe(route_id, segment, progress / (elapsed / 3600), ts)
+
+    def speed(self, route_id: str, segment: int, ts: Optional[float] = None) -> Optional[float]:
+        """
+        Median observed speed (km/h) for the segment at that time of day, or None without enough data.
+        """
+        now = time.time()
+        histogram = self._histograms.get((route_id, segment, time_slot(now if ts is None else ts)))
+        if histogram is None:
+            return None
+        with self._lock:
+            histogram.decay_to(max(now, histogram.updated))
+            median = histogram.median()
+        return None if median is None else max(median, MIN_SPEED_KMH)
+
+    def travel_minutes(self, route_id: str, polyline, from_km: float, to_km: float,
+                       fallback_kmh: Optional[float], ts: Optional[float] = None) -> Optional[float]:
+        """
+        Minutes to cover [from_km, to_km] along a route polyline, segment by segment,
+        using the profile speed where there is one and fallback_kmh elsewhere.
+        Returns:
+            float | None: None if some segment has neither a profile nor a fallback.
+        """
+        return self.travel_minutes_many(route_id, polyline, from_km, [to_km], fallback_kmh, ts)[0]
+
+    def travel_minutes_many(self, route_id: str, polyline, from_km: float, targets_km: List[float],
+                            fallback_kmh: Optional[float], ts: Optional[float] = None) -> List[Optional[float]]:
+        """
+        travel_minutes to several points in one walk over the segments up to the farthest one.
+        Targets behind from_km take 0 minutes.
+        """
+        ts = time.time() if ts is None else ts
+        cum = polyline.cum_km
+        n_segments = len(cum) - 1
+        if n_segments < 1 or not targets_km:
+            return [None] * len(targets_km)
+        first = min(max(bisect_right(cum, from_km) - 1, 0), n_segments - 1)
+        farthest = max(targets_km)
+        # Minutes from from_km to the start of each segment, and the speed used on it
+        prefix: Dict[int, Optional[float]] = {}
+        speeds: Dict[int, Optional[float]] = {}
+        minutes: Optional[float] = 0.0
+        for i in range(first, n_segments):
+            if cum[i] > farthest:
+                break
+            prefix[i] = minutes
+            if minutes is None:
+                continue
+            # Later segments are reached later: look up the time slot of arrival there
+            speed = self.speed(route_id, i, ts + minutes * 60) or fallback_kmh
+            speeds[i] = speed if speed and speed > 0 else None
+            if speeds[i] is None:
+                minutes = None
+                continue
+            minutes += (cum[i + 1] - max(cum[i], from_km)) / speeds[i] * 60
+        results: List[Optional[float]] = []
+        for target in targets_km:
+            if target <= from_km:
+                results.append(0.0)
+                continue
+            i = min(max(bisect_right(cum, target) - 1, first), n_segments - 1)
+            if prefix.get(i) is None or speeds.get(i) is None:
+                results.append(None)
+            else:
+                results.append(prefix[i] + (target - max(cum[i], from_km)) / speeds[i] * 60)
+        return results
+
+    # ---- persistence -------------------------------------------------
+
+    def save(self):
+        with self._lock:
+            data = {
+                f"{route_id}|{segment}|{slot}": [h.updated, list(h.counts)]
+                for (route_id, segment, slot), h in self._histograms.items()
+            }
+            self.dirty = False
+        started = time.perf_counter()
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"bucket_minutes": BUCKET_MINUTES, "bins": N_BINS, "histograms": data}, f)
+        os.replace(tmp, self.path)
+        self.last_persist_ms = round((time.perf_counter() - started) * 1000, 2)
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            print(f"[SpeedProfiles] Could not read {self.path}: {e}")
+            return
+        if data.get("bucket_minutes") != BUCKET_MINUTES or data.get("bins") != N_BINS:
+            print("[SpeedProfiles] Stored profiles use a different bucketing; starting fresh")
+            return
+        histograms = {}
+        for key, (updated, counts) in data.get("histograms", {}).items():
+            route_id, segment, slot = key.rsplit("|", 2)
+            histograms[(route_id, int(segment), int(slot))] = _Histogram(counts, updated)
+        with self._lock:
+            histograms.update(self._histograms)
+            self._histograms = histograms
+        print(f"[SpeedProfiles] Loaded {len(histograms)} histograms")
+
+    def _run(self):
+        while not self._stop.wait(self.persist_interval):
+            if self.dirty:
+                try:
+                    self.save()
+                except Exception as e:
+                    print(f"[SpeedProfiles] Persist failed: {e}")
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self.load()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="speed-profiles", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+        if self.dirty:
+            try:
+                self.save()
+            except Exception as e:
+                print(f"[SpeedProfiles] Persist failed: {e}")
+
+    def forget_route(self, route_id: str):
+        """
+        Drop a route's profiles (its segments no longer mean the same thing).
+        """
+        with self._lock:
+            for key in [k for k in self._histograms if k[0] == route_id]:
+                del self._histograms[key]
+            self.dirty = True
+
+    def stats(self) -> dict:
+        return {
+            "histograms": len(self._histograms),
+            "tracked_buses": len(self._last),
+            "observations": self.observations,
+            "bytes": len(self._histograms) * N_BINS * 4,
+            "last_persist_ms": self.last_persist_ms,
+        }
+
+
+speed_profiles = SpeedProfiles()
+register_metrics("speed_profiles", speed_profiles.stats)
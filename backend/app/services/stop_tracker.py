@@ -0,0 +1,133 @@
+# Which stop each bus is at / heading to, advanced as its positions arrive
+import os
+import threading
+from bisect import bisect_right
+from typing import Dict, Optional
+
+from app.utils.geo import haversine_distance
+from app.utils.metrics import register_metrics
+
+ARRIVAL_RADIUS_KM = float(os.getenv("STOP_ARRIVAL_RADIUS_M", "50")) / 1000   # "at the stop" within this distance
+BACKTRACK_KM = float(os.getenv("STOP_TRACKER_BACKTRACK_M", "100")) / 1000    # GPS noise tolerated backwards
+TRIP_RESET_KM = float(os.getenv("STOP_TRACKER_TRIP_RESET_KM", "1"))          # bigger jumps back = new trip
+
+
+class _Progress:
+    __slots__ = ("route_id", "polyline", "position", "along_km", "at_stop", "updated")
+
+    def __init__(self, route_id: str, polyline, position: int, along_km: float, updated: float):
+        self.route_id = route_id
+        self.polyline = polyline
+        self.position = position     # index into polyline.stop_order of the last stop reached, -1 before the first
+        self.along_km = along_km
+        self.at_stop = False
+        self.updated = updated
+
+
+class StopTracker:
+    """
+    Per-bus state machine over its route's ordered stops. A stop is reached
+    when the bus comes within ARRIVAL_RADIUS_KM of it or has moved past it in
+    the direction of travel; the search only goes forward from the last
+    reached stop, so each stop is stepped over once per trip and an update is
+    O(1) amortized. Moving backwards never un-reaches a stop, except that a
+    jump back of more than TRIP_RESET_KM starts a new trip.
+    """
+
+    def __init__(self):
+        self._state: Dict[str, _Progress] = {}
+        self._lock = threading.Lock()
+        self.updates = 0
+        self.arrivals = 0
+        self.trips = 0
+
+    @staticmethod
+    def _seed(polyline, along_km: float) -> int:
+        # First sighting (or new trip): every stop behind the bus counts as passed
+        return bisect_right(polyline.stop_km, along_km) - 1
+
+    def _near(self, polyline, position: int, lat: float, lon: float) -> bool:
+        vertex = polyline.stop_vertices[polyline.stop_order[position]]
+        return haversine_distance(lat, lon, polyline.lats[vertex], polyline.lons[vertex]) <= ARRIVAL_RADIUS_KM
+
+    def update(self, bus_id: str, route_id: str, polyline, along_km: float, lat: float, lon: float, ts: float):
+        """
+        Feed one on-route position of a bus.
+        Args:
+            bus_id (str): Bus ID.
+            route_id (str): Route the bus is on.
+            polyline (RoutePolyline): The route's shape (a rebuilt shape restarts tracking).
+            along_km (float): Projected distance along the route.
+            lat (float): Latitude, for the arrival radius.
+            lon (float): Longitude.
+            ts (float): Time of the position.
+        """
+        stop_km = polyline.stop_km
+        with self._lock:
+            self.updates += 1
+            state = self._state.get(bus_id)
+            if state is None or state.route_id != route_id or state.polyline is not polyline:
+                state = self._state[bus_id] = _Progress(route_id, polyline, self._seed(polyline, along_km), along_km, ts)
+            elif along_km < state.along_km - TRIP_RESET_KM:
+                state.position = self._seed(polyline, along_km)
+                state.along_km = along_km
+                self.trips += 1
+            if along_km >= state.along_km - BACKTRACK_KM:
+                # Moving forward (or standing): step over every stop now reached
+                position = state.position
+                while position + 1 < len(stop_km) and (
+                        stop_km[position + 1] <= along_km or self._near(polyline, position + 1, lat, lon)):
+                    position += 1
+                self.arrivals += position - state.position
+                state.position = position
+            state.along_km = along_km
+            state.updated = ts
+            state.at_stop = state.position >= 0 and self._near(polyline, state.position, lat, lon)
+
+    def remove_bus(self, bus_id: str):
+        with self._lock:
+            self._state.pop(bus_id, None)
+
+    def progress(self, bus_id: str, route_id: Optional[str] = None) -> Optional[dict]:
+        """
+        Returns:
+            dict | None: route_id, current_stop and next_stop ({stop_index, name}, None
+            before the first / after the last stop; next_stop also has distance_km),
+            at_stop, stops_passed, stops_total, progress (0..1 of the route length) and
+            updated; None if the bus is not tracked (on route_id, when given).
+        """
+        state = self._state.get(bus_id)
+        if state is None or (route_id is not None and state.route_id != route_id):
+            return None
+        polyline, position = state.polyline, state.position
+        order = polyline.stop_order
+        current = next_stop = None
+        if position >= 0:
+            current = {"stop_index": order[position], "name": polyline.stop_names[order[position]]}
+        if position + 1 < len(order):
+            index = order[position + 1]
+            next_stop = {"stop_index": index, "name": polyline.stop_names[index],
+                         "distance_km": round(max(polyline.stop_km[position + 1] - state.along_km, 0.0), 2)}
+        length = polyline.length_km
+        return {
+            "route_id": state.route_id,
+            "current_stop": current,
+            "next_stop": next_stop,
+            "at_stop": state.at_stop,
+            "stops_passed": position + 1,
+            "stops_total": len(order),
+            "progress": round(min(state.along_km / length, 1.0), 3) if length > 0 else 0.0,
+            "updated": state.updated,
+        }
+
+    def stats(self) -> dict:
+        return {
+            "tracked_buses": len(self._state),
+            "updates": self.updates,
+            "arrivals": self.arrivals,
+            "trip_resets": self.trips,
+        }
+
+
+stop_tracker = StopTracker()
+register_metrics("stop_tracker", stop_tracker.stats)
@@ -0,0 +1,72 @@
+# Compact binary frame format for driver location updates over /ws/bus-location/{bus_id}
+#
+# Negotiated per connection with the WebSocket subprotocol "yatra.loc.v1". The driver
+# first sends one JSON text frame {"type": "hello", "driver_id": "..."}; the server answers
+# {"type": "hello_ack", "token": <n>} and from then on each location is one 21-byte
+# binary frame (little endian):
+#
+#   offset  size  field
+#   0       1     version (1)
+#   1       2     driver token (uint16, from hello_ack)
+#   3       4     latitude  * 1e7 (int32)
+#   7       4     longitude * 1e7 (int32)
+#   11      2     speed in 0.01 km/h (uint16, max 655.35)
+#   13      8     timestamp, ms since epoch UTC (uint64, 0 = use server time)
+#
+# Connections that do not request the subprotocol keep using JSON text frames.
+import struct
+
+SUBPROTOCOL_BINARY = "yatra.loc.v1"
+FRAME_VERSION = 1
+LOCATION_FRAME = struct.Struct("<BHiiHQ")
+FRAME_SIZE = LOCATION_FRAME.size
+
+_COORD_SCALE = 10_000_000
+_SPEED_SCALE = 100
+_MAX_SPEED = 0xFFFF
+MAX_TOKEN = 0xFFFF   # driver tokens are uint16
+
+
+def encode_location(token: int, latitude: float, longitude: float, speed: float, timestamp_ms: int = 0) -> bytes:
+    """
+    Build one binary location frame (used by clients and the benchmark).
+    Args:
+        token (int): Driver token from hello_ack.
+        latitude (float): Degrees.
+        longitude (float): Degrees.
+        speed (float): km/h, clamped to 0..655.35.
+        timestamp_ms (int): Epoch milliseconds, 0 for server time.
+    Returns:
+        bytes: FRAME_SIZE bytes.
+    """
+    speed_units = min(max(int(round(speed * _SPEED_SCALE)), 0), _MAX_SPEED)
+    return LOCATION_FRAME.pack(
+        FRAME_VERSION,
+        token,
+        int(round(latitude * _COORD_SCALE)),
+        int(round(longitude * _COORD_SCALE)),
+        speed_units,
+        timestamp_ms,
+    )
+
+
+def decode_location(frame: bytes):
+    """
+    Decode a binary location frame straight into a tuple.
+    Args:
+        frame (bytes): Raw WebSocket binary payload.
+    Returns:
+        tuple: (token, latitude, longitude, speed, timestamp_ms)
+    Raises:
+        ValueError: Wrong size, unknown version or out-of-range coordinates.
+    """
+    if len(frame) != FRAME_SIZE:
+        raise ValueError(f"Expected {FRAME_SIZE}-byte frame, got {len(frame)}")
+    version, token, lat_e7, lon_e7, speed_units, timestamp_ms = LOCATION_FRAME.unpack(frame)
+    if version != FRAME_VERSION:
+        raise ValueError(f"Unsupported frame version {version}")
+    latitude = lat_e7 / _COORD_SCALE
+    longitude = lon_e7 / _COORD_SCALE
+    if not (-90.0 <= latitude <= 90.0 and -180.0 <= longitude <= 180.0):
+        raise ValueError("Coordinates out of range")
+    return token, latitude, longitude, speed_units / _SPEED_SCALE, timestamp_ms
@@ -0,0 +1,113 @@
+# Bounded thread pool for blocking SDK calls (firebase_admin, requests, SMTP) made from async routes
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app.utils.metrics import register_metrics
+
+MAX_WORKERS = int(os.getenv("BLOCKING_EXECUTOR_WORKERS", "16"))
+MAX_QUEUE = int(os.getenv("BLOCKING_EXECUTOR_QUEUE", "256"))
+
+
+class BlockingExecutor:
+    """
+    Runs blocking callables off the event loop on a dedicated thread pool.
+    At most max_workers + max_queue calls are admitted at once; further callers
+    wait (asynchronously) for a slot, so a slow Firebase backs up into awaiting
+    coroutines instead of an unbounded executor queue.
+    """
+
+    def __init__(self, max_workers: int = MAX_WORKERS, max_queue: int = MAX_QUEUE):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="blocking-io")
+        self._slots = asyncio.Semaphore(max_workers + max_queue)
+        self._lock = threading.Lock()
+        self.waiting = 0       # submitted, not yet running (slot wait + pool queue)
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.total_wait_ms = 0.0
+        self.max_wait_ms = 0.0
+        self.total_run_ms = 0.0
+
+    async def run(self, fn, *args, **kwargs):
+        """
+        Await fn(*args, **kwargs) executed on the pool.
+        Args:
+            fn (Callable): Blocking callable.
+        Returns:
+            Any: Whatever fn returns; exceptions are re-raised in the caller.
+        """
+        submitted = time.perf_counter()
+        state = {"started": False, "abandoned": False}
+        with self._lock:
+            self.waiting += 1
+
+        def call():
+            started = time.perf_counter()
+            wait_ms = (started - submitted) * 1000
+            with self._lock:
+                state["started"] = True
+                if not state["abandoned"]:
+                    self.waiting -= 1
+                self.running += 1
+                self.total_wait_ms += wait_ms
+                if wait_ms > self.max_wait_ms:
+                    self.max_wait_ms = wait_ms
+            ok = False
+            try:
+                result = fn(*args, **kwargs)
+                ok = True
+                return result
+            finally:
+                with self._lock:
+                    self.running -= 1
+                    self.completed += 1
+                    if not ok:
+                        self.failed += 1
+                    self.total_run_ms += (time.perf_counter() - started) * 1000
+
+        try:
+            async with self._slots:
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(self._executor, call)
+        except asyncio.CancelledError:
+            # Cancelled before the pool picked the call up: it will never run
+            with self._lock:
+                if not state["started"]:
+                    state["abandoned"] = True
+                    self.waiting -= 1
+            raise
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+    def stats(self) -> dict:
+        with self._lock:
+            done = self.completed or 1
+            return {
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "queue_depth": self.waiting,
+                "running": self.running,
+                "completed": self.completed,
+                "failed": self.failed,
+                "avg_wait_ms": round(self.total_wait_ms / done, 2),
+                "max_wait_ms": round(self.max_wait_ms, 2),
+                "avg_run_ms": round(self.total_run_ms / done, 2),
+                "saturation": round((self.waiting + self.running) / (self.max_workers + self.max_queue), 3),
+            }
+
+
+blocking_executor = BlockingExecutor()
+register_metrics("blocking_executor", blocking_executor.stats)
+
+
+async def run_blocking(fn, *args, **kwargs):
+    """
+    Shortcut for blocking_executor.run(); use for every firebase_admin call in an async route.
+    """
+    return await blocking_executor.run(fn, *args, **kwargs)
@@ -0,0 +1,94 @@
+# Geographic distance helpers shared by the location, ETA and route modules
+#
+# All functions take degrees and return km on a sphere of radius EARTH_RADIUS_KM.
+# Accuracy, for the city-scale distances used here (a few m to ~50 km):
+#   - The spherical model itself is within 0.5% of the WGS84 ellipsoid; that
+#     bounds every variant below and is far under GPS and routing error.
+#   - haversine_*: exact on the sphere, numerically stable down to centimetres.
+#   - equirectangular_*: flat-earth with cos(mean latitude) scaling. Relative
+#     error against haversine is below 0.001% up to 50 km at |lat| <= 60 deg
+#     (it grows with distance squared), i.e. under 0.5 m at 50 km and under a
+#     millimetre at 1 km. Cheaper than haversine (see
+#     benchmarks/bench_geo.py). Do not use across the antimeridian.
+import math
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEG = EARTH_RADIUS_KM * math.pi / 180    # km per degree of latitude (~111.195)
+
+
+def haversine_distance(lat1, lon1, lat2, lon2):
+    """
+    Great-circle distance in km between two points given in degrees.
+    """
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    dphi = math.radians(lat2 - lat1)
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi/2)**2 + math.cos(phi1)*math.cos(phi2)*math.sin(dlambda/2)**2
+    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
+    return EARTH_RADIUS_KM * c
+
+
+def equirectangular_distance(lat1, lon1, lat2, lon2):
+    """
+    Fast approximate distance in km; see the module header for its error bounds.
+    """
+    x = (lon2 - lon1) * math.cos(math.radians((lat1 + lat2) * 0.5))
+    y = lat2 - lat1
+    return KM_PER_DEG * math.sqrt(x * x + y * y)
+
+
+def haversine_to_point(lats, lons, lat, lon) -> np.ndarray:
+    """
+    Great-circle distances in km from each of many points to one point.
+    Args:
+        lats, lons (array-like): Coordinates of the points, in degrees.
+        lat, lon (float): The single point, in degrees.
+    Returns:
+        np.ndarray: float64 distances, same shape as lats.
+    """
+    phi = np.radians(np.asarray(lats, dtype=float))
+    lam = np.radians(np.asarray(lons, dtype=float))
+    phi0, lam0 = math.radians(lat), math.radians(lon)
+    a = np.sin((phi - phi0) * 0.5) ** 2 + np.cos(phi) * math.cos(phi0) * np.sin((lam - lam0) * 0.5) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def haversine_matrix(lats1, lons1, lats2, lons2) -> np.ndarray:
+    """
+    Great-circle distances in km between every point of one set and every point of another.
+    Returns:
+        np.ndarray: len(lats1) x len(lats2) float64. Memory is 8 bytes per pair,
+        so chunk the first set for very large products.
+    """
+    phi1 = np.radians(np.asarray(lats1, dtype=float))[:, None]
+    lam1 = np.radians(np.asarray(lons1, dtype=float))[:, None]
+    phi2 = np.radians(np.asarray(lats2, dtype=float))[None, :]
+    lam2 = np.radians(np.asarray(lons2, dtype=float))[None, :]
+    a = np.sin((phi2 - phi1) * 0.5) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin((lam2 - lam1) * 0.5) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def haversine_pairs(lats1, lons1, lats2, lons2) -> np.ndarray:
+    """
+    Great-circle distances in km between corresponding points of two equal-length arrays
+    (e.g. consecutive vertices of a polyline).
+    """
+    phi1 = np.radians(np.asarray(lats1, dtype=float))
+    phi2 = np.radians(np.asarray(lats2, dtype=float))
+    dlam = np.radians(np.asarray(lons2, dtype=float) - np.asarray(lons1, dtype=float))
+    a = np.sin((phi2 - phi1) * 0.5) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(dlam * 0.5) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def equirectangular_to_point(lats, lons, lat, lon) -> np.ndarray:
+    """
+    Approximate distances in km from each of many points to one point; see the module
+    header for its error bounds.
+    """
+    lats = np.asarray(lats, dtype=float)
+    x = (np.asarray(lons, dtype=float) - lon) * np.cos(np.radians((lats + lat) * 0.5))
+    y = lats - lat
+    return KM_PER_DEG * np.hypot(x, y)
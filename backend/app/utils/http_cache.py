@@ -0,0 +1,90 @@
+import json
+from typing import Callable, Optional
+
+from fastapi import Request, Response
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """
+    True if the request's If-None-Match already names this ETag (so a 304 can be sent).
+    Weak validators compare equal to their strong form, as RFC 9110 asks for If-None-Match.
+    """
+    header: Optional[str] = request.headers.get("if-none-match")
+    if not header:
+        return False
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+class VersionedSnapshotResponder:
+    """
+    Conditional JSON responses for a versioned snapshot store (e.g. LiveFleet):
+    a strong ETag per version, 304 when the client is current, the full body
+    encoded once per version and shared by every poller, and a ?since=<tag>
+    delta of only the entries that changed.
+    """
+
+    def __init__(self, store, format_item: Callable[[str, dict], dict]):
+        self.store = store
+        self.format_item = format_item
+        self._cached = (None, b"")   # (version, encoded body)
+        self.not_modified = 0
+        self.encoded = 0
+        self.reused = 0
+        self.deltas = 0
+
+    def _headers(self, version: int) -> dict:
+        return {
+            "ETag": f'"{self.store.tag(version)}"',
+            "X-Fleet-Version": str(version),
+            "Cache-Control": "no-cache",
+        }
+
+    def respond(self, request: Request, since: Optional[str] = None) -> Response:
+        """
+        Args:
+            request (Request): Incoming request (If-None-Match is read from it).
+            since (str, optional): Tag from a previous response's ETag; returns
+                {"version", "full", "items"} with only the entries changed after it.
+                An unknown tag (restart, other worker) yields full=True and everything.
+        """
+        current = self.store.version
+        if etag_matches(request, f'"{self.store.tag(current)}"'):
+            self.not_modified += 1
+            return Response(status_code=304, headers=self._headers(current))
+
+        if since is not None:
+            base = self.store.parse_tag(since)
+            version, changed = self.store.changed_since(base or 0)
+            self.deltas += 1
+            body = json.dumps({
+                "version": self.store.tag(version),
+                "full": base is None,
+                "items": [self.format_item(key, item) for key, item in changed],
+            }).encode()
+            return Response(content=body, media_type="application/json", headers=self._headers(version))
+
+        version, body = self._cached
+        if version != current:
+            version, items = self.store.snapshot()
+            body = json.dumps([self.format_item(key, item) for key, item in items]).encode()
+            self._cached = (version, body)
+            self.encoded += 1
+        else:
+            self.reused += 1
+        return Response(content=body, media_type="application/json", headers=self._headers(version))
+
+    def stats(self) -> dict:
+        return {
+            "not_modified": self.not_modified,
+            "encoded": self.encoded,
+            "reused": self.reused,
+            "deltas": self.deltas,
+        }
@@ -0,0 +1,29 @@
+from typing import Callable, Dict
+
+# name -> zero-arg callable returning a JSON-serializable dict of counters
+_providers: Dict[str, Callable[[], dict]] = {}
+
+
+def register_metrics(name: str, provider: Callable[[], dict]):
+    """
+    Register a metrics provider to be reported by GET /api/metrics.
+    Args:
+        name (str): Section name in the metrics payload.
+        provider (Callable): Returns a dict of counters/gauges when called.
+    """
+    _providers[name] = provider
+
+
+def collect_metrics() -> dict:
+    """
+    Collect a snapshot from every registered provider.
+    Returns:
+        dict: Section name -> provider output (or an error string).
+    """
+    snapshot = {}
+    for name, provider in list(_providers.items()):
+        try:
+            snapshot[name] = provider()
+        except Exception as e:
+            snapshot[name] = {"error": str(e)}
+    return snapshot
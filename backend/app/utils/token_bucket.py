@@ -0,0 +1,55 @@
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket for outbound calls: rate tokens per second, up to
+    burst banked. acquire() blocks the calling thread until a token is free.
+    """
+
+    def __init__(self, rate: float, burst: float = 1.0):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self.acquired = 0
+        self.timeouts = 0
+        self.total_wait_ms = 0.0
+        self.max_wait_ms = 0.0
+
+    def acquire(self, timeout: float = None) -> bool:
+        """
+        Take one token, waiting for it if necessary.
+        Args:
+            timeout (float, optional): Give up if the token would not be free within this many seconds.
+        Returns:
+            bool: False on timeout (no token taken).
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # Reserve the token now (possibly driving the balance negative) so waiters queue in order
+            wait = max(0.0, (1.0 - self._tokens) / self.rate)
+            if timeout is not None and wait > timeout:
+                self.timeouts += 1
+                return False
+            self._tokens -= 1.0
+            self.acquired += 1
+            self.total_wait_ms += wait * 1000
+            self.max_wait_ms = max(self.max_wait_ms, wait * 1000)
+        if wait > 0:
+            time.sleep(wait)
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "rate_per_s": self.rate,
+            "burst": self.burst,
+            "acquired": self.acquired,
+            "timeouts": self.timeouts,
+            "avg_wait_ms": round(self.total_wait_ms / self.acquired, 1) if self.acquired else 0.0,
+            "max_wait_ms": round(self.max_wait_ms, 1),
+        }
@@ -0,0 +1,91 @@
+"""
+Distance variants in app/utils/geo.py at the batch sizes the services use:
+one bus to a route's stops (~25), one bus to every stop (~5k), a radius
+query's candidates (~500), and a buses x stops block (256 x 5k). Also
+reports the worst equirectangular error against haversine.
+
+Run from backend/:
+    python benchmarks/bench_geo.py
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import numpy as np  # noqa: E402
+
+from app.utils.geo import (  # noqa: E402
+    equirectangular_distance,
+    equirectangular_to_point,
+    haversine_distance,
+    haversine_matrix,
+    haversine_to_point,
+)
+
+LAT_RANGE = (28.40, 28.88)   # Delhi NCR, ~50 km across
+LON_RANGE = (76.84, 77.35)
+BATCH_SIZES = (25, 500, 5_000)
+MATRIX_ROWS = 256
+MIN_SECONDS = 0.2
+
+
+def timed(fn) -> float:
+    """
+    Best-of-5 microseconds per call, each repetition running for at least MIN_SECONDS / 5.
+    """
+    calls, elapsed = 1, 0.0
+    while elapsed < MIN_SECONDS / 5:
+        start = time.perf_counter()
+        for _ in range(calls):
+            fn()
+        elapsed = time.perf_counter() - start
+        calls *= 2
+    calls //= 2
+    best = elapsed
+    for _ in range(4):
+        start = time.perf_counter()
+        for _ in range(calls):
+            fn()
+        best = min(best, time.perf_counter() - start)
+    return best / calls * 1e6
+
+
+def main():
+    rng = random.Random(7)
+    n = max(BATCH_SIZES)
+    lats = [rng.uniform(*LAT_RANGE) for _ in range(n)]
+    lons = [rng.uniform(*LON_RANGE) for _ in range(n)]
+    lat_arr, lon_arr = np.array(lats), np.array(lons)
+    lat0, lon0 = 28.63, 77.21
+
+    print(f"{'one point to N points':<28} {'N':>6} {'us/call':>10} {'ns/pair':>9}")
+    for size in BATCH_SIZES:
+        la, lo = lats[:size], lons[:size]
+        la_arr, lo_arr = lat_arr[:size], lon_arr[:size]
+        variants = [
+            ("haversine, math loop", lambda: [haversine_distance(lat0, lon0, a, b) for a, b in zip(la, lo)]),
+            ("equirectangular, math loop", lambda: [equirectangular_distance(lat0, lon0, a, b) for a, b in zip(la, lo)]),
+            ("haversine_to_point", lambda: haversine_to_point(la_arr, lo_arr, lat0, lon0)),
+            ("equirectangular_to_point", lambda: equirectangular_to_point(la_arr, lo_arr, lat0, lon0)),
+        ]
+        for name, fn in variants:
+            us = timed(fn)
+            print(f"{name:<28} {size:>6} {us:>10.1f} {us * 1000 / size:>9.1f}")
+
+    rows = slice(0, MATRIX_ROWS)
+    us = timed(lambda: haversine_matrix(lat_arr[rows], lon_arr[rows], lat_arr, lon_arr))
+    pairs = MATRIX_ROWS * n
+    print(f"{'haversine_matrix':<28} {f'{MATRIX_ROWS}x{n}':>6} {us:>10.0f} {us * 1000 / pairs:>9.1f}")
+
+    exact = haversine_to_point(lat_arr, lon_arr, lat0, lon0)
+    approx = equirectangular_to_point(lat_arr, lon_arr, lat0, lon0)
+    mask = exact > 0.01
+    relative = np.abs(approx - exact)[mask] / exact[mask]
+    print(f"equirectangular vs haversine up to {exact.max():.0f} km: "
+          f"worst {relative.max() * 100:.5f}%, {np.abs(approx - exact).max() * 1000:.2f} m")
+
+
+if __name__ == "__main__":
+    main()
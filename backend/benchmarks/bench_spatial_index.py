@@ -0,0 +1,68 @@
+"""
+Grid spatial index vs. a linear haversine scan for "buses near me" on a 10k-bus fleet.
+
+Run from backend/:
+    python benchmarks/bench_spatial_index.py
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.services.spatial_index import GridIndex  # noqa: E402
+from app.utils.geo import haversine_distance  # noqa: E402
+
+N_BUSES = 10_000
+N_QUERIES = 1_000
+K = 10
+RADIUS_KM = 1.0
+# Roughly the Delhi NCR extent
+LAT_RANGE = (28.40, 28.88)
+LON_RANGE = (76.84, 77.35)
+
+
+def linear_nearest(buses, lat, lon, k):
+    return sorted((haversine_distance(lat, lon, blat, blon), bus_id) for bus_id, blat, blon in buses)[:k]
+
+
+def linear_within(buses, lat, lon, radius_km):
+    found = []
+    for bus_id, blat, blon in buses:
+        d = haversine_distance(lat, lon, blat, blon)
+        if d <= radius_km:
+            found.append((d, bus_id))
+    found.sort()
+    return found
+
+
+def timed(fn, queries):
+    start = time.perf_counter()
+    results = [fn(lat, lon) for lat, lon in queries]
+    return (time.perf_counter() - start) / len(queries) * 1e6, results
+
+
+def main():
+    rng = random.Random(42)
+    buses = [(f"bus{i}", rng.uniform(*LAT_RANGE), rng.uniform(*LON_RANGE)) for i in range(N_BUSES)]
+    queries = [(rng.uniform(*LAT_RANGE), rng.uniform(*LON_RANGE)) for _ in range(N_QUERIES)]
+    index = GridIndex()
+    for bus_id, lat, lon in buses:
+        index.update(bus_id, lat, lon)
+
+    scan_q = queries[:100]  # the scan is slow; 100 queries are enough for a stable mean
+    print(f"{N_BUSES} buses, {index.stats()['cells']} occupied cells")
+    print(f"{'query':<22} {'index us':>10} {'scan us':>10} {'speedup':>8}")
+    for name, idx_fn, scan_fn in (
+        (f"k-nearest (k={K})", lambda a, b: index.nearest(a, b, K), lambda a, b: linear_nearest(buses, a, b, K)),
+        (f"within {RADIUS_KM} km", lambda a, b: index.within(a, b, RADIUS_KM), lambda a, b: linear_within(buses, a, b, RADIUS_KM)),
+    ):
+        idx_us, idx_res = timed(idx_fn, queries)
+        scan_us, scan_res = timed(scan_fn, scan_q)
+        assert [[b for _, b in r] for r in idx_res[:100]] == [[b for _, b in r] for r in scan_res], name
+        print(f"{name:<22} {idx_us:>10.1f} {scan_us:>10.1f} {scan_us / idx_us:>7.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+Compare the JSON and binary driver location frames: bytes per frame and decode cost.
+
+Run from backend/:
+    python benchmarks/bench_ws_frames.py
+"""
+import json
+import os
+import sys
+import timeit
+from datetime import datetime
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.services.ws_protocol import FRAME_SIZE, decode_location, encode_location  # noqa: E402
+
+N = 200_000
+
+json_frame = json.dumps({
+    "latitude": 28.6139391,
+    "longitude": 77.2090212,
+    "speed": 32.5,
+    "driver_id": "driver8f3a2c1b",
+    "timestamp": datetime(2025, 9, 8, 10, 15, 30, 123000).isoformat(),
+})
+binary_frame = encode_location(0, 28.6139391, 77.2090212, 32.5, 1757326530123)
+
+
+def decode_json():
+    # Mirrors the field checks in bus_location_ws for JSON frames
+    data = json.loads(json_frame)
+    lat = data.get('latitude')
+    lon = data.get('longitude')
+    speed = data.get('speed')
+    driver_id = data.get('driver_id')
+    timestamp = data.get('timestamp')
+    if lat is None or lon is None or speed is None or driver_id is None:
+        raise ValueError
+    return lat, lon, speed, driver_id, timestamp
+
+
+def decode_binary():
+    return decode_location(binary_frame)
+
+
+def main():
+    json_bytes = len(json_frame.encode())
+    print(f"{'format':<8} {'bytes/frame':>12} {'decode ns/frame':>16}")
+    for name, size, fn in (("json", json_bytes, decode_json), ("binary", FRAME_SIZE, decode_binary)):
+        best = min(timeit.repeat(fn, number=N, repeat=5))
+        print(f"{name:<8} {size:>12} {best / N * 1e9:>16.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+# Tests run without Firebase credentials: app.firebase is replaced by in-memory fakes
+import os
+import sys
+import types
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+
+class FakeSnapshot:
+    def __init__(self, doc_id, data):
+        self.id = doc_id
+        self._data = data
+        self.exists = data is not None
+
+    def to_dict(self):
+        return dict(self._data)
+
+
+class FakeDocument:
+    def __init__(self, collection, doc_id):
+        self.collection = collection
+        self.id = doc_id
+
+    def get(self):
+        self.collection.reads += 1
+        return FakeSnapshot(self.id, self.collection.docs.get(self.id))
+
+
+class FakeCollection:
+    def __init__(self):
+        self.docs = {}
+        self.reads = 0
+
+    def document(self, doc_id):
+        return FakeDocument(self, doc_id)
+
+    def where(self, field, op, value):
+        assert op == '=='
+        matches = FakeCollection()
+        matches.docs = {k: v for k, v in self.docs.items() if v.get(field) == value}
+        return matches
+
+    def stream(self):
+        return iter([FakeSnapshot(k, v) for k, v in self.docs.items()])
+
+
+class FakeFirestore:
+    def __init__(self):
+        self.collections = {}
+
+    def collection(self, name):
+        return self.collections.setdefault(name, FakeCollection())
+
+
+class FakeReference:
+    def child(self, *path):
+        return self
+
+    def get(self):
+        return {}
+
+    def update(self, data):
+        pass
+
+
+fake_firebase = types.ModuleType('app.firebase')
+fake_firebase.firestore_db = FakeFirestore()
+fake_firebase.realtime_db = FakeReference()
+fake_firebase.bucket = None
+sys.modules.setdefault('app.firebase', fake_firebase)
+
+
+@pytest.fixture
+def firestore():
+    return sys.modules['app.firebase'].firestore_db
@@ -0,0 +1,46 @@
+from app.routes.bus_location_update import BatchEtaRequest, calculate_eta, calculate_eta_batch
+from app.services.route_geometry import route_geometry
+
+OUT_AND_BACK = {
+    'route_name': 'ETA test',
+    'start_latitude': 28.60, 'start_longitude': 77.20,
+    'end_latitude': 28.60, 'end_longitude': 77.20,
+    'stops': [{'name': 'Turnaround', 'latitude': 28.70, 'longitude': 77.20}],
+    'speed_limit': 30,
+}
+
+
+def _route(firestore, route_id: str) -> str:
+    firestore.collection('routes').docs[route_id] = dict(OUT_AND_BACK)
+    route_geometry.set_route(route_id, OUT_AND_BACK)
+    return route_id
+
+
+def test_bus_eta_does_not_move_the_live_hint(firestore):
+    route_id = _route(firestore, 'eta-hint')
+    # Live ingest has the bus on the return leg
+    route_geometry.locate(route_id, None, 28.69, 77.20, 'eta-bus', remember=True)
+    hint = route_geometry._last_along[('eta-bus', route_id)]
+    result = calculate_eta(bus_lat=28.61, bus_lon=77.20, speed=30, route_id=route_id, stop_lat=None,
+                           stop_lon=None, stop_index=0, bus_id='eta-bus')
+    assert result['along_route'] is True
+    assert route_geometry._last_along[('eta-bus', route_id)] == hint
+
+
+def test_bus_eta_for_unknown_bus_is_not_tracked(firestore):
+    route_id = _route(firestore, 'eta-untracked')
+    calculate_eta(bus_lat=28.65, bus_lon=77.20, speed=30, route_id=route_id, stop_lat=None,
+                  stop_lon=None, stop_index=None, bus_id='made-up-bus')
+    assert ('made-up-bus', route_id) not in route_geometry._last_along
+
+
+def test_batch_eta_does_not_move_the_live_hint(firestore):
+    route_id = _route(firestore, 'eta-batch-hint')
+    route_geometry.locate(route_id, None, 28.69, 77.20, 'batch-bus', remember=True)
+    hint = route_geometry._last_along[('batch-bus', route_id)]
+    request = BatchEtaRequest(bus_id='batch-bus', bus_lat=28.61, bus_lon=77.20, speed=30,
+                              route_id=route_id, stop_indices=None, stops=None)
+    result = calculate_eta_batch(request)
+    assert result['along_route'] is True
+    assert [eta['stop_index'] for eta in result['etas']] == [0]
+    assert route_geometry._last_along[('batch-bus', route_id)] == hint
@@ -0,0 +1,49 @@
+import pytest
+
+from app.services import bus_info
+from app.services.live_fleet import live_fleet
+from app.services.route_geometry import route_geometry
+
+ROUTE = {
+    'route_name': 'SMS test',
+    'start_latitude': 28.60, 'start_longitude': 77.20,
+    'end_latitude': 28.70, 'end_longitude': 77.20,
+    'stops': [
+        {'name': 'First', 'latitude': 28.62, 'longitude': 77.20},
+        {'name': 'Second', 'latitude': 28.68, 'longitude': 77.20},
+    ],
+}
+
+
+@pytest.fixture
+def sms_bus(firestore, monkeypatch):
+    monkeypatch.setattr(bus_info.reverse_geocoder, 'address', lambda lat, lon: f"{lat},{lon}")
+    firestore.collection('routes').docs['sms-route'] = dict(ROUTE)
+    # Firestore still has the position from before the bus left the depot
+    firestore.collection('buses').docs['sms-bus'] = {
+        'number': 'DL-1', 'route': 'sms-route', 'speed': 20,
+        'currentLocation': {'latitude': 28.60, 'longitude': 77.20},
+    }
+    return 'sms-bus'
+
+
+def test_sms_info_uses_live_position(sms_bus):
+    live_fleet.update(sms_bus, {'latitude': 28.65, 'longitude': 77.20, 'speed': 30})
+    info = bus_info.get_eta_and_next_stop_for_bus('DL-1')
+    assert info['current_location'] == '28.65,77.2'
+    assert info['next_stop'] == 'Second'
+    # 3.3 km at 30 km/h, not 8.9 km from the stale Firestore position
+    assert info['eta'] == 6
+    assert (sms_bus, 'sms-route') not in route_geometry._last_along
+
+
+def test_sms_info_falls_back_to_firestore_position(firestore, monkeypatch):
+    monkeypatch.setattr(bus_info.reverse_geocoder, 'address', lambda lat, lon: f"{lat},{lon}")
+    firestore.collection('routes').docs['sms-route-2'] = dict(ROUTE)
+    firestore.collection('buses').docs['sms-bus-2'] = {
+        'number': 'DL-2', 'route': 'sms-route-2', 'speed': 20,
+        'currentLocation': {'latitude': 28.61, 'longitude': 77.20},
+    }
+    info = bus_info.get_eta_and_next_stop_for_bus('DL-2')
+    assert info['current_location'] == '28.61,77.2'
+    assert info['next_stop'] == 'First'
@@ -0,0 +1,32 @@
+from app.services.gps_archive import ArchiveReader, GpsArchive
+
+
+def _archive(tmp_path, batches):
+    archive = GpsArchive(root=str(tmp_path), enabled=True)
+    for batch in batches:
+        for bus_id, ts in batch:
+            archive.append(bus_id, ts, 28.6, 77.2, 20.0)
+        archive.flush()
+    return archive
+
+
+def test_out_of_order_batch_is_sorted(tmp_path):
+    _archive(tmp_path, [[('a', 103.0), ('b', 101.0), ('a', 102.0), ('b', 104.0)]])
+    reader = ArchiveReader(str(tmp_path))
+    assert [s['sorted'] for s in reader.segments()] == [True]
+    assert list(reader.scan(102.0, 104.0)['ts']) == [102.0, 103.0]
+
+
+def test_range_query_after_clock_steps_back(tmp_path):
+    # The second flush is older than the first one
+    archive = _archive(tmp_path, [[('a', 100.0), ('b', 110.0), ('a', 120.0)],
+                                  [('a', 90.0), ('b', 105.0), ('a', 130.0)]])
+    reader = ArchiveReader(str(tmp_path))
+    for sealed in (False, True):
+        [segment] = reader.segments()
+        assert segment['sorted'] is False and segment['sealed'] is sealed
+        assert (segment['start_ts'], segment['end_ts']) == (90.0, 130.0)
+        assert list(reader.scan(95.0, 115.0)['ts']) == [100.0, 105.0, 110.0]
+        assert list(reader.scan(None, 101.0, bus_id='a')['ts']) == [90.0, 100.0]
+        assert list(reader.scan(125.0, None)['bus']) == ['a']
+        archive.stop()
@@ -0,0 +1,17 @@
+import math
+
+from app.services.location_history import LocationHistory
+
+
+def test_idle_buses_are_evicted():
+    history = LocationHistory(capacity=8, idle_seconds=600)
+    history.append('retired', 1000.0, 28.6, 77.2, None)
+    history.append('active', 1000.0, 28.6, 77.2, 20.0)
+    for minute in range(1, 12):
+        history.append('active', 1000.0 + minute * 60, 28.6, 77.2, 20.0)
+    assert history.trajectory('retired') is None
+    assert history.stats()['buses'] == 1
+    assert history.stats()['evicted'] == 1
+    points = history.trajectory('active')
+    assert len(points) == 8
+    assert points[-1][0] == 1660.0 and not math.isnan(points[-1][3])
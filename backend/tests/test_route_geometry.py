@@ -0,0 +1,40 @@
+from app.services.route_geometry import RouteGeometry
+
+# Out and back on the same road: every point is on both legs
+OUT_AND_BACK = {
+    'start_latitude': 28.60, 'start_longitude': 77.20,
+    'end_latitude': 28.60, 'end_longitude': 77.20,
+    'stops': [{'name': 'Turnaround', 'latitude': 28.70, 'longitude': 77.20}],
+}
+
+
+def test_projection_and_downstream_stops():
+    geometry = RouteGeometry()
+    polyline, projection = geometry.locate('r', OUT_AND_BACK, 28.65, 77.20)
+    assert abs(polyline.length_km - 22.24) < 0.05
+    assert abs(projection.along_km - 5.56) < 0.05
+    assert projection.offset_km < 0.001
+    assert [index for index, _, _ in polyline.downstream_stops(projection.along_km)] == [0]
+    assert polyline.downstream_stops(polyline.length_km - 1) == []
+
+
+def test_queries_do_not_move_the_hint():
+    geometry = RouteGeometry()
+    geometry.set_route('r', OUT_AND_BACK)
+    geometry._last_along[('bus', 'r')] = 12.0   # live ingest has the bus on the return leg
+    # An ETA query with a stale or client-supplied outbound position
+    _, queried = geometry.locate('r', None, 28.61, 77.20, 'bus')
+    assert queried is not None
+    assert geometry._last_along[('bus', 'r')] == 12.0
+    _, live = geometry.locate('r', None, 28.68, 77.20, 'bus', remember=True)
+    assert live.along_km > 11.12
+
+
+def test_queries_for_unknown_buses_are_not_tracked():
+    geometry = RouteGeometry()
+    geometry.set_route('r', OUT_AND_BACK)
+    for i in range(50):
+        geometry.locate('r', None, 28.65, 77.20, f'client-{i}')
+    assert geometry.stats()['tracked_buses'] == 0
+    geometry.locate('r', None, 28.65, 77.20, 'bus', remember=True)
+    assert geometry.stats()['tracked_buses'] == 1
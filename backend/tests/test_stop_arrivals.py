@@ -0,0 +1,85 @@
+import asyncio
+import json
+import time
+
+from app.routes.stop_arrivals import get_stop_arrivals, stop_arrivals_sse
+from app.services import arrival_boards as boards_module
+from app.services.arrival_boards import arrival_boards, stop_id
+from app.services.route_geometry import route_geometry
+
+ROUTE = {
+    'route_name': 'Board test',
+    'start_latitude': 28.60, 'start_longitude': 77.20,
+    'end_latitude': 28.70, 'end_longitude': 77.20,
+    'stops': [
+        {'name': 'First', 'latitude': 28.62, 'longitude': 77.20},
+        {'name': 'Second', 'latitude': 28.68, 'longitude': 77.20},
+    ],
+}
+
+
+class FakeRequest:
+    def __init__(self, **headers):
+        self.headers = {name.replace('_', '-'): value for name, value in headers.items()}
+
+    async def is_disconnected(self):
+        return False
+
+
+def _route(route_id: str):
+    route_geometry.set_route(route_id, ROUTE)
+    return route_geometry.polyline(route_id)
+
+
+def test_stale_expiry_changes_the_etag(monkeypatch):
+    monkeypatch.setattr(boards_module, 'STALE_SECONDS', 0.2)
+    polyline = _route('board-stale')
+    sid = stop_id('board-stale', 1)
+    arrival_boards.update_bus('stale-bus', 'board-stale', polyline, 1.0, speed_kmh=30)
+    first = get_stop_arrivals(FakeRequest(), sid)
+    etag = first.headers['ETag']
+    assert get_stop_arrivals(FakeRequest(if_none_match=etag), sid).status_code == 304
+    time.sleep(0.25)
+    # The bus went stale: the board is re-encoded without it under a new ETag
+    expired = get_stop_arrivals(FakeRequest(if_none_match=etag), sid)
+    assert expired.status_code == 200
+    assert expired.headers['ETag'] != etag
+    assert arrival_boards.board(sid)[1] == []
+
+
+def _first_events(request, stop_ids, count):
+    async def read():
+        response = await stop_arrivals_sse(request, stop_ids=stop_ids, max_rate=10)
+        events = response.body_iterator
+        try:
+            assert (await events.__anext__()).startswith('retry:')
+            return [await events.__anext__() for _ in range(count)]
+        finally:
+            await events.aclose()
+    return asyncio.run(read())
+
+
+def _parse_event(event):
+    fields = dict(line.split(': ', 1) for line in event.strip().split('\n'))
+    return fields['id'], json.loads(fields['data'])
+
+
+def test_sse_ids_are_tagged_and_resume_from_last_event_id():
+    polyline = _route('board-sse')
+    first, second = stop_id('board-sse', 0), stop_id('board-sse', 1)
+    arrival_boards.update_bus('sse-bus', 'board-sse', polyline, 0.5, speed_kmh=30)
+    events = [_parse_event(e) for e in _first_events(FakeRequest(), f"{first},{second}", 2)]
+    assert sorted(board['stop_id'] for _, board in events) == [first, second]
+    for event_id, board in events:
+        assert event_id == board['version']
+        assert arrival_boards.parse_tag(event_id) is not None
+    last_id = events[-1][0]
+
+    # Another bus joins past the first stop: only the second board changes
+    arrival_boards.update_bus('sse-other', 'board-sse', polyline, 5.0, speed_kmh=30)
+    resumed = _parse_event(_first_events(FakeRequest(last_event_id=last_id), f"{first},{second}", 1)[0])
+    assert resumed[1]['stop_id'] == second
+    assert [a['bus_id'] for a in resumed[1]['arrivals']] == ['sse-other', 'sse-bus']
+    assert arrival_boards.changed_since(arrival_boards.parse_tag(resumed[0]), [first, second]) == []
+    # An id from another worker or before a restart resends every board
+    assert arrival_boards.parse_tag('0000-1') is None
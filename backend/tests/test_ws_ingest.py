@@ -0,0 +1,118 @@
+import asyncio
+import json
+import time
+from datetime import datetime
+
+from app.routes.bus_location_ws import PING_FRAME, PING_INTERVAL, _Subscriber, _handle_location, _handle_text, manager
+from app.routes.viewport_ws import _Viewport, hub
+from app.services.arrival_boards import arrival_boards, stop_id
+from app.services.bus_assignments import get_cached_assignment, invalidate_assignment
+from app.services.route_geometry import route_geometry
+from app.services.stop_tracker import stop_tracker
+from app.services.ws_protocol import MAX_TOKEN
+
+ROUTE = {
+    'route_name': 'WS test',
+    'start_latitude': 28.600, 'start_longitude': 77.200,
+    'end_latitude': 28.640, 'end_longitude': 77.200,
+    'stops': [
+        {'name': 'First', 'latitude': 28.610, 'longitude': 77.200},
+        {'name': 'Second', 'latitude': 28.630, 'longitude': 77.200},
+    ],
+}
+
+
+def _assign(firestore, bus_id: str):
+    buses = firestore.collection('buses')
+    buses.docs[bus_id] = {'driverId': 'd1', 'routeIds': ['ws-route']}
+    invalidate_assignment(bus_id)
+    route_geometry.set_route('ws-route', ROUTE)
+    return buses
+
+
+def test_ws_location_fills_assignment_and_tracks_route(firestore):
+    buses = _assign(firestore, 'ws-bus')
+
+    async def ingest():
+        # Between the two stops, then a little further on
+        await _handle_location('ws-bus', 28.620, 77.200, 30, 'd1', datetime.utcnow().isoformat())
+        await _handle_location('ws-bus', 28.621, 77.200, 30, 'd1', datetime.utcnow().isoformat())
+
+    asyncio.run(ingest())
+
+    assert get_cached_assignment('ws-bus') == {'driver_id': 'd1', 'route_ids': ['ws-route']}
+    assert buses.reads == 1   # the second location is served from the cache
+    progress = stop_tracker.progress('ws-bus', 'ws-route')
+    assert progress['current_stop']['name'] == 'First'
+    assert progress['next_stop']['name'] == 'Second'
+    _, arrivals = arrival_boards.board(stop_id('ws-route', 1))
+    assert [a['bus_id'] for a in arrivals] == ['ws-bus']
+    _, passed = arrival_boards.board(stop_id('ws-route', 0))
+    assert passed == []
+
+
+class _Socket:
+    def __init__(self):
+        self.sent = []
+
+    async def send_text(self, text):
+        self.sent.append(text)
+
+
+def test_route_viewport_receives_ws_locations(firestore):
+    _assign(firestore, 'ws-viewport-bus')
+
+    async def run():
+        viewport = _Viewport(hub, _Socket())
+        try:
+            hub.subscribe(viewport, None, ['ws-route'])
+            await _handle_location('ws-viewport-bus', 28.620, 77.200, 30, 'd1', datetime.utcnow().isoformat())
+            return dict(viewport.pending)
+        finally:
+            hub.unsubscribe(viewport)
+            viewport.task.cancel()
+
+    pending = asyncio.run(run())
+    assert pending['ws-viewport-bus']['route_id'] == 'ws-route'
+
+
+def test_hello_tokens_stay_within_uint16(monkeypatch):
+    acks = []
+    monkeypatch.setattr(manager, 'send_personal', lambda bus_id, websocket, data: acks.append(data['token']))
+    driver_tokens = [f"driver-{n}" for n in range(MAX_TOKEN)]
+
+    async def hello(driver_id):
+        await _handle_text('hello-bus', json.dumps({'type': 'hello', 'driver_id': driver_id}), None, driver_tokens)
+
+    asyncio.run(hello('last-driver'))
+    asyncio.run(hello('one-too-many'))
+    asyncio.run(hello('driver-7'))
+    assert acks == [MAX_TOKEN, 7]
+    assert len(driver_tokens) == MAX_TOKEN + 1
+
+
+def test_sweeper_only_pings_quiet_sockets():
+    async def sweep():
+        subscribers = {}
+        now = time.monotonic()
+        for name, last_seen, sent_at, responsive in (
+            ('talking', now, 0.0, False),                     # sent a frame just now
+            ('listening', now - PING_INTERVAL, now, False),   # silent, but broadcasts reach it
+            ('quiet', now - PING_INTERVAL, 0.0, False),
+            ('answers-pings', now - PING_INTERVAL, now, True),
+        ):
+            subscriber = _Subscriber(manager, 'sweep-bus', name)
+            subscriber.last_seen, subscriber.sent_at, subscriber.responsive = last_seen, sent_at, responsive
+            subscribers[name] = subscriber
+        manager.active_connections['sweep-bus'] = subscribers
+        try:
+            result = manager.sweep()
+            return result, {name: list(s.queue) for name, s in subscribers.items()}
+        finally:
+            del manager.active_connections['sweep-bus']
+            for subscriber in subscribers.values():
+                subscriber.task.cancel()
+
+    result, queued = asyncio.run(sweep())
+    assert queued == {'talking': [], 'listening': [], 'quiet': [PING_FRAME], 'answers-pings': [PING_FRAME]}
+    assert (result['pinged'], result['ping_skipped']) == (2, 1)
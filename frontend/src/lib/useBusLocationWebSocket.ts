@@ -28,6 +28,11 @@ export function useBusLocationWebSocket(
     wsRef.current.onmessage = (event) => {
       try {
         const data = JSON.parse(event.data);
+        if (data.type === 'ping') {
+          // Server heartbeat: answering keeps this socket from being reaped as idle
+          wsRef.current?.send(JSON.stringify({ type: 'pong' }));
+          return;
+        }
         if (typeof data.latitude === 'number' && typeof data.longitude === 'number') {
           setLocation({
             latitude: data.latitude,